@@ -0,0 +1,1121 @@
+"""Offline benchmarks for the flashcard pipeline.
+
+Run a single suite with `python benchmark.py <suite>`, e.g. `python benchmark.py db`.
+Every suite works against temporary files and never touches flashcards.db.
+"""
+import argparse
+import contextlib
+import io
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+import database
+from fakes import RECORDED_OUTPUTS
+
+
+def _report(label, ops, seconds):
+    print(f"{label:<40} {ops / seconds:>12,.0f} ops/sec  ({seconds:.3f}s)")
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+# Connect-per-call baseline mirroring the original database.py behaviour
+def _legacy_save(path, user_id, question, answer):
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        INSERT INTO flashcards (user_id, question, answer, interval, ease, next_review)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (user_id, question, answer, 1, 2.5, str(date.today() + timedelta(days=1))))
+    conn.commit()
+    conn.close()
+
+
+def _legacy_login(path, username, password):
+    conn = sqlite3.connect(path)
+    user = conn.execute("SELECT id FROM users WHERE username = ? AND password_hash = ?",
+                        (username, database.hash_password(password))).fetchone()
+    conn.close()
+    return user
+
+
+def bench_db(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "legacy.db")
+        pooled_path = os.path.join(tmp, "pooled.db")
+
+        for path in (legacy_path, pooled_path):
+            database.configure_database(path)
+            database.initialize_db()
+            database.register_user("bench", "bench")
+        # The baseline file goes back to the default rollback journal
+        conn = sqlite3.connect(legacy_path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+
+        n = args.ops
+        threads = args.threads
+
+        def run_threads(fn):
+            workers = [threading.Thread(target=fn, args=(t,)) for t in range(threads)]
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+
+        def legacy_writes(t):
+            for i in range(n):
+                _legacy_save(legacy_path, 1, f"q{t}-{i}", "a")
+
+        def pooled_writes(t):
+            for i in range(n):
+                database.save_flashcard(1, f"q{t}-{i}", "a")
+
+        def legacy_reads(t):
+            for _ in range(n):
+                _legacy_login(legacy_path, "bench", "bench")
+
+        def pooled_reads(t):
+            for _ in range(n):
+                database.authenticate_user("bench", "bench")
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            legacy_w = _timed(lambda: run_threads(legacy_writes))
+            pooled_w = _timed(lambda: run_threads(pooled_writes))
+        legacy_r = _timed(lambda: run_threads(legacy_reads))
+        pooled_r = _timed(lambda: run_threads(pooled_reads))
+
+        total = n * threads
+        print(f"{threads} threads x {n} ops")
+        _report("insert, connect-per-call", total, legacy_w)
+        _report("insert, pooled WAL", total, pooled_w)
+        _report("login, connect-per-call", total, legacy_r)
+        _report("login, pooled WAL", total, pooled_r)
+        database.configure_database()
+
+
+# Calls whose flashcards queries must be served from an index rather than a
+# table scan; the SQL is captured as database.py runs it (see
+# tests/test_query_plans.py for the same check as a test)
+INDEXED_QUERIES = {
+    "due cards": lambda user_id, ids: database.get_due_flashcards(user_id),
+    "review by quality": lambda user_id, ids: database.update_flashcard_review(ids[0], 4),
+    "record reviews": lambda user_id, ids: database.record_reviews(
+        user_id, [(ids[0], 1, 2.5, "2024-01-01")], [(user_id, ids[0], date.today().toordinal(), 2, 1, 1, 2.5)]),
+}
+
+
+def _captured_sql(fn):
+    """Run `fn` on a one-connection pool and return the flashcards queries it sent."""
+    statements = []
+    with database.get_connection() as conn:
+        conn.set_trace_callback(statements.append)
+    try:
+        fn()
+    finally:
+        with database.get_connection() as conn:
+            conn.set_trace_callback(None)
+    # Trigger steps are traced as their top-level statement again
+    return [sql for sql in dict.fromkeys(statements)
+            if sql.split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE") and "flashcards" in sql]
+
+
+def bench_plans(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure_database(os.path.join(tmp, "plans.db"), pool_size=1)
+        database.initialize_db()
+        database.register_user("bench", "bench")
+        user_id = database.get_user_id("bench")
+        ids, _ = database.save_flashcards(user_id, [{"question": f"q{i}", "answer": "a"} for i in range(args.ops)],
+                                          on_duplicate=None)
+        failed = False
+        with database.get_connection() as conn:
+            conn.execute("ANALYZE")
+        for name, run in INDEXED_QUERIES.items():
+            for sql in _captured_sql(lambda: run(user_id, ids)):
+                with database.get_connection() as conn:
+                    plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+                scans = [step for step in plan if step.startswith("SCAN flashcards")]
+                failed = failed or bool(scans)
+                print(f"{name:<20} {'FULL SCAN' if scans else 'ok':<10} {' | '.join(plan)}")
+        database.configure_database()
+    if failed:
+        raise SystemExit(1)
+
+
+def bench_reviews(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure_database(os.path.join(tmp, "reviews.db"))
+        database.initialize_db()
+        database.register_user("bench", "bench")
+        user_id = database.authenticate_user("bench", "bench")
+        cards = [{"question": f"q{i}", "answer": "a"} for i in range(args.ops)]
+        ids, _ = database.save_flashcards(user_id, cards)
+        cards = database.get_flashcards(user_id)
+
+        def per_review():
+            for card_id in ids:
+                database.update_flashcard_review(card_id, 4)
+
+        def buffered():
+            buffer = database.ReviewBuffer(user_id)
+            for card in cards:
+                buffer.review(card, "good")
+            buffer.flush()
+
+        _report("update_flashcard_review per review", len(cards), _timed(per_review))
+        _report("ReviewBuffer (batches of 20)", len(cards), _timed(buffered))
+        database.configure_database()
+
+
+def _make_pdf(pages, lines_per_page=40):
+    """Build a text-heavy PDF in memory with `pages` pages."""
+    from reportlab.pdfgen import canvas
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer)
+    for page in range(pages):
+        y = 800
+        for line in range(lines_per_page):
+            p.drawString(50, y, f"Page {page} line {line}: spaced repetition schedules reviews "
+                                f"of material at growing intervals to strengthen recall.")
+            y -= 18
+        p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+def bench_pdf_cache(args):
+    import extraction
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure_database(os.path.join(tmp, "cache.db"))
+        database.initialize_db()
+        data = _make_pdf(args.pages)
+        cold = _timed(lambda: extraction.extract_text(data))
+        warm = _timed(lambda: extraction.extract_text(data))
+        print(f"{args.pages}-page PDF")
+        print(f"{'cold extraction (parse + store)':<40} {cold * 1000:>10.1f} ms")
+        print(f"{'warm extraction (cache hit)':<40} {warm * 1000:>10.1f} ms")
+        database.configure_database()
+
+
+def bench_pdf_parallel(args):
+    import extraction
+    data = _make_pdf(args.pages)
+    serial_pages = []
+    serial = _timed(lambda: serial_pages.extend(extraction._parse_pages(data, workers=1)))
+    print(f"{args.pages}-page PDF, {extraction.EXTRACT_WORKERS} CPUs")
+    print(f"{'serial':<40} {serial:>10.2f} s")
+    for workers in sorted({2, 4, extraction.EXTRACT_WORKERS} - {1}):
+        pages = []
+        elapsed = _timed(lambda: pages.extend(extraction._parse_pages(data, workers=workers)))
+        assert pages == serial_pages, "parallel extraction changed the page text"
+        print(f"{f'{workers} workers':<40} {elapsed:>10.2f} s  ({serial / elapsed:.1f}x)")
+
+
+def bench_pdf_lazy(args):
+    import tracemalloc
+    import extraction
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure_database(os.path.join(tmp, "lazy.db"))
+        database.initialize_db()
+        for pages in (args.pages // 4, args.pages // 2, args.pages):
+            data = _make_pdf(pages)
+            # Lazy first: the head read caches only its leading pages, which
+            # the repeat reuses and the full parse below does not
+            for label, fn in (("extract_head(3000)", lambda: extraction.extract_head(data, 3000)),
+                              ("extract_head(3000), again", lambda: extraction.extract_head(data, 3000)),
+                              ("extract_text (full)", lambda: extraction.extract_text(data, workers=1))):
+                tracemalloc.start()
+                elapsed = _timed(fn)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print(f"{pages:>5} pages  {label:<26} {elapsed:>8.2f} s  peak {peak / 2**20:>8.1f} MiB")
+        database.configure_database()
+
+
+def _synthetic_text(words, seed=0):
+    import random
+    rng = random.Random(seed)
+    vocab = [f"term{i}" for i in range(5000)] + ["retention", "memory", "interval", "recall"]
+    return " ".join(rng.choice(vocab) for _ in range(words))
+
+
+def bench_passages(args):
+    import passages
+    text = _synthetic_text(args.ops * 100)
+    build = _timed(lambda: passages.get_index("bench", text))
+    index = passages.get_index("bench", text)
+    queries = 100
+    query = _timed(lambda: [index.select("memory retention interval", 750) for _ in range(queries)])
+    print(f"{len(index.passages):,} passages, {len(index.vocab):,} terms")
+    print(f"{'index build (first generation)':<40} {build * 1000:>10.1f} ms")
+    print(f"{'cached query + selection':<40} {query / queries * 1000:>10.2f} ms")
+
+
+def bench_map_reduce(args):
+    import fakes
+    import generation
+    text = _synthetic_text(args.pages * 400)
+    sections = len(generation.split_sections(text))
+    print(f"{sections} sections, fake model latency {args.latency}s")
+    for workers in (1, 4, 8, 16):
+        model = fakes.FakeModel(latency=args.latency)
+        cards = []
+        elapsed = _timed(lambda: cards.extend(
+            generation.generate_deck(model, text, "", "Q&A", "Medium", max_workers=workers)[0]))
+        print(f"{f'{workers} concurrent requests':<40} {elapsed:>8.2f} s  {len(cards)} cards")
+
+
+def bench_llm_cache(args):
+    import cache
+    import fakes
+    import generation
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure_database(os.path.join(tmp, "llm.db"))
+        database.initialize_db()
+        fake = fakes.FakeModel(latency=args.latency)
+        model = cache.CachedModel(fake)
+        # A class of students generating from the same handout
+        prompts = [generation.build_prompt(f"handout {i % 5}", "", "Q&A", "Easy") for i in range(args.threads * 10)]
+        elapsed = _timed(lambda: [model.generate_content(p) for p in prompts])
+        print(f"{len(prompts)} requests, {len(set(prompts))} distinct prompts, model latency {args.latency}s")
+        print(f"{'with response cache':<40} {elapsed:>8.2f} s  (uncached: {len(prompts) * args.latency:.2f} s)")
+        print(f"hits={cache.CachedModel.stats['hits']} misses={cache.CachedModel.stats['misses']} model calls={fake.calls}")
+        database.configure_database()
+
+
+def bench_wiki(args):
+    import fakes
+    import wiki
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure_database(os.path.join(tmp, "wiki.db"))
+        database.initialize_db()
+        stub = fakes.FakeWikipedia({"Spaced repetition": "Spaced repetition is a learning technique."},
+                                   ambiguous={"Mercury"}, latency=args.latency)
+        wiki.backend = stub
+        topics = ["Spaced repetition", "Mercury", "No such article"] * args.threads
+        elapsed = _timed(lambda: [wiki.fetch_wikipedia(t) for t in topics])
+        print(f"{len(topics)} lookups of 3 topics (1 hit, 1 disambiguation, 1 missing), latency {args.latency}s")
+        print(f"{'cached lookups':<40} {elapsed:>8.2f} s  backend calls={stub.calls}")
+
+        wiki._memory.clear()
+        database.configure_database(os.path.join(tmp, "wiki2.db"))
+        database.initialize_db()
+        parse = args.latency
+        serial = _timed(lambda: (time.sleep(parse), wiki.fetch_wikipedia("Spaced repetition")))
+        wiki._memory.clear()
+        database.configure_database(os.path.join(tmp, "wiki3.db"))
+        database.initialize_db()
+
+        def overlapped():
+            future = wiki.prefetch_wikipedia("Spaced repetition")
+            time.sleep(parse)  # stands in for PDF extraction
+            future.result()
+        print(f"{'extract then fetch':<40} {serial:>8.2f} s")
+        print(f"{'prefetch overlapped with extract':<40} {_timed(overlapped):>8.2f} s")
+        wiki.backend = None
+        database.configure_database()
+
+
+# The regex parser that shipped before flashcard_parser, kept for timing comparisons
+def _legacy_parse(text):
+    import re
+    text = re.sub(r"\*\*+", "", text)
+    text = re.sub(r"#+", "", text).strip()
+    cards = []
+    mcq_pattern = re.compile(
+        r"Q: (.*?)\nOptions:\s*a\) (.*?)\n\s*b\) (.*?)\n\s*c\) (.*?)\n\s*d\) (.*?)\nAnswer: ([a-dA-D])",
+        re.DOTALL
+    )
+    for match in mcq_pattern.finditer(text):
+        options = [match.group(i).strip() for i in range(2, 6)]
+        cards.append({"question": match.group(1).strip(), "options": options,
+                      "answer": options["abcd".index(match.group(6).lower())]})
+    if not cards:
+        qa_pairs = re.findall(r"(?:Q(?:uestion)?:|Q:)\s*(.*?)\s*(?:A(?:nswer)?:|A:)\s*(.*?)(?=\n(?:Q(?:uestion)?:|Q:)|\Z)",
+                              text, re.DOTALL)
+        cards = [{"question": q.strip(), "answer": a.strip()} for q, a in qa_pairs]
+    return cards
+
+
+def _stream_parse(text, chunk_size):
+    from flashcard_parser import IncrementalParser
+    parser = IncrementalParser()
+    cards = []
+    for start in range(0, len(text), chunk_size):
+        cards.extend(parser.feed(text[start:start + chunk_size]))
+    return cards + parser.close()
+
+
+def bench_parser(args):
+    # Streamed and whole-response parsing are checked against each other in
+    # tests/test_parser.py
+    import fakes
+    import generation
+    model = fakes.FakeModel(latency=args.latency * 6)
+    prompt = generation.build_prompt("text", "", "Q&A", "Medium")
+    start = time.perf_counter()
+    first = next(generation.stream_cards(model, prompt))
+    first_card = time.perf_counter() - start
+    full = _timed(lambda: generation.generate_cards(model, prompt))
+    print(f"{'time to first card, streaming':<40} {first_card:>8.2f} s")
+    print(f"{'time to first card, batch':<40} {full:>8.2f} s")
+    if not first:
+        raise SystemExit(1)
+
+
+def _fuzz_corpus(count, seed=0):
+    """Recorded outputs with random lines duplicated, dropped, truncated or
+    spliced together, to shake out crashes on malformed responses."""
+    import random
+    rng = random.Random(seed)
+    lines = [line for text in RECORDED_OUTPUTS for line in text.split("\n")]
+    markers = ["Q:", "A:", "Answer:", "Options:", "a)", "b)", "c)", "d)", "**", "##", "Question:"]
+    for _ in range(count):
+        picked = [rng.choice(lines) for _ in range(rng.randint(1, 40))]
+        for i in range(len(picked)):
+            roll = rng.random()
+            if roll < 0.1:
+                picked[i] = picked[i][:rng.randint(0, len(picked[i]))]
+            elif roll < 0.2:
+                picked[i] = rng.choice(markers) + " " + picked[i]
+        yield ("\n" if rng.random() < 0.8 else " ").join(picked)
+
+
+def bench_parser_scaling(args):
+    from flashcard_parser import parse_flashcards
+    fuzz = list(_fuzz_corpus(args.ops))
+    for text in fuzz:
+        parse_flashcards(text)
+        _stream_parse(text, 13)
+    print(f"{len(fuzz)} fuzzed outputs parsed without errors")
+
+    well_formed = "\n\n".join(RECORDED_OUTPUTS[:3])
+    pathological = {
+        # Huge but well-formed full-document responses
+        "10k well-formed cards": well_formed * 3000,
+        # Questions that never get an answer: the lazy DOTALL scan restarts at every Q:
+        "unanswered questions": "Q: what is this " * 20000,
+        # One enormous line with markers but no newlines
+        "single 1 MB line": ("Q: x A: y " * 100000)[:1000000],
+        "options without answers": "Q: pick one\nOptions:\na) 1\nb) 2\nc) 3\n" * 20000,
+    }
+    print(f"{'input':<28} {'size':>10} {'legacy regex':>14} {'line parser':>14}")
+    for label, text in pathological.items():
+        if args.legacy:
+            # The old parser is quadratic on some of these; keep it finishing
+            text = text[:3000]
+        legacy = f"{_timed(lambda: _legacy_parse(text)):>13.3f}s" if args.legacy else f"{'-':>14}"
+        current = _timed(lambda: parse_flashcards(text))
+        print(f"{label:<28} {len(text):>10,} {legacy} {current:>13.3f}s")
+
+
+def bench_export(args):
+    import tracemalloc
+    import export
+    deck = [{"question": f"Question {i}: " + "why does spaced repetition work so well " * (i % 5 + 1),
+             "answer": f"Answer {i}: " + "because retrieval strengthens memory " * (i % 7 + 1)}
+            for i in range(args.ops * 20)]
+    cold = _timed(lambda: export.get_flashcards_pdf(deck))
+    with tempfile.TemporaryDirectory() as tmp:
+        # Separate pass: tracemalloc slows rendering down several times
+        tracemalloc.start()
+        export.write_flashcards_pdf(deck, os.path.join(tmp, "traced.pdf"))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    warm = _timed(lambda: export.get_flashcards_pdf(deck))
+    rerun = _timed(lambda: export.deck_version(deck))
+    size = os.path.getsize(export.get_flashcards_pdf(deck))
+    print(f"{len(deck):,} cards, {size / 2**20:.1f} MiB PDF")
+    print(f"{'first export (build to temp file)':<40} {cold:>8.2f} s  peak {peak / 2**20:.0f} MiB")
+    print(f"{'repeat export (cached)':<40} {warm * 1000:>8.1f} ms")
+    print(f"{'rerun cost (deck version hash)':<40} {rerun * 1000:>8.1f} ms")
+
+
+def _legacy_update_review(card, feedback, today):
+    if feedback == "again":
+        card['interval'] = 1
+        card['ease'] = max(1.3, card['ease'] - 0.2)
+    elif feedback == "hard":
+        card['interval'] = int(card['interval'] * 1.2)
+        card['ease'] = max(1.3, card['ease'] - 0.05)
+    elif feedback == "easy":
+        card['interval'] = int(card['interval'] * card['ease'])
+        card['ease'] = min(2.5, card['ease'] + 0.1)
+    card['next_review'] = str(today + timedelta(days=card['interval']))
+    return card
+
+
+def bench_scheduling(args):
+    import numpy as np
+    import scheduling
+    n = args.ops * 200
+    rng = np.random.default_rng(0)
+    today = date.today()
+    interval = rng.integers(1, 120, n)
+    ease = rng.uniform(1.3, 2.5, n)
+    due = today.toordinal() + rng.integers(-30, 90, n)
+    grades = rng.choice([scheduling.AGAIN, scheduling.HARD, scheduling.EASY], n)
+    names = {scheduling.AGAIN: "again", scheduling.HARD: "hard", scheduling.EASY: "easy"}
+
+    cards = [{"interval": int(i), "ease": float(e)} for i, e in zip(interval, ease)]
+    loop = _timed(lambda: [_legacy_update_review(c, names[g], today) for c, g in zip(cards, grades)])
+    deck = scheduling.DeckSchedule(np.arange(n), interval, ease, due)
+    batch = _timed(lambda: deck.grade(np.arange(n), grades, today))
+    assert [c["interval"] for c in cards] == deck.interval.tolist(), "engine disagrees with update_review"
+
+    core = _timed(lambda: scheduling.grade(interval, ease, grades))
+    deck = scheduling.DeckSchedule(np.arange(n), interval, ease, due)
+    order = _timed(lambda: deck.due_order(today))
+    forecast = _timed(lambda: deck.forecast(30, today))
+    print(f"{n:,} cards")
+    print(f"{'grade, per-card Python loop':<40} {loop * 1000:>10.1f} ms")
+    print(f"{'grade, vectorised arrays only':<40} {core * 1000:>10.1f} ms")
+    print(f"{'grade, vectorised + update tuples':<40} {batch * 1000:>10.1f} ms")
+    print(f"{'due queue ordered by urgency':<40} {order * 1000:>10.1f} ms")
+    print(f"{'30-day forecast':<40} {forecast * 1000:>10.1f} ms")
+
+
+def bench_deck_memory(args):
+    import tracemalloc
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure_database(os.path.join(tmp, "deck.db"))
+        database.initialize_db()
+        n = args.ops * 100
+        database.save_flashcards(1, [{"question": f"What is concept number {i}?",
+                                      "answer": f"Concept {i} is explained in chapter {i % 40}."}
+                                     for i in range(n)], on_duplicate=None)
+
+        def as_dicts():
+            return [{"id": c.id, "question": c.question, "answer": c.answer, "interval": c.interval,
+                     "ease": c.ease, "next_review": c.next_review} for c in database.get_flashcards(1)]
+
+        def walk_pager():
+            pager = database.DeckPager(1)
+            for i in range(len(pager)):
+                pager[i]
+            return pager
+
+        print(f"{n:,} cards")
+        for label, load in (("list of dicts (before)", as_dicts),
+                            ("list of slotted Cards", lambda: database.get_flashcards(1)),
+                            ("DeckPager after Next through all", walk_pager)):
+            tracemalloc.start()
+            start = time.perf_counter()
+            deck = load()
+            elapsed = time.perf_counter() - start
+            held = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            print(f"{label:<40} {held / 2**20:>8.2f} MiB held  {elapsed:.2f} s")
+            del deck
+        database.configure_database()
+
+
+# Everything app.py imports before it can draw the login screen
+APP_IMPORTS = ["streamlit", "extraction", "passages", "cache", "wiki", "generation",
+               "flashcard_parser", "export", "scheduling", "database"]
+# What it used to import eagerly on top of that
+EAGER_IMPORTS = ["google.generativeai", "pdfplumber", "reportlab.pdfgen.canvas", "wikipedia"]
+HEAVY_PACKAGES = ("streamlit", "numpy", "google.generativeai", "pdfplumber", "reportlab", "wikipedia")
+
+
+def _import_time(modules):
+    """Cold-import `modules` in a fresh interpreter; returns total seconds and
+    the cumulative microseconds of each heavy package from -X importtime."""
+    code = "import " + ", ".join(modules)
+    here = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=here,
+                            capture_output=True, text=True, check=True)
+    total = time.perf_counter() - start
+    packages = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        top_level = parts[2].startswith(" ") and not parts[2].startswith("  ")
+        for package in HEAVY_PACKAGES:
+            if name == package or (top_level and name.startswith(package + ".")):
+                packages[package] = packages.get(package, 0) + int(parts[1])
+    return total, packages
+
+
+def bench_startup(args):
+    from streamlit.testing.v1 import AppTest
+    runs = [("lazy imports (current)", APP_IMPORTS)]
+    if args.legacy:
+        runs.append(("eager imports (old app.py)", APP_IMPORTS + EAGER_IMPORTS))
+    for label, modules in runs:
+        total, packages = _import_time(modules)
+        print(f"{label:<40} {total * 1000:>8.0f} ms")
+        for name in HEAVY_PACKAGES:
+            if name in packages:
+                print(f"  {name:<38} {packages[name] / 1000:>8.0f} ms")
+
+    app = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    reruns = min(args.ops, 50)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            database.configure_database(os.path.join(tmp, "flashcards.db"))
+            at = AppTest.from_file(app, default_timeout=60)
+            first = _timed(at.run)
+            rerun = _timed(lambda: [at.run() for _ in range(reruns)]) / reruns
+            # The per-rerun work app.py now does once per process
+            schema = _timed(lambda: [database.initialize_db() for _ in range(reruns)]) / reruns
+        finally:
+            os.chdir(cwd)
+            database.configure_database()
+    print(f"{'first script run (login screen)':<40} {first * 1000:>8.1f} ms")
+    print(f"{'rerun (login screen)':<40} {rerun * 1000:>8.1f} ms")
+    print(f"{'initialize_db per rerun (old app.py)':<40} {schema * 1000:>8.2f} ms")
+    if args.legacy:
+        import google.generativeai as genai
+
+        def build_model():
+            genai.configure(api_key="")
+            genai.GenerativeModel("gemini-1.5-pro")
+        model = _timed(lambda: [build_model() for _ in range(reruns)]) / reruns
+        print(f"{'model setup per rerun (old app.py)':<40} {model * 1000:>8.2f} ms")
+
+
+def bench_tracing(args):
+    import fakes
+    import generation
+    import tracing
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure_database(os.path.join(tmp, "tracing.db"))
+        database.initialize_db()
+        calls = args.ops * 100
+        for on in (False, True):
+            tracing.enable(on)
+            elapsed = _timed(lambda: [database.count_flashcards(1) for _ in range(calls)])
+            _report(f"db.count_flashcards, tracing {'on' if on else 'off'}", calls, elapsed)
+            elapsed = _timed(lambda: [tracing.span("noop").__enter__() for _ in range(calls)])
+            _report(f"span() alone, tracing {'on' if on else 'off'}", calls, elapsed)
+
+        # One traced generation end to end, as the metrics endpoint would show it
+        tracing.reset()
+        model = fakes.FakeModel(latency=args.latency / 10)
+        with tracing.request("generate"):
+            cards, _ = generation.generate_deck(model, _synthetic_text(args.pages * 100), "", "Q&A", "Medium")
+            database.save_flashcards(1, cards)
+        tracing.enable(False)
+        for span in sorted(tracing.recent, key=lambda span: span.start)[:8]:
+            print(span)
+        print("\n".join(line for line in tracing.render_metrics().splitlines()
+                        if "_count" in line or "_input_total{" in line))
+        database.configure_database()
+
+
+class _ConcurrencyProbe:
+    """Wraps a model and records the most calls it ever saw at once."""
+
+    def __init__(self, model):
+        self.model = model
+        self.model_name = model.model_name
+        self.active = self.peak = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, stream=False):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            return self.model.generate_content(prompt)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def _run_clients(scheduler, requests, start_delays=None):
+    """Send `(user, prompt)` requests from one thread each; returns each
+    request's completion time in seconds and the worst queue position seen."""
+    done, positions = [None] * len(requests), []
+    start = time.perf_counter()
+
+    def client(i, user, prompt):
+        time.sleep((start_delays or {}).get(user, 0))
+        scheduler.for_user(user, on_wait=positions.append).generate_content(prompt)
+        done[i] = time.perf_counter() - start
+    threads = [threading.Thread(target=client, args=(i, user, prompt)) for i, (user, prompt) in enumerate(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return done, max(positions, default=0)
+
+
+def bench_scheduler(args):
+    import fakes
+    import scheduler
+
+    # The end of a lecture: every student sends the prompt for the same two slide decks
+    students = args.threads * 15
+    model = _ConcurrencyProbe(fakes.FakeModel(latency=args.latency))
+    llm = scheduler.LLMScheduler(model, requests_per_minute=None, max_concurrent=4)
+    requests = [(f"student{i}", f"slides {i % 2}") for i in range(students)]
+    elapsed = _timed(lambda: _run_clients(llm, requests))
+    print(f"{students} students, 2 distinct prompts, model latency {args.latency}s")
+    print(f"{'coalesced':<40} {elapsed:>8.2f} s  model calls={llm.stats['model_calls']} "
+          f"coalesced={llm.stats['coalesced']}")
+
+    # The same lecture with the app's default of streaming the answer
+    model = fakes.FakeModel(latency=args.latency, chunks=10)
+    llm = scheduler.LLMScheduler(model, requests_per_minute=None, max_concurrent=4)
+
+    def read_streams():
+        threads = [threading.Thread(target=lambda u=user, p=prompt: list(llm.for_user(u).generate_content(p, stream=True)))
+                   for user, prompt in requests]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = _timed(read_streams)
+    print(f"{'coalesced, streamed':<40} {elapsed:>8.2f} s  model calls={llm.stats['model_calls']} "
+          f"coalesced={llm.stats['coalesced']}")
+
+    # One user generating a big deck while five others each want two cards
+    for label, fair in (("one shared FIFO queue", False), ("per-user round-robin", True)):
+        model = _ConcurrencyProbe(fakes.FakeModel(latency=args.latency))
+        llm = scheduler.LLMScheduler(model, requests_per_minute=None, max_concurrent=2)
+        heavy = [("heavy", f"section {i}") for i in range(30)]
+        light = [(f"light{u}", f"question {u}-{i}") for u in range(5) for i in range(2)]
+        if not fair:
+            # Everyone in one queue is plain first-come, first-served
+            llm_for_user = llm.for_user
+            llm.for_user = lambda user, on_wait=None: llm_for_user("everyone", on_wait)
+        delays = {f"light{u}": 0.05 for u in range(5)}
+        done, worst = _run_clients(llm, heavy + light, delays)
+        light_mean = sum(done[len(heavy):]) / len(light)
+        print(f"{label:<40} light users wait {light_mean:>5.2f} s on average, heavy user done at "
+              f"{max(done[:len(heavy)]):.2f} s, peak concurrency {model.peak}, worst position {worst}")
+
+    # Rate limit: distinct prompts from many users against a 600 requests/minute quota
+    model = fakes.FakeModel(latency=0)
+    llm = scheduler.LLMScheduler(model, requests_per_minute=600, burst=5, max_concurrent=8)
+    count = 25
+    elapsed = _timed(lambda: _run_clients(llm, [(f"user{i % 5}", f"prompt {i}") for i in range(count)]))
+    # The burst goes out at once, the rest at 10 per second
+    expected = count / ((count - 5) / 10)
+    print(f"{'token bucket (600/min, burst 5)':<40} {count / elapsed:>8.1f} req/s over {count} requests "
+          f"(limit {expected:.1f})")
+
+
+_DEDUP_TEMPLATES = [
+    ("What is the role of {0} in {1} {2}?", "What role does {0} play in {1} {2}?"),
+    ("How does {0} affect {1} during {2}?", "In what way does {0} affect the {1} during {2}?"),
+    ("Define {0} {1} in the context of {2}.", "What is {0} {1} in the context of {2}?"),
+    ("Why is {0} important for {1} and {2}?", "Explain why {0} is important for {1} and {2}."),
+]
+
+
+def _dedup_question(rng, vocab, reworded=False, words=None):
+    template = _DEDUP_TEMPLATES[rng.randrange(len(_DEDUP_TEMPLATES))] if words is None else words[0]
+    words = words[1] if words is not None else [vocab[rng.randrange(len(vocab))] for _ in range(3)]
+    return template[1 if reworded else 0].format(*words), (template, words)
+
+
+def bench_dedup(args):
+    import random
+    import numpy as np
+    import dedup
+    rng = random.Random(7)
+    vocab = ["".join(rng.choice("bcdfghklmnprstvz") + rng.choice("aeiou") for _ in range(3)) for _ in range(3000)]
+    deck_size = args.ops * 200
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure_database(os.path.join(tmp, "dedup.db"))
+        database.initialize_db()
+        database.register_user("heavy", "pw")
+        user_id = database.authenticate_user("heavy", "pw")
+        deck, seeds = [], []
+        for _ in range(deck_size):
+            question, seed = _dedup_question(rng, vocab)
+            deck.append({"question": question, "answer": "a"})
+            seeds.append(seed)
+
+        def build():
+            with database.get_connection() as conn, conn:
+                database._save_card_rows(conn, user_id, database._card_rows(user_id, deck)[0], on_duplicate=None)
+        print(f"{deck_size:,} cards indexed in {_timed(build):.2f} s")
+
+        # Regenerations: each batch rewords five existing cards and adds five new ones
+        batches, expected = [], []
+        for _ in range(100):
+            batch, dupes = [], []
+            for k in range(10):
+                if k % 2:
+                    question, _ = _dedup_question(rng, vocab, reworded=True, words=seeds[rng.randrange(deck_size)])
+                else:
+                    question, _ = _dedup_question(rng, vocab)
+                batch.append({"question": question, "answer": "b"})
+                dupes.append(bool(k % 2))
+            batches.append(batch)
+            expected.append(dupes)
+
+        with database.get_connection() as conn:
+            all_sigs = np.frombuffer(b"".join(blob for blob, in conn.execute(
+                "SELECT signature FROM card_minhash WHERE user_id = ? ORDER BY card_id", (user_id,))),
+                dtype=np.uint32).reshape(-1, dedup.NUM_PERM)
+
+        def brute_force():
+            for batch in batches:
+                sigs = dedup.signatures([card["question"] for card in batch])
+                for sig in sigs:
+                    dedup.similarity(sig, all_sigs).max()
+        print(f"{'brute force (all signatures, per batch)':<40} {_timed(brute_force) / len(batches) * 1000:>8.1f} ms")
+
+        found = []
+
+        def lsh():
+            for batch in batches:
+                with database.get_connection() as conn:
+                    found.append([match is not None for match in
+                                  dedup.match_questions(conn, user_id, [card["question"] for card in batch])[1]])
+        print(f"{'LSH lookup (per batch of 10)':<40} {_timed(lsh) / len(batches) * 1000:>8.1f} ms")
+        pairs = [(e, f) for want, got in zip(expected, found) for e, f in zip(want, got)]
+        hits = sum(e and f for e, f in pairs)
+        print(f"reworded copies caught {hits}/{sum(e for e, _ in pairs)}, "
+              f"fresh cards wrongly flagged {sum(f and not e for e, f in pairs)}/{sum(not e for e, _ in pairs)}")
+
+        saved = _timed(lambda: [database.save_flashcards(user_id, batch) for batch in batches])
+        plain = _timed(lambda: [database.save_flashcards(user_id, batch, on_duplicate=None) for batch in batches])
+        print(f"{'save_flashcards with flagging (per batch)':<40} {saved / len(batches) * 1000:>8.1f} ms")
+        print(f"{'save_flashcards without check':<40} {plain / len(batches) * 1000:>8.1f} ms")
+        database.configure_database()
+
+
+# The full-text index of migration 9: one set of postings shared by every
+# user, with the owner filtered in the join
+_SHARED_FTS = [
+    """
+    CREATE VIRTUAL TABLE shared_fts USING fts5(
+        question, answer, content='flashcards', content_rowid='id',
+        tokenize='porter unicode61', prefix='2 3'
+    )
+    """,
+    "INSERT INTO shared_fts (shared_fts) VALUES ('rebuild')",
+]
+
+
+def _shared_search(conn, user_id, text):
+    return conn.execute("""
+        SELECT f.id FROM shared_fts JOIN flashcards f ON f.id = shared_fts.rowid
+        WHERE shared_fts MATCH ? AND f.user_id = ?
+        ORDER BY bm25(shared_fts, 2.0, 1.0) LIMIT 11
+    """, (database._search_query(text), user_id)).fetchall()
+
+
+def bench_search(args):
+    import random
+    rng = random.Random(3)
+    # A class studying the same course: a shared core of words every deck
+    # uses, and a long tail
+    course = [f"course{i}" for i in range(50)]
+    vocab = [f"term{i}" for i in range(5000)]
+    users, deck_size = args.ops, 200
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure_database(os.path.join(tmp, "search.db"))
+        database.initialize_db()
+
+        def save_decks():
+            for user_id in range(1, users + 1):
+                deck = [{"question": "What links " + " and ".join(rng.sample(vocab, 2) + [rng.choice(course)]) + "?",
+                         "answer": " ".join(rng.sample(vocab, 6) + rng.sample(course, 2))} for _ in range(deck_size)]
+                database.save_flashcards(user_id, deck, on_duplicate=None)
+        elapsed = _timed(save_decks)
+        print(f"{users} users x {deck_size} cards saved in {elapsed:.2f} s (index upkeep included)")
+
+        kinds = {
+            "course word": [rng.choice(course) for _ in range(20)],
+            "rare word": [rng.choice(vocab) for _ in range(20)],
+            "course prefix": ["cours"] * 10,
+            "rare prefix": [f"term{rng.randrange(10)}" for _ in range(10)],
+        }
+        for kind, queries in kinds.items():
+            owners = [rng.randint(1, users) for _ in queries]
+
+            def fts():
+                for user_id, query in zip(owners, queries):
+                    database.search_flashcards(user_id, query)
+            _report(f"search_flashcards, {kind}", len(queries), _timed(fts))
+
+        if args.legacy:
+            with database.get_connection() as conn:
+                for statement in _SHARED_FTS:
+                    conn.execute(statement)
+                for kind, queries in kinds.items():
+                    owners = [rng.randint(1, users) for _ in queries]
+                    elapsed = _timed(lambda: [_shared_search(conn, user_id, query)
+                                              for user_id, query in zip(owners, queries)])
+                    _report(f"shared index + user join, {kind}", len(queries), elapsed)
+
+        def load_and_filter():
+            for query in kinds["rare word"][:5]:
+                [card for card in database.get_flashcards(1)
+                 if query in card["question"].lower() or query in card["answer"].lower()][:10]
+        _report("get_flashcards + filter in Python", 5, _timed(load_and_filter))
+
+        with database.get_connection() as conn:
+            conn.execute("INSERT INTO flashcards_fts (flashcards_fts) VALUES ('integrity-check')")
+        print("FTS index consistent")
+        database.configure_database()
+
+
+class _PromptMeter:
+    """Wraps a model and counts calls and prompt characters sent."""
+
+    def __init__(self, model):
+        self.model = model
+        self.model_name = model.model_name
+        self.calls = self.chars = 0
+
+    def generate_content(self, prompt, stream=False):
+        self.calls += 1
+        self.chars += len(prompt)
+        return self.model.generate_content(prompt, stream)
+
+
+def bench_multi_format(args):
+    import fakes
+    import generation
+    import pipeline
+    from flashcard_parser import CARD_TYPES, DIFFICULTIES
+    text = _synthetic_text(4000)
+    wiki_text = _synthetic_text(4000)
+    cells = generation.format_cells(list(CARD_TYPES), list(DIFFICULTIES))
+    print(f"{len(cells)} type/difficulty combinations, fake model latency {args.latency}s")
+
+    def separately():
+        cards = []
+        for card_type, difficulty in cells:
+            cards += pipeline.generate(model, text, wiki_text, card_type, difficulty)[0]
+        return cards
+
+    def combined():
+        return pipeline.generate(model, text, wiki_text, list(CARD_TYPES), list(DIFFICULTIES))[0]
+
+    for label, run in (("one request per combination", separately), ("one combined JSON request", combined)):
+        model = _PromptMeter(fakes.FakeModel(latency=args.latency, cards=generation.CARDS_PER_CELL))
+        cards = []
+        elapsed = _timed(lambda: cards.extend(run()))
+        kinds = len({(card.get("card_type"), card.get("difficulty")) for card in cards})
+        print(f"{label:<40} {elapsed:>8.2f} s  model calls={model.calls} prompt chars={model.chars} "
+              f"cards={len(cards)}" + (f" in {kinds} typed groups" if kinds > 1 else ""))
+
+    response = fakes.FakeModel(latency=0).render(generation.build_combined_prompt(text, wiki_text, cells))
+    elapsed = _timed(lambda: [generation.parse_card_json(response) for _ in range(args.ops)])
+    print(f"{'parse combined response':<40} {elapsed / args.ops * 1e6:>8.1f} us per response")
+
+
+def _simulate_reviews(users, cards_per_user, reviews_per_card, seed=0):
+    """Synthetic review log for users whose memory follows their own "true"
+    Params while the app schedules them with DEFAULT_PARAMS. Returns the log
+    columns (user, card, grade, elapsed, interval, ease) and the true Params."""
+    import numpy as np
+    import scheduling
+    rng = np.random.default_rng(seed)
+    truth = np.asarray(scheduling.DEFAULT_PARAMS, dtype=np.float64) + np.zeros((users, 1))
+    truth[:, 1] = rng.uniform(2.2, 3.2, users)    # max_ease
+    truth[:, 2] = rng.uniform(0.1, 0.4, users)    # again_penalty
+    truth[:, 4] = rng.uniform(1.0, 1.6, users)    # hard_factor
+    truth[:, 5] = rng.uniform(0.0, 0.3, users)    # easy_bonus
+    card_user = np.repeat(np.arange(users), cards_per_user)
+    true_params = scheduling.Params(*truth[card_user].T)
+    cards = len(card_user)
+    interval, ease = np.ones(cards), np.full(cards, 2.5)
+    stability, true_ease = np.ones(cards), np.full(cards, 2.5)
+    columns = []
+    for _ in range(reviews_per_card):
+        # Reviews happen around the due day, sometimes early, sometimes late
+        elapsed = np.round(interval * rng.lognormal(0, 0.35, cards))
+        ratio = elapsed / stability
+        recalled = rng.random(cards) < 0.9 ** ratio
+        grades = np.where(~recalled, scheduling.AGAIN,
+                          np.where(ratio > 1.2, scheduling.HARD,
+                                   np.where(ratio < 0.6, scheduling.EASY, scheduling.GOOD)))
+        columns.append((card_user, np.arange(cards), grades, elapsed, interval.copy(), ease.copy()))
+        interval, ease = scheduling.grade(interval, ease, grades)
+        stability, true_ease = scheduling.grade(stability, true_ease, grades, true_params)
+    # Interleave as a real log would be: everyone's first reviews, then second, ...
+    return [np.concatenate(column) for column in zip(*columns)], truth
+
+
+def bench_fit_params(args):
+    import numpy as np
+    import scheduling
+    import tuning
+    users = args.threads * 250
+    start = time.perf_counter()
+    columns, truth = _simulate_reviews(users, 100, 10)
+    print(f"{len(columns[0])} synthetic reviews of {users} users simulated in {time.perf_counter() - start:.2f} s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure_database(os.path.join(tmp, "reviews.db"))
+        database.initialize_db()
+        rows = list(zip(*(column.tolist() for column in columns)))
+        rows = [(user, card, day, grade, elapsed, interval, ease)
+                for day, (user, card, grade, elapsed, interval, ease) in enumerate(rows)]
+        batch = 1000
+
+        def append():
+            for i in range(0, len(rows), batch):
+                with database.get_connection() as conn, conn:
+                    database._insert_review_log(conn, rows[i:i + batch])
+
+        elapsed = _timed(append)
+        print(f"{'append to review_log':<40} {elapsed:>8.2f} s  ({len(rows) / elapsed:,.0f} reviews/s, "
+              f"{batch} per transaction)")
+        history = []
+
+        def load():
+            with database.get_connection() as conn:
+                history.append(tuning.load_history(conn))
+
+        elapsed = _timed(load)
+        database.configure_database()
+    history = history[0]
+    print(f"{'load and group':<40} {elapsed:>8.2f} s")
+
+    fitted = []
+    elapsed = _timed(lambda: fitted.append(tuning.fit(history)))
+    params, loss = fitted[0]
+    print(f"{'fit':<40} {elapsed:>8.2f} s  ({len(history) / elapsed:,.0f} reviews/s, "
+          f"{tuning.ITERATIONS} rounds x {tuning.CANDIDATES} candidates per user)")
+
+    defaults = np.tile(np.asarray(scheduling.DEFAULT_PARAMS, dtype=np.float64), (users, 1))
+    for label, candidate in (("default", defaults), ("fitted", params), ("true", truth)):
+        nll = history.loss(candidate[:, None, :])[:, 0].sum() / len(history)
+        print(f"  NLL per review with {label + ' params':<22} {nll:.4f}")
+    for i, name in enumerate(scheduling.Params._fields):
+        if np.ptp(truth[:, i]):
+            print(f"  {name:<14} mean abs error {np.abs(params[:, i] - truth[:, i]).mean():.3f} "
+                  f"(defaults {np.abs(defaults[:, i] - truth[:, i]).mean():.3f})")
+
+
+def bench_due_counts(args):
+    import random
+    import scheduling
+    rng = random.Random(3)
+    today = date.today()
+    users, per_user = args.threads, args.ops * 40
+    with tempfile.TemporaryDirectory() as tmp:
+        database.configure_database(os.path.join(tmp, "due.db"))
+        database.initialize_db()
+        user_ids, card_ids = [], []
+        for u in range(users):
+            database.register_user(f"user{u}", "pw")
+            user_ids.append(database.get_user_id(f"user{u}"))
+            cards = [{"question": f"q{u}-{i}", "answer": "a", "interval": rng.randint(1, 60),
+                      "next_review": today + timedelta(days=rng.randint(-30, 90))} for i in range(per_user)]
+            card_ids.append(database.save_flashcards(user_ids[-1], cards, on_duplicate=None)[0])
+        user_id = user_ids[0]
+        print(f"{users} users x {per_user:,} cards, due days spread over 120 days")
+
+        def from_rows():
+            with database.get_connection() as conn:
+                rows = conn.execute("SELECT id, interval, ease, next_review FROM flashcards WHERE user_id = ?",
+                                    (user_id,)).fetchall()
+            return scheduling.DeckSchedule.from_rows(rows).forecast(30, today).tolist()
+
+        expected = from_rows()
+        assert database.get_due_forecast(user_id, 30, today) == expected, "due_counts disagrees with flashcards"
+        rounds = 20
+        due_rows = _timed(lambda: [len(database.get_due_flashcards(user_id)) for _ in range(rounds)]) / rounds
+        due_count = _timed(lambda: [database.get_due_count(user_id, today) for _ in range(rounds)]) / rounds
+        rows = _timed(lambda: [from_rows() for _ in range(rounds)]) / rounds
+        table = _timed(lambda: [database.get_due_forecast(user_id, 30, today) for _ in range(rounds)]) / rounds
+        print(f"{'due today, fetch rows and count':<40} {due_rows * 1000:>8.2f} ms")
+        print(f"{'due today, due_counts':<40} {due_count * 1000:>8.2f} ms")
+        print(f"{'30-day forecast, all rows + DeckSchedule':<40} {rows * 1000:>8.2f} ms")
+        print(f"{'30-day forecast, due_counts':<40} {table * 1000:>8.2f} ms")
+
+        # Every write path, then a full recount
+        reviews = args.ops * 4
+        for u, user in enumerate(user_ids):
+            buffer = database.ReviewBuffer(user)
+            for card in database.get_flashcards_page(user, limit=reviews, offset=0):
+                buffer.review(card, rng.choice(["hard", "easy"]), today)
+            buffer.flush()
+            for card_id in rng.sample(card_ids[u], 50):
+                database.update_flashcard_review(card_id, rng.randint(0, 5))
+        with database.get_connection() as conn, conn:
+            conn.executemany("DELETE FROM flashcards WHERE id = ?", [(i,) for i in rng.sample(card_ids[1], 100)])
+        database.save_flashcards(user_id, [{"question": f"new {i}", "answer": "a"} for i in range(100)],
+                                 on_duplicate=None)
+        check = []
+        elapsed = _timed(lambda: check.append(database.check_due_counts()))
+        print(f"{'consistency check after writes':<40} {elapsed * 1000:>8.2f} ms  mismatches={len(check[0])}")
+        assert not check[0], check[0][:5]
+
+        # Write cost of the triggers: the same review batch with and without them
+        updates = [(card_id, 3, 2.5, today + timedelta(days=rng.randint(1, 30))) for card_id in card_ids[2][:reviews]]
+        entries = [(user_ids[2], card_id, today.toordinal(), 2, 1, 1, 2.5) for card_id in card_ids[2][:reviews]]
+        with_triggers = _timed(lambda: database.record_reviews(user_ids[2], updates, entries))
+        with database.get_connection() as conn:
+            for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                                        "AND name LIKE 'due_counts_%'").fetchall():
+                conn.execute(f"DROP TRIGGER {name}")
+        updates = [(card_id, 4, 2.5, next_review + timedelta(days=1)) for card_id, _, _, next_review in updates]
+        without = _timed(lambda: database.record_reviews(user_ids[2], updates, entries))
+        _report("review batch with due_counts triggers", reviews, with_triggers)
+        _report("review batch without them", reviews, without)
+        stale = database.check_due_counts(repair=True)
+        print(f"{'after dropping them: stale days repaired':<40} {len(stale):>8}  "
+              f"now consistent={not database.check_due_counts()}")
+        database.configure_database()
+
+
+SUITES = {
+    "db": bench_db,
+    "plans": bench_plans,
+    "reviews": bench_reviews,
+    "pdf-cache": bench_pdf_cache,
+    "pdf-parallel": bench_pdf_parallel,
+    "pdf-lazy": bench_pdf_lazy,
+    "passages": bench_passages,
+    "map-reduce": bench_map_reduce,
+    "llm-cache": bench_llm_cache,
+    "wiki": bench_wiki,
+    "parser": bench_parser,
+    "parser-scaling": bench_parser_scaling,
+    "export": bench_export,
+    "scheduling": bench_scheduling,
+    "deck-memory": bench_deck_memory,
+    "startup": bench_startup,
+    "tracing": bench_tracing,
+    "scheduler": bench_scheduler,
+    "dedup": bench_dedup,
+    "search": bench_search,
+    "multi-format": bench_multi_format,
+    "fit-params": bench_fit_params,
+    "due-counts": bench_due_counts,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("suite", choices=sorted(SUITES))
+    parser.add_argument("--ops", type=int, default=500, help="operations per thread")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=50, help="pages in generated PDFs")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake model latency in seconds")
+    parser.add_argument("--legacy", action="store_true", help="also time the old implementation where it is slow")
+    args = parser.parse_args()
+    SUITES[args.suite](args)
+
+
+if __name__ == "__main__":
+    main()
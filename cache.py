@@ -0,0 +1,139 @@
+"""Size-bounded LRU caches stored in SQLite next to the flashcards.
+
+Every cache table has the same shape (see the migrations in database.py):
+key, compressed value, size in bytes, created and last_used timestamps.
+Entries are shared by all users and sessions and survive restarts.
+"""
+import json
+import threading
+import time
+import zlib
+from hashlib import sha256
+
+from database import get_connection
+
+PDF_CACHE_MAX_BYTES = 256 * 1024 * 1024
+LLM_CACHE_MAX_BYTES = 64 * 1024 * 1024
+LLM_CACHE_TTL = 7 * 24 * 3600
+
+# Only these names are ever interpolated into SQL
+CACHE_TABLES = {"pdf_text_cache", "llm_response_cache", "wiki_cache"}
+
+
+def _check_table(table):
+    if table not in CACHE_TABLES:
+        raise ValueError(f"Unknown cache table: {table}")
+
+
+def cache_get(table, key, ttl=None):
+    """Return the stored bytes for `key` and mark it as recently used, or None.
+    Entries older than `ttl` seconds are dropped and count as a miss."""
+    _check_table(table)
+    now = time.time()
+    with get_connection() as conn, conn:
+        row = conn.execute(f"SELECT value, created FROM {table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if ttl is not None and now - row[1] > ttl:
+            conn.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+            return None
+        conn.execute(f"UPDATE {table} SET last_used = ? WHERE key = ?", (now, key))
+    return zlib.decompress(row[0])
+
+
+def cache_put(table, key, value, max_bytes):
+    """Store `value` (bytes) under `key`, then evict least recently used entries
+    until the table holds at most `max_bytes` of compressed data."""
+    _check_table(table)
+    blob = zlib.compress(value)
+    now = time.time()
+    with get_connection() as conn, conn:
+        conn.execute(f"""
+            INSERT OR REPLACE INTO {table} (key, value, size, created, last_used)
+            VALUES (?, ?, ?, ?, ?)
+        """, (key, blob, len(blob), now, now))
+        total = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {table}").fetchone()[0]
+        if total > max_bytes:
+            victims = []
+            for old_key, size in conn.execute(f"SELECT key, size FROM {table} ORDER BY last_used"):
+                if total <= max_bytes:
+                    break
+                victims.append((old_key,))
+                total -= size
+            conn.executemany(f"DELETE FROM {table} WHERE key = ?", victims)
+
+
+# Extracted PDF text, one list of page strings per document hash
+def get_pdf_pages(doc_hash):
+    value = cache_get("pdf_text_cache", doc_hash)
+    return None if value is None else json.loads(value)
+
+
+def put_pdf_pages(doc_hash, pages, max_bytes=PDF_CACHE_MAX_BYTES):
+    cache_put("pdf_text_cache", doc_hash, json.dumps(pages).encode(), max_bytes)
+
+
+# The leading pages of a document that was only read part-way
+def get_partial_pdf_pages(doc_hash):
+    return get_pdf_pages(f"{doc_hash}:partial")
+
+
+def put_partial_pdf_pages(doc_hash, pages, max_bytes=PDF_CACHE_MAX_BYTES):
+    put_pdf_pages(f"{doc_hash}:partial", pages, max_bytes)
+
+
+class CachedResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+def llm_cache_key(prompt, model_name):
+    # Whitespace differences never change what the model is asked
+    normalized = " ".join(prompt.split())
+    return sha256(f"{model_name}\n{normalized}".encode()).hexdigest()
+
+
+class CachedModel:
+    """Wraps a model's generate_content with the shared response cache.
+
+    With `bypass` set the cache is not read, but the fresh response still
+    replaces the stored one. Hit and miss counts are kept in `stats` for the
+    whole process.
+    """
+
+    stats = {"hits": 0, "misses": 0}
+    _stats_lock = threading.Lock()
+
+    def __init__(self, model, bypass=False, ttl=LLM_CACHE_TTL, max_bytes=LLM_CACHE_MAX_BYTES):
+        self.model = model
+        self.model_name = getattr(model, "model_name", type(model).__name__)
+        self.bypass = bypass
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def _count(self, outcome):
+        with self._stats_lock:
+            self.stats[outcome] += 1
+
+    def generate_content(self, prompt, stream=False):
+        key = llm_cache_key(prompt, self.model_name)
+        if not self.bypass:
+            cached = cache_get("llm_response_cache", key, self.ttl)
+            if cached is not None:
+                self._count("hits")
+                response = CachedResponse(cached.decode())
+                return iter([response]) if stream else response
+        self._count("misses")
+        if stream:
+            return self._stream(key, self.model.generate_content(prompt, stream=True))
+        text = self.model.generate_content(prompt).text
+        cache_put("llm_response_cache", key, text.encode(), self.max_bytes)
+        return CachedResponse(text)
+
+    def _stream(self, key, chunks):
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk.text)
+            yield CachedResponse(chunk.text)
+        # Only a response that was read to the end is worth keeping
+        cache_put("llm_response_cache", key, "".join(parts).encode(), self.max_bytes)
@@ -1,204 +1,1199 @@
-import sqlite3
-from hashlib import sha256
-from datetime import datetime, timedelta
-def get_connection():
-    return sqlite3.connect("flashcards.db", check_same_thread=False)
-
-def initialize_db():
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL
-        )
-    ''')
-
-    # Flashcards table with spaced repetition fields
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS flashcards (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            question TEXT,
-            answer TEXT,
-            interval INTEGER DEFAULT 1,
-            ease REAL DEFAULT 2.5,
-            next_review DATE,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        )
-    ''')
-
-    conn.commit()
-    conn.close()
-
-# Hash password
-def hash_password(password):
-    return sha256(password.encode()).hexdigest()
-
-# Register a user
-def register_user(username, password):
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)", 
-                       (username, hash_password(password)))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
-
-# Authenticate user
-def authenticate_user(username, password):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id FROM users WHERE username = ? AND password_hash = ?", 
-                   (username, hash_password(password)))
-    user = cursor.fetchone()
-    conn.close()
-    return user[0] if user else None
-
-# Retrieve details of all users (admin-like functionality)
-def get_all_users():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, username FROM users")
-    results = cursor.fetchall()
-    conn.close()
-    return results
-
-# Retrieve details of currently logged-in user (assuming session management)
-def get_logged_in_user(session_user_id):
-    if session_user_id is None:
-        return None  # No user logged in
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, username FROM users WHERE id = ?", (session_user_id,))
-    user = cursor.fetchone()
-    conn.close()
-    return user
-
-# Save new flashcard with initial spaced repetition values
-def save_flashcard(user_id, question, answer, interval=1, ease=2.5, next_review=None):
-    conn = get_connection()
-    cursor = conn.cursor()
-    if next_review is None:
-        next_review = (datetime.today() + timedelta(days=interval)).date()
-
-    try:
-        cursor.execute("""
-            INSERT INTO flashcards (user_id, question, answer, interval, ease, next_review)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (user_id, question, answer, interval, ease, next_review))
-        conn.commit()
-        print(f"Flashcard saved for user_id {user_id}")
-    except Exception as e:
-        print(f"Error inserting flashcard: {e}")
-    finally:
-        conn.close()
-
-
-# Get all flashcards for a user
-def get_flashcards(user_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT id, question, answer, interval, ease, next_review
-        FROM flashcards
-        WHERE user_id = ?
-    """, (user_id,))
-    rows = cursor.fetchall()
-    conn.close()
-    return [
-        {
-            "id": row[0],
-            "question": row[1],
-            "answer": row[2],
-            "interval": row[3],
-            "ease": row[4],
-            "next_review": str(row[5])
-        }
-        for row in rows
-    ]
-
-
-# Get flashcards due for review
-def get_due_flashcards(user_id):
-    conn = get_connection()
-    cursor = conn.cursor()
-    today = datetime.today().date()
-    cursor.execute("""
-        SELECT id, question, answer, interval, ease, next_review
-        FROM flashcards
-        WHERE user_id = ? AND date(next_review) <= ?
-    """, (user_id, today))
-    results = cursor.fetchall()
-    conn.close()
-    return results
-
-# Update flashcard review using a simplified SuperMemo 2 algorithm
-def update_flashcard_review(card_id, quality):
-    """
-    `quality` should be an integer from 0 to 5:
-    5 - perfect response
-    4 - correct response after hesitation
-    3 - correct response with difficulty
-    2 or less - incorrect or complete blackout
-    """
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    # Fetch current interval and ease
-    cursor.execute("SELECT interval, ease FROM flashcards WHERE id = ?", (card_id,))
-    row = cursor.fetchone()
-
-    if not row:
-        conn.close()
-        return False  
-
-    interval, ease = row
-
-    if quality < 3:
-        interval = 1
-    else:
-        ease = max(1.3, ease + 0.1 - (5 - quality) * 0.08)
-        interval = int(interval * ease)
-
-    next_review = (datetime.today() + timedelta(days=interval)).date()
-
-    cursor.execute("""
-        UPDATE flashcards
-        SET interval = ?, ease = ?, next_review = ?
-        WHERE id = ?
-    """, (interval, ease, next_review, card_id))
-
-    conn.commit()
-    conn.close()
-    return True
-
-
-def update_flashcard(username, question, interval, ease, next_review):
-    conn = sqlite3.connect("flashcards.db")
-    c = conn.cursor()
-
-    # First, retrieve the user_id from the username
-    c.execute("SELECT id FROM users WHERE username=?", (username,))
-    user_id = c.fetchone()
-
-    if not user_id:
-        conn.close()
-        return False 
-
-    user_id = user_id[0]
-    c.execute("""
-        UPDATE flashcards 
-        SET interval=?, ease=?, next_review=?
-        WHERE user_id=? AND question=?
-    """, (interval, ease, next_review, user_id, question))
-
-    conn.commit()
-    conn.close()
-    return True
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from queue import LifoQueue, Empty
+from hashlib import sha256
+from datetime import date, datetime, timedelta
+
+import dedup
+from dedup import FLAG
+from scheduling import (DEFAULT_PARAMS, FEEDBACK_GRADES, DeckSchedule, Params, elapsed_days, grade,
+                        quality_to_grade, review_card)
+from tracing import traced
+
+DB_PATH = "flashcards.db"
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+PAGE_SIZE = 50
+# Cards kept from the previous window when paging, so stepping back is free
+PAGE_PREFETCH = 10
+SEARCH_PAGE_SIZE = 10
+# bm25 column weights for flashcards_fts: question, answer
+SEARCH_WEIGHTS = (2.0, 1.0)
+# flashcards_fts rowids are (user_id << OWNER_SHIFT) + card id, so each
+# user's cards are one rowid range (see migration 15)
+OWNER_SHIFT = 40
+
+# Words as unicode61 splits them (it treats "_" as a separator)
+_WORD_RE = re.compile(r"[^\W_]+")
+
+
+def _owned_text(user_id, text):
+    """`text` with every word prefixed by its owner, e.g. "u7xmitochondria"."""
+    if text is None:
+        return None
+    return _WORD_RE.sub(lambda m: f"u{user_id}x{m.group()}", text)
+
+
+def _add_functions(conn):
+    # Only migration 13 calls it, so that step still applies to older files;
+    # migration 15 replaced its triggers with plain SQL
+    conn.create_function("owned_text", 2, _owned_text, deterministic=True)
+
+
+def _open_connection(path):
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    _add_functions(conn)
+    # WAL lets readers run alongside a writer; NORMAL only fsyncs at checkpoints
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return conn
+
+
+class ConnectionPool:
+    """Thread-safe pool of long-lived SQLite connections.
+
+    Connections are created lazily up to `size` and handed out one caller at a
+    time, so Streamlit sessions running on different threads never share a
+    cursor but also never pay connect/close per query.
+    """
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = LifoQueue()
+        self._all = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            pass
+        with self._lock:
+            if len(self._all) < self.size:
+                conn = _open_connection(self.path)
+                self._all.append(conn)
+                return conn
+        return self._idle.get()
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close(self):
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all = []
+            self._idle = LifoQueue()
+
+
+_pool = ConnectionPool(DB_PATH)
+
+
+def configure_database(path=DB_PATH, pool_size=POOL_SIZE):
+    """Point the module at another database file (used by benchmarks and scripts)."""
+    global _pool
+    _pool.close()
+    _pool = ConnectionPool(path, pool_size)
+
+
+@contextmanager
+def get_connection():
+    conn = _pool.acquire()
+    try:
+        yield conn
+    finally:
+        _pool.release(conn)
+
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version.
+# Append new steps to the end; never edit a step that has already shipped.
+MIGRATIONS = [
+    # 1: base tables
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL
+        )
+        ''',
+        # Flashcards table with spaced repetition fields
+        '''
+        CREATE TABLE IF NOT EXISTS flashcards (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            question TEXT,
+            answer TEXT,
+            interval INTEGER DEFAULT 1,
+            ease REAL DEFAULT 2.5,
+            next_review DATE,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        ''',
+    ],
+    # 2: next_review as plain 'YYYY-MM-DD' text so due checks are index range
+    # scans, plus composite indexes for the per-user queries
+    [
+        """
+        UPDATE flashcards SET next_review = date(next_review)
+        WHERE date(next_review) IS NOT NULL AND next_review IS NOT date(next_review)
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_flashcards_user_due ON flashcards (user_id, next_review)",
+        "CREATE INDEX IF NOT EXISTS idx_flashcards_user_question ON flashcards (user_id, question)",
+    ],
+    # 3: shared cache of extracted PDF text, keyed by the SHA-256 of the file
+    [
+        """
+        CREATE TABLE IF NOT EXISTS pdf_text_cache (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            created REAL NOT NULL,
+            last_used REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_pdf_text_cache_last_used ON pdf_text_cache (last_used)",
+    ],
+    # 4: cache of model responses, keyed by a hash of model name + normalised prompt
+    [
+        """
+        CREATE TABLE IF NOT EXISTS llm_response_cache (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            created REAL NOT NULL,
+            last_used REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_llm_response_cache_last_used ON llm_response_cache (last_used)",
+    ],
+    # 5: cache of Wikipedia article text (and misses), keyed by topic
+    [
+        """
+        CREATE TABLE IF NOT EXISTS wiki_cache (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            created REAL NOT NULL,
+            last_used REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_wiki_cache_last_used ON wiki_cache (last_used)",
+    ],
+    # 6: (user_id, id) order for keyset pagination; the rowid is implied
+    [
+        "CREATE INDEX IF NOT EXISTS idx_flashcards_user ON flashcards (user_id)",
+    ],
+    # 7: decks written by the batch pipeline, so an interrupted run can resume
+    [
+        """
+        CREATE TABLE IF NOT EXISTS generated_decks (
+            user_id INTEGER NOT NULL,
+            deck_key TEXT NOT NULL,
+            source TEXT,
+            card_count INTEGER NOT NULL,
+            created REAL NOT NULL,
+            PRIMARY KEY (user_id, deck_key),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+    ],
+    # 8: MinHash signatures and LSH buckets of card questions (see dedup.py)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS card_minhash (
+            card_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            signature BLOB NOT NULL,
+            duplicate_of INTEGER
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS card_lsh (
+            user_id INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            card_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, bucket, card_id)
+        ) WITHOUT ROWID
+        """,
+    ],
+    # 9: full-text index over question and answer. The text stays in
+    # flashcards (external content); triggers keep the index in step
+    [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS flashcards_fts USING fts5(
+            question, answer,
+            content='flashcards', content_rowid='id',
+            tokenize='porter unicode61', prefix='2 3'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS flashcards_fts_insert AFTER INSERT ON flashcards BEGIN
+            INSERT INTO flashcards_fts (rowid, question, answer)
+            VALUES (new.id, new.question, new.answer);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS flashcards_fts_delete AFTER DELETE ON flashcards BEGIN
+            INSERT INTO flashcards_fts (flashcards_fts, rowid, question, answer)
+            VALUES ('delete', old.id, old.question, old.answer);
+        END
+        """,
+        # Reviews only touch the schedule columns and don't fire this
+        """
+        CREATE TRIGGER IF NOT EXISTS flashcards_fts_update
+        AFTER UPDATE OF question, answer ON flashcards BEGIN
+            INSERT INTO flashcards_fts (flashcards_fts, rowid, question, answer)
+            VALUES ('delete', old.id, old.question, old.answer);
+            INSERT INTO flashcards_fts (rowid, question, answer)
+            VALUES (new.id, new.question, new.answer);
+        END
+        """,
+        "INSERT INTO flashcards_fts (flashcards_fts) VALUES ('rebuild')",
+    ],
+    # 10: append-only history of every review (the state before it, the grade
+    # and the days since the previous one) for fitting scheduling parameters,
+    # and the per-user parameters fitted from it (see tuning.py)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS review_log (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            card_id INTEGER NOT NULL,
+            reviewed INTEGER NOT NULL,
+            grade INTEGER NOT NULL,
+            elapsed INTEGER NOT NULL,
+            interval INTEGER NOT NULL,
+            ease REAL NOT NULL
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS review_log_no_update BEFORE UPDATE ON review_log BEGIN
+            SELECT RAISE(ABORT, 'review_log is append-only');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS review_log_no_delete BEFORE DELETE ON review_log BEGIN
+            SELECT RAISE(ABORT, 'review_log is append-only');
+        END
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_params (
+            user_id INTEGER PRIMARY KEY,
+            min_ease REAL NOT NULL,
+            max_ease REAL NOT NULL,
+            again_penalty REAL NOT NULL,
+            hard_penalty REAL NOT NULL,
+            hard_factor REAL NOT NULL,
+            easy_bonus REAL NOT NULL,
+            reviews INTEGER NOT NULL,
+            fitted REAL NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+    ],
+    # 11: cards falling due per user and day, kept in step with flashcards
+    # by triggers so due counts and forecasts read a few rows per day instead
+    # of every card. Days with no cards due have no row.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS due_counts (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            cards INTEGER NOT NULL,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS due_counts_insert AFTER INSERT ON flashcards
+        WHEN new.user_id IS NOT NULL AND new.next_review IS NOT NULL BEGIN
+            INSERT INTO due_counts (user_id, day, cards) VALUES (new.user_id, new.next_review, 1)
+            ON CONFLICT (user_id, day) DO UPDATE SET cards = cards + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS due_counts_delete AFTER DELETE ON flashcards
+        WHEN old.user_id IS NOT NULL AND old.next_review IS NOT NULL BEGIN
+            UPDATE due_counts SET cards = cards - 1 WHERE user_id = old.user_id AND day = old.next_review;
+            DELETE FROM due_counts WHERE user_id = old.user_id AND day = old.next_review AND cards <= 0;
+        END
+        """,
+        # Question and answer edits don't fire these; reviews move one card
+        # from its old due day to its new one
+        """
+        CREATE TRIGGER IF NOT EXISTS due_counts_update_old AFTER UPDATE OF user_id, next_review ON flashcards
+        WHEN old.user_id IS NOT NULL AND old.next_review IS NOT NULL
+             AND (old.user_id IS NOT new.user_id OR old.next_review IS NOT new.next_review) BEGIN
+            UPDATE due_counts SET cards = cards - 1 WHERE user_id = old.user_id AND day = old.next_review;
+            DELETE FROM due_counts WHERE user_id = old.user_id AND day = old.next_review AND cards <= 0;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS due_counts_update_new AFTER UPDATE OF user_id, next_review ON flashcards
+        WHEN new.user_id IS NOT NULL AND new.next_review IS NOT NULL
+             AND (old.user_id IS NOT new.user_id OR old.next_review IS NOT new.next_review) BEGIN
+            INSERT INTO due_counts (user_id, day, cards) VALUES (new.user_id, new.next_review, 1)
+            ON CONFLICT (user_id, day) DO UPDATE SET cards = cards + 1;
+        END
+        """,
+        """
+        INSERT INTO due_counts (user_id, day, cards)
+        SELECT user_id, next_review, count(*) FROM flashcards
+        WHERE user_id IS NOT NULL AND next_review IS NOT NULL
+        GROUP BY user_id, next_review
+        """,
+    ],
+    # 12: near-duplicate index v2: a content-word key per card and 10 bands of
+    # 6 rows. Old buckets don't apply, so the index is dropped and rebuilt by
+    # dedup.index_missing in initialize_db
+    [
+        "DROP TABLE IF EXISTS card_lsh",
+        "DROP TABLE IF EXISTS card_minhash",
+        """
+        CREATE TABLE card_minhash (
+            card_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            words INTEGER NOT NULL,
+            signature BLOB NOT NULL,
+            duplicate_of INTEGER
+        )
+        """,
+        """
+        CREATE TABLE card_lsh (
+            user_id INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            card_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, bucket, card_id)
+        ) WITHOUT ROWID
+        """,
+    ],
+    # 13: flashcards_fts v2, one set of terms per user. Every word is indexed
+    # as owned_text() writes it, so a search only reads its user's posting
+    # lists (and a prefix only expands over their vocabulary) however many
+    # users share the database. The index no longer mirrors flashcards'
+    # columns, so it is contentless and filled here instead of by 'rebuild'
+    [
+        "DROP TRIGGER IF EXISTS flashcards_fts_insert",
+        "DROP TRIGGER IF EXISTS flashcards_fts_delete",
+        "DROP TRIGGER IF EXISTS flashcards_fts_update",
+        "DROP TABLE IF EXISTS flashcards_fts",
+        """
+        CREATE VIRTUAL TABLE flashcards_fts USING fts5(
+            question, answer, content='', tokenize='porter unicode61'
+        )
+        """,
+        """
+        CREATE TRIGGER flashcards_fts_insert AFTER INSERT ON flashcards BEGIN
+            INSERT INTO flashcards_fts (rowid, question, answer)
+            VALUES (new.id, owned_text(new.user_id, new.question), owned_text(new.user_id, new.answer));
+        END
+        """,
+        """
+        CREATE TRIGGER flashcards_fts_delete AFTER DELETE ON flashcards BEGIN
+            INSERT INTO flashcards_fts (flashcards_fts, rowid, question, answer)
+            VALUES ('delete', old.id, owned_text(old.user_id, old.question), owned_text(old.user_id, old.answer));
+        END
+        """,
+        # Reviews only touch the schedule columns and don't fire this
+        """
+        CREATE TRIGGER flashcards_fts_update
+        AFTER UPDATE OF user_id, question, answer ON flashcards BEGIN
+            INSERT INTO flashcards_fts (flashcards_fts, rowid, question, answer)
+            VALUES ('delete', old.id, owned_text(old.user_id, old.question), owned_text(old.user_id, old.answer));
+            INSERT INTO flashcards_fts (rowid, question, answer)
+            VALUES (new.id, owned_text(new.user_id, new.question), owned_text(new.user_id, new.answer));
+        END
+        """,
+        """
+        INSERT INTO flashcards_fts (rowid, question, answer)
+        SELECT id, owned_text(user_id, question), owned_text(user_id, answer) FROM flashcards
+        """,
+    ],
+    # 14: near-duplicate index v3: signatures of content words in 20 bands of
+    # 3 rows, rebuilt by dedup.index_missing in initialize_db. A card's entries
+    # go when it is deleted, and when its owner or question changes (it is
+    # indexed again on the next start)
+    [
+        "DROP TABLE IF EXISTS card_lsh",
+        "DROP TABLE IF EXISTS card_minhash",
+        """
+        CREATE TABLE card_minhash (
+            card_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            signature BLOB NOT NULL,
+            duplicate_of INTEGER
+        )
+        """,
+        "CREATE INDEX idx_card_minhash_duplicate_of ON card_minhash (duplicate_of) WHERE duplicate_of IS NOT NULL",
+        """
+        CREATE TABLE card_lsh (
+            user_id INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            card_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, bucket, card_id)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX idx_card_lsh_card ON card_lsh (card_id)",
+        """
+        CREATE TRIGGER card_index_delete AFTER DELETE ON flashcards BEGIN
+            DELETE FROM card_minhash WHERE card_id = old.id;
+            DELETE FROM card_lsh WHERE card_id = old.id;
+            UPDATE card_minhash SET duplicate_of = NULL WHERE duplicate_of = old.id;
+        END
+        """,
+        """
+        CREATE TRIGGER card_index_update AFTER UPDATE OF user_id, question ON flashcards
+        WHEN old.user_id IS NOT new.user_id OR old.question IS NOT new.question BEGIN
+            DELETE FROM card_minhash WHERE card_id = old.id;
+            DELETE FROM card_lsh WHERE card_id = old.id;
+            UPDATE card_minhash SET duplicate_of = NULL WHERE duplicate_of = old.id;
+        END
+        """,
+    ],
+    # 15: flashcards_fts v3, plain SQL again so any connection can write
+    # flashcards. Each card is indexed under rowid (user_id << 40) + id, so a
+    # user's cards form one rowid range that FTS5 skips to in each posting
+    # list instead of returning every user's matches for the join to drop.
+    # Prefix indexes up to 6 characters spare a half-typed word from merging
+    # the postings of every word it starts. Ids stay below 2**40 and user ids
+    # below 2**23
+    [
+        "DROP TRIGGER IF EXISTS flashcards_fts_insert",
+        "DROP TRIGGER IF EXISTS flashcards_fts_delete",
+        "DROP TRIGGER IF EXISTS flashcards_fts_update",
+        "DROP TABLE IF EXISTS flashcards_fts",
+        """
+        CREATE VIEW flashcards_fts_content AS
+        SELECT (coalesce(user_id, 0) << 40) + id AS key, question, answer FROM flashcards
+        """,
+        """
+        CREATE VIRTUAL TABLE flashcards_fts USING fts5(
+            question, answer,
+            content='flashcards_fts_content', content_rowid='key',
+            tokenize='porter unicode61', prefix='1 2 3 4 5 6'
+        )
+        """,
+        """
+        CREATE TRIGGER flashcards_fts_insert AFTER INSERT ON flashcards BEGIN
+            INSERT INTO flashcards_fts (rowid, question, answer)
+            VALUES ((coalesce(new.user_id, 0) << 40) + new.id, new.question, new.answer);
+        END
+        """,
+        """
+        CREATE TRIGGER flashcards_fts_delete AFTER DELETE ON flashcards BEGIN
+            INSERT INTO flashcards_fts (flashcards_fts, rowid, question, answer)
+            VALUES ('delete', (coalesce(old.user_id, 0) << 40) + old.id, old.question, old.answer);
+        END
+        """,
+        # Reviews only touch the schedule columns and don't fire this
+        """
+        CREATE TRIGGER flashcards_fts_update
+        AFTER UPDATE OF user_id, question, answer ON flashcards BEGIN
+            INSERT INTO flashcards_fts (flashcards_fts, rowid, question, answer)
+            VALUES ('delete', (coalesce(old.user_id, 0) << 40) + old.id, old.question, old.answer);
+            INSERT INTO flashcards_fts (rowid, question, answer)
+            VALUES ((coalesce(new.user_id, 0) << 40) + new.id, new.question, new.answer);
+        END
+        """,
+        "INSERT INTO flashcards_fts (flashcards_fts) VALUES ('rebuild')",
+    ],
+]
+
+
+def migrate(conn):
+    """Bring the schema on `conn` up to len(MIGRATIONS); returns the new version."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Read the version under the write lock so concurrent starters don't
+        # apply the same step twice
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for target in range(version + 1, len(MIGRATIONS) + 1):
+            for statement in MIGRATIONS[target - 1]:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {target}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return max(version, len(MIGRATIONS))
+
+
+def initialize_db():
+    with get_connection() as conn:
+        migrate(conn)
+        dedup.index_missing(conn)
+
+
+def _iso_date(value):
+    # next_review is compared as text, so always store it as YYYY-MM-DD
+    return str(value)[:10]
+
+# Hash password
+def hash_password(password):
+    return sha256(password.encode()).hexdigest()
+
+# Register a user
+@traced("db.register_user")
+def register_user(username, password):
+    with get_connection() as conn:
+        try:
+            with conn:
+                conn.execute("INSERT INTO users (username, password_hash) VALUES (?, ?)",
+                             (username, hash_password(password)))
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+# Authenticate user
+@traced("db.authenticate_user")
+def authenticate_user(username, password):
+    with get_connection() as conn:
+        user = conn.execute("SELECT id FROM users WHERE username = ? AND password_hash = ?",
+                            (username, hash_password(password))).fetchone()
+    return user[0] if user else None
+
+@traced("db.get_user_id")
+def get_user_id(username):
+    with get_connection() as conn:
+        user = conn.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
+    return user[0] if user else None
+
+# Retrieve details of all users (admin-like functionality)
+def get_all_users():
+    with get_connection() as conn:
+        return conn.execute("SELECT id, username FROM users").fetchall()
+
+# Retrieve details of currently logged-in user (assuming session management)
+def get_logged_in_user(session_user_id):
+    if session_user_id is None:
+        return None  # No user logged in
+    with get_connection() as conn:
+        return conn.execute("SELECT id, username FROM users WHERE id = ?",
+                            (session_user_id,)).fetchone()
+
+# Save new flashcard with initial spaced repetition values
+@traced("db.save_flashcard")
+def save_flashcard(user_id, question, answer, interval=1, ease=2.5, next_review=None):
+    if next_review is None:
+        next_review = (datetime.today() + timedelta(days=interval)).date()
+    next_review = _iso_date(next_review)
+
+    with get_connection() as conn:
+        try:
+            with conn:
+                conn.execute("""
+                    INSERT INTO flashcards (user_id, question, answer, interval, ease, next_review)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (user_id, question, answer, interval, ease, next_review))
+            print(f"Flashcard saved for user_id {user_id}")
+        except Exception as e:
+            print(f"Error inserting flashcard: {e}")
+
+# Save a whole generated deck in a single transaction
+@traced("db.save_flashcards", count="cards")
+def save_flashcards(user_id, cards, on_duplicate=FLAG):
+    """
+    Insert `cards` (dicts with question/answer and optional interval, ease,
+    next_review) for `user_id` with one executemany and one commit.
+
+    Returns `(ids, failures)` where `ids` are the row ids of the saved
+    cards in input order and `failures` is a list of `(index, reason)` for
+    cards that were rejected before the insert. If the insert itself fails
+    the transaction is rolled back and a single `(None, reason)` is reported.
+
+    Near-duplicate questions are handled per `on_duplicate` (see
+    _save_card_rows); by default they are saved and flagged. A card merged
+    with MERGE takes over the stored card: its dict gets that card's
+    question, answer and schedule, so reviewing it carries on from the
+    user's progress.
+    """
+    rows, failures = _card_rows(user_id, cards)
+    if not rows:
+        return [], failures
+
+    with get_connection() as conn:
+        try:
+            with conn:
+                ids, merged = _save_card_rows(conn, user_id, rows, on_duplicate)
+        except sqlite3.Error as e:
+            return [], failures + [(None, str(e))]
+        _adopt_merged(conn, cards, failures, ids, merged)
+    return ids, failures
+
+
+def _card_rows(user_id, cards):
+    rows, failures = [], []
+    for i, card in enumerate(cards):
+        question, answer = card.get("question"), card.get("answer")
+        if not question or not answer:
+            failures.append((i, "missing question or answer"))
+            continue
+        interval = card.get("interval", 1)
+        next_review = card.get("next_review") or (datetime.today() + timedelta(days=interval)).date()
+        rows.append((user_id, question, answer, interval, card.get("ease", 2.5), _iso_date(next_review)))
+    return rows, failures
+
+
+def _insert_card_rows(conn, rows):
+    if not rows:
+        return []
+    conn.executemany("""
+        INSERT INTO flashcards (user_id, question, answer, interval, ease, next_review)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, rows)
+    # The write lock is held for the whole transaction, so the
+    # AUTOINCREMENT ids of this batch are contiguous
+    last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    return list(range(last_id - len(rows) + 1, last_id + 1))
+
+
+def _save_card_rows(conn, user_id, rows, on_duplicate=FLAG):
+    """
+    Insert `rows` and add them to the near-duplicate index. A row whose
+    question is a near-duplicate of one of the user's cards, or of an earlier
+    row, is inserted and recorded in card_minhash.duplicate_of with FLAG;
+    MERGE doesn't insert it and returns the id it matched for it. None skips
+    the check. Returns `(ids, merged)`, `merged` being the positions of the
+    merged rows.
+    """
+    if not rows:
+        return [], []
+    questions = [row[1] for row in rows]
+    if on_duplicate is None:
+        ids = _insert_card_rows(conn, rows)
+        dedup.index_cards(conn, user_id, ids, dedup.signatures(questions))
+        return ids, []
+
+    sigs, matches = dedup.match_questions(conn, user_id, questions)
+    merged = [i for i, match in enumerate(matches) if match is not None] if on_duplicate == dedup.MERGE else []
+    keep = sorted(set(range(len(rows))) - set(merged))
+    ids = [None] * len(rows)
+    new_ids = _insert_card_rows(conn, [rows[i] for i in keep])
+    for i, card_id in zip(keep, new_ids):
+        ids[i] = card_id
+    for i in merged:
+        # Batch matches always point at an earlier row, already resolved
+        ids[i] = matches[i][1] if matches[i][0] == "card" else ids[matches[i][1]]
+    flagged = [None if matches[i] is None else matches[i][1] if matches[i][0] == "card" else ids[matches[i][1]]
+               for i in keep]
+    dedup.index_cards(conn, user_id, new_ids, sigs[keep], flagged)
+    return ids, merged
+
+
+def _adopt_merged(conn, cards, failures, ids, merged):
+    """Copy the stored card onto each card dict that was merged into it."""
+    if not merged:
+        return
+    failed = {i for i, _ in failures}
+    saved = [card for i, card in enumerate(cards) if i not in failed]
+    merged_ids = sorted({ids[i] for i in merged})
+    stored = {}
+    for start in range(0, len(merged_ids), dedup.QUERY_CHUNK):
+        chunk = merged_ids[start:start + dedup.QUERY_CHUNK]
+        for row in conn.execute(f"SELECT {_CARD_COLUMNS} FROM flashcards WHERE id IN ({','.join('?' * len(chunk))})",
+                                chunk):
+            stored[row[0]] = row
+    for i in merged:
+        row = stored.get(ids[i])
+        if row is not None:
+            for key, value in zip(_CARD_COLUMNS.split(", "), (*row[:5], str(row[5]))):
+                saved[i][key] = value
+
+
+# Save a deck from the batch pipeline together with its completion marker
+@traced("db.save_generated_deck", count="cards")
+def save_generated_deck(user_id, deck_key, cards, source=None, on_duplicate=FLAG):
+    """
+    Like save_flashcards, but also records `deck_key` in generated_decks in
+    the same transaction, so a deck is either saved whole and marked done or
+    not at all. Saving a key that is already recorded raises IntegrityError.
+    """
+    rows, failures = _card_rows(user_id, cards)
+    with get_connection() as conn:
+        with conn:
+            ids, merged = _save_card_rows(conn, user_id, rows, on_duplicate)
+            conn.execute("""
+                INSERT INTO generated_decks (user_id, deck_key, source, card_count, created)
+                VALUES (?, ?, ?, ?, ?)
+            """, (user_id, deck_key, source, len(ids), time.time()))
+        _adopt_merged(conn, cards, failures, ids, merged)
+    return ids, failures
+
+
+@traced("db.get_generated_decks")
+def get_generated_decks(user_id):
+    """Keys of every deck already saved by save_generated_deck for `user_id`."""
+    with get_connection() as conn:
+        rows = conn.execute("SELECT deck_key FROM generated_decks WHERE user_id = ?", (user_id,))
+        return {key for key, in rows}
+
+
+class Card:
+    """One flashcard. Slotted to keep large decks small in memory, and
+    subscriptable like the dicts produced by the parser."""
+
+    __slots__ = ("id", "question", "answer", "interval", "ease", "next_review", "options")
+
+    def __init__(self, id, question, answer, interval=1, ease=2.5, next_review=None, options=None):
+        self.id = id
+        self.question = question
+        self.answer = answer
+        self.interval = interval
+        self.ease = ease
+        self.next_review = next_review
+        self.options = options
+
+    def __getitem__(self, key):
+        try:
+            value = getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+        if value is None and key in ("id", "options"):
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__ and getattr(self, key) is not None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return f"Card(id={self.id!r}, question={self.question!r})"
+
+
+_CARD_COLUMNS = "id, question, answer, interval, ease, next_review"
+
+
+def _row_to_card(row):
+    return Card(row[0], row[1], row[2], row[3], row[4], str(row[5]))
+
+
+# Get all flashcards for a user
+@traced("db.get_flashcards")
+def get_flashcards(user_id):
+    with get_connection() as conn:
+        rows = conn.execute(f"""
+            SELECT {_CARD_COLUMNS}
+            FROM flashcards
+            WHERE user_id = ?
+        """, (user_id,)).fetchall()
+    return [_row_to_card(row) for row in rows]
+
+
+@traced("db.count_flashcards")
+def count_flashcards(user_id):
+    """Returns `(count, max_id)` for a user's deck."""
+    with get_connection() as conn:
+        return conn.execute("SELECT COUNT(*), MAX(id) FROM flashcards WHERE user_id = ?",
+                            (user_id,)).fetchone()
+
+
+# One page of a user's deck in id order
+@traced("db.get_flashcards_page")
+def get_flashcards_page(user_id, after_id=None, before_id=None, limit=PAGE_SIZE, offset=0):
+    """
+    Keyset pagination: pass the last id seen as `after_id` for the next page
+    or the first id seen as `before_id` for the previous one. Without either,
+    `offset` picks the page (only used when jumping).
+    """
+    with get_connection() as conn:
+        if after_id is not None:
+            rows = conn.execute(f"""
+                SELECT {_CARD_COLUMNS} FROM flashcards
+                WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?
+            """, (user_id, after_id, limit)).fetchall()
+        elif before_id is not None:
+            rows = conn.execute(f"""
+                SELECT {_CARD_COLUMNS} FROM flashcards
+                WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT ?
+            """, (user_id, before_id, limit)).fetchall()
+            rows.reverse()
+        else:
+            rows = conn.execute(f"""
+                SELECT {_CARD_COLUMNS} FROM flashcards
+                WHERE user_id = ? ORDER BY id LIMIT ? OFFSET ?
+            """, (user_id, limit, offset)).fetchall()
+    return [_row_to_card(row) for row in rows]
+
+
+def _search_query(text):
+    """Turn free text into an FTS5 query: every word must match, the last one
+    as a prefix so results show up while a word is still being typed."""
+    words = _WORD_RE.findall(text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+@traced("db.search_flashcards")
+def search_flashcards(user_id, text, limit=SEARCH_PAGE_SIZE, offset=0):
+    """
+    Cards of `user_id` whose question or answer contains every word of
+    `text`, best match first (BM25, question hits weighted above answer
+    hits). Returns `(cards, has_more)` for the page at `offset`.
+    """
+    query = _search_query(text)
+    if query is None:
+        return [], False
+    columns = ", ".join(f"f.{column}" for column in _CARD_COLUMNS.split(", "))
+    first = user_id << OWNER_SHIFT
+    with get_connection() as conn:
+        # The rowid range keeps the MATCH inside this user's postings
+        rows = conn.execute(f"""
+            SELECT {columns} FROM flashcards_fts
+            JOIN flashcards f ON f.id = flashcards_fts.rowid - ?
+            WHERE flashcards_fts MATCH ? AND flashcards_fts.rowid BETWEEN ? AND ? AND f.user_id = ?
+            ORDER BY bm25(flashcards_fts, ?, ?)
+            LIMIT ? OFFSET ?
+        """, (first, query, first, first + (1 << OWNER_SHIFT) - 1, user_id,
+              *SEARCH_WEIGHTS, limit + 1, offset)).fetchall()
+    return [_row_to_card(row) for row in rows[:limit]], len(rows) > limit
+
+
+class DeckPager:
+    """A user's saved deck as a sequence that only holds one window of cards.
+
+    Indexing, len() and iteration behave like a list, so the review screen
+    can page through decks of any size. Stepping to a neighbouring card that
+    is outside the window fetches the next or previous page by keyset and
+    keeps PAGE_PREFETCH cards of the old window; any other jump reloads the
+    window at that position.
+    """
+
+    def __init__(self, user_id, page_size=PAGE_SIZE, prefetch=PAGE_PREFETCH):
+        self.user_id = user_id
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self._total, self._max_id = count_flashcards(user_id)
+        self._start = 0
+        self._cards = []
+
+    def __len__(self):
+        return self._total
+
+    @property
+    def version(self):
+        # Saved cards never change text, so count and newest id identify the deck
+        return f"deck:{self.user_id}:{self._total}:{self._max_id}"
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += self._total
+        if not 0 <= position < self._total:
+            raise IndexError(position)
+        if not 0 <= position - self._start < len(self._cards):
+            self._load(position)
+        return self._cards[position - self._start]
+
+    def __setitem__(self, position, card):
+        self[position]
+        self._cards[position - self._start] = card
+
+    def __iter__(self):
+        after_id = None
+        while True:
+            page = get_flashcards_page(self.user_id, after_id=after_id, limit=self.page_size)
+            if not page:
+                return
+            yield from page
+            after_id = page[-1].id
+
+    def _load(self, position):
+        end = self._start + len(self._cards)
+        if self._cards and position == end:
+            page = get_flashcards_page(self.user_id, after_id=self._cards[-1].id, limit=self.page_size)
+            kept = self._cards[-self.prefetch:] if self.prefetch else []
+            self._start, self._cards = end - len(kept), kept + page
+        elif self._cards and position == self._start - 1:
+            page = get_flashcards_page(self.user_id, before_id=self._cards[0].id, limit=self.page_size)
+            self._start, self._cards = self._start - len(page), page + self._cards[:self.prefetch]
+        elif position == self._total - 1:
+            # Wrapping backwards from the first card lands on the last page
+            page = get_flashcards_page(self.user_id, before_id=self._max_id + 1, limit=self.page_size)
+            self._start, self._cards = self._total - len(page), page
+        else:
+            start = position - position % self.page_size
+            self._start = start
+            self._cards = get_flashcards_page(self.user_id, limit=self.page_size, offset=start)
+
+
+# Get flashcards due for review, most urgent first
+@traced("db.get_due_flashcards")
+def get_due_flashcards(user_id):
+    today = datetime.today().date()
+    with get_connection() as conn:
+        rows = conn.execute("""
+            SELECT id, question, answer, interval, ease, next_review
+            FROM flashcards
+            WHERE user_id = ? AND next_review <= ?
+        """, (user_id, today.isoformat())).fetchall()
+    schedule = DeckSchedule.from_rows([(row[0], row[3], row[4], row[5]) for row in rows])
+    return [rows[i] for i in schedule.due_order(today)]
+
+@traced("db.get_due_forecast")
+def get_due_forecast(user_id, days=30, today=None):
+    """Number of `user_id`'s cards falling due on each of the next `days`
+    days, from due_counts; anything already overdue counts towards today
+    (as in DeckSchedule.forecast). Reads one row per day with cards due."""
+    today = today or datetime.today().date()
+    end = today + timedelta(days=days)
+    forecast = [0] * days
+    with get_connection() as conn:
+        rows = conn.execute("""
+            SELECT max(day, ?), sum(cards) FROM due_counts
+            WHERE user_id = ? AND day < ?
+            GROUP BY max(day, ?)
+        """, (today.isoformat(), user_id, end.isoformat(), today.isoformat())).fetchall()
+    start = today.toordinal()
+    for day, cards in rows:
+        forecast[date.fromisoformat(day).toordinal() - start] = cards
+    return forecast
+
+
+@traced("db.get_due_count")
+def get_due_count(user_id, today=None):
+    """How many of `user_id`'s cards are due by `today`."""
+    today = today or datetime.today().date()
+    with get_connection() as conn:
+        row = conn.execute("SELECT sum(cards) FROM due_counts WHERE user_id = ? AND day <= ?",
+                           (user_id, _iso_date(today))).fetchone()
+    return row[0] or 0
+
+
+@traced("db.check_due_counts")
+def check_due_counts(repair=False):
+    """Recount due days from flashcards and compare them with due_counts.
+
+    Returns the `(user_id, day, stored, actual)` rows that differ (stored or
+    actual is 0 where one side has no row). With `repair`, due_counts is
+    rebuilt from the recount in the same transaction.
+    """
+    with get_connection() as conn, conn:
+        conn.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS due_recount (
+                user_id INTEGER NOT NULL, day TEXT NOT NULL, cards INTEGER NOT NULL,
+                PRIMARY KEY (user_id, day)
+            ) WITHOUT ROWID
+        """)
+        # One snapshot for the recount and the comparison; a repair also
+        # keeps writers out until the rebuilt table is in place
+        conn.execute("BEGIN IMMEDIATE" if repair else "BEGIN")
+        conn.execute("DELETE FROM due_recount")
+        conn.execute("""
+            INSERT INTO due_recount (user_id, day, cards)
+            SELECT user_id, next_review, count(*) FROM flashcards
+            WHERE user_id IS NOT NULL AND next_review IS NOT NULL
+            GROUP BY user_id, next_review
+        """)
+        mismatches = conn.execute("""
+            SELECT s.user_id, s.day, s.cards, coalesce(r.cards, 0) FROM due_counts s
+            LEFT JOIN due_recount r ON r.user_id = s.user_id AND r.day = s.day
+            WHERE r.cards IS NOT s.cards
+            UNION ALL
+            SELECT r.user_id, r.day, 0, r.cards FROM due_recount r
+            WHERE NOT EXISTS (SELECT 1 FROM due_counts s WHERE s.user_id = r.user_id AND s.day = r.day)
+            ORDER BY 1, 2
+        """).fetchall()
+        if repair and mismatches:
+            conn.execute("DELETE FROM due_counts")
+            conn.execute("INSERT INTO due_counts SELECT user_id, day, cards FROM due_recount")
+        conn.execute("DELETE FROM due_recount")
+    return mismatches
+
+
+# Update flashcard review using a simplified SuperMemo 2 algorithm
+@traced("db.update_flashcard_review")
+def update_flashcard_review(card_id, quality):
+    """
+    `quality` should be an integer from 0 to 5:
+    5 - perfect response
+    4 - correct response after hesitation
+    3 - correct response with difficulty
+    2 or less - incorrect or complete blackout
+
+    The score is mapped onto the shared scheduler's grades (see scheduling.py).
+    """
+    today = date.today()
+    with get_connection() as conn, conn:
+        # Fetch current interval and ease
+        row = conn.execute("SELECT interval, ease, next_review, user_id FROM flashcards WHERE id = ?",
+                           (card_id,)).fetchone()
+
+        if not row:
+            return False
+
+        card_grade = int(quality_to_grade(quality))
+        interval, ease = grade([row[0]], [row[1]], [card_grade], _user_params(conn, row[3]))
+        interval, ease = int(interval[0]), float(ease[0])
+        next_review = _iso_date((datetime.today() + timedelta(days=interval)).date())
+
+        conn.execute("""
+            UPDATE flashcards
+            SET interval = ?, ease = ?, next_review = ?
+            WHERE id = ?
+        """, (interval, ease, next_review, card_id))
+        _insert_review_log(conn, [(row[3], card_id, today.toordinal(), card_grade,
+                                   elapsed_days(row[0], row[2], today), row[0], row[1])])
+    return True
+
+
+def _update_card_rows(conn, rows):
+    cursor = conn.executemany("""
+        UPDATE flashcards
+        SET interval = ?, ease = ?, next_review = ?
+        WHERE id = ? AND user_id = ?
+    """, rows)
+    return cursor.rowcount
+
+
+def _insert_review_log(conn, entries):
+    conn.executemany("""
+        INSERT INTO review_log (user_id, card_id, reviewed, grade, elapsed, interval, ease)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, entries)
+
+
+# Review outcomes plus their review_log entries, in one transaction
+@traced("db.record_reviews", count="entries")
+def record_reviews(user_id, updates, entries):
+    """
+    `updates` is an iterable of `(card_id, interval, ease, next_review)`.
+    Rows are matched on id and owner, so a stale id can never touch another
+    user's cards. `entries` are review_log rows
+    `(user_id, card_id, reviewed, grade, elapsed, interval, ease)`, with
+    `reviewed` a date ordinal and interval and ease as they were before the
+    review; every updated card needs at least one. Returns the number of
+    cards updated.
+    """
+    rows = [(interval, ease, _iso_date(next_review), card_id, user_id)
+            for card_id, interval, ease, next_review in updates]
+    unlogged = {row[3] for row in rows} - {entry[1] for entry in entries}
+    if unlogged:
+        raise ValueError(f"No review_log entry for cards {sorted(unlogged)}")
+    with get_connection() as conn, conn:
+        _insert_review_log(conn, entries)
+        return _update_card_rows(conn, rows) if rows else 0
+
+
+def _user_params(conn, user_id):
+    row = conn.execute(f"SELECT {', '.join(Params._fields)} FROM user_params WHERE user_id = ?",
+                       (user_id,)).fetchone()
+    return Params(*row) if row else DEFAULT_PARAMS
+
+
+@traced("db.get_user_params")
+def get_user_params(user_id):
+    """The scheduling parameters fitted for `user_id`, or DEFAULT_PARAMS."""
+    with get_connection() as conn:
+        return _user_params(conn, user_id)
+
+
+@traced("db.save_user_params", count="fits")
+def save_user_params(fits):
+    """Store fitted parameters; `fits` maps user_id -> `(params, reviews)`."""
+    fitted = time.time()
+    with get_connection() as conn, conn:
+        conn.executemany(f"""
+            INSERT OR REPLACE INTO user_params (user_id, {', '.join(Params._fields)}, reviews, fitted)
+            VALUES ({', '.join('?' * (len(Params._fields) + 3))})
+        """, [(user_id, *map(float, params), reviews, fitted) for user_id, (params, reviews) in fits.items()])
+
+
+class ReviewBuffer:
+    """Write-behind buffer for one user's review outcomes.
+
+    Reviews are collected in memory (a later review of the same card replaces
+    the earlier one) and written once `max_pending` cards are waiting or the
+    oldest pending review is `max_age` seconds old. Every review also queues
+    a review_log entry; entries are appended in the same transaction as the
+    card updates. Call flush() when the session ends.
+    """
+
+    def __init__(self, user_id, max_pending=20, max_age=30.0):
+        self.user_id = user_id
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self._pending = {}
+        self._log = []
+        self._params = None
+        self._lock = threading.Lock()
+        # Held across the write so a timer flush and a session flush commit
+        # in the order they took their batches
+        self._flush_lock = threading.Lock()
+        self._timer = None
+        self._first_added = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    @property
+    def params(self):
+        # Loaded on first use; refitted parameters apply from the next session
+        if self._params is None:
+            self._params = get_user_params(self.user_id)
+        return self._params
+
+    def review(self, card, feedback, today=None):
+        """Grade `card` with this user's parameters (see scheduling.review_card)
+        and queue the outcome if the card is saved. Returns the card."""
+        today = today or date.today()
+        interval, ease, next_review = card["interval"], card["ease"], card.get("next_review")
+        review_card(card, feedback, today, self.params)
+        card_id = card.get("id")
+        if card_id is not None:
+            entry = (self.user_id, card_id, today.toordinal(), FEEDBACK_GRADES[feedback],
+                     elapsed_days(interval, next_review, today), interval, ease)
+            self.add(card_id, card["interval"], card["ease"], card["next_review"], entry)
+        return card
+
+    def add(self, card_id, interval, ease, next_review, log_entry):
+        with self._lock:
+            if not self._pending:
+                self._first_added = time.monotonic()
+                # Make sure an idle session still gets written out
+                self._timer = threading.Timer(self.max_age, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+            self._pending[card_id] = (interval, ease, next_review)
+            self._log.append(log_entry)
+            due = (len(self._pending) >= self.max_pending
+                   or time.monotonic() - self._first_added >= self.max_age)
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                log, self._log = self._log, []
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not pending:
+                return 0
+            try:
+                return record_reviews(self.user_id, [(card_id,) + outcome for card_id, outcome in pending.items()], log)
+            except sqlite3.Error:
+                # Put the batch back (without overwriting newer reviews) so the
+                # next flush retries it
+                with self._lock:
+                    for card_id, outcome in pending.items():
+                        self._pending.setdefault(card_id, outcome)
+                    self._log[:0] = log
+                raise
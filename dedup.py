@@ -0,0 +1,260 @@
+"""Near-duplicate detection for flashcard questions with MinHash and LSH.
+
+A question is reduced to its content words: normalised, without stopwords
+or plural s, so rewordings such as "What role do mitochondria play in
+respiration?" and "What is the role of mitochondria in respiration?" come
+out the same. Each word set gets a MinHash signature of NUM_PERM values,
+cut into BANDS bands of ROWS values. Two questions whose signatures agree
+on a whole band land in the same LSH bucket and become candidates, so an
+insert looks at a handful of buckets, each capped at MAX_FANOUT cards, not
+at every card the user owns.
+
+Candidates are ranked by estimated Jaccard similarity (the fraction of
+equal signature values) and the best VERIFY are scored exactly on their
+word sets with score(). A word missing from the other question costs one
+point; a word swapped for another costs SWAP_PENALTY, since "the worst
+case" versus "the average case" asks something else while "What is the
+function of mitochondria?" versus "What function do mitochondria serve?"
+only adds a word. Numbers must agree, so "concept 3" never matches
+"concept 4". Questions scoring DUPLICATE_THRESHOLD or more are duplicates.
+
+Signatures and buckets live in the card_minhash and card_lsh tables next to
+the flashcards (see the migrations in database.py; triggers drop a card's
+entries when it is deleted or changes). Functions here take an open
+connection so they run inside the caller's transaction.
+"""
+import re
+import zlib
+
+import numpy as np
+
+NUM_PERM = 60
+BANDS = 20
+ROWS = NUM_PERM // BANDS
+DUPLICATE_THRESHOLD = 0.6
+SWAP_PENALTY = 3
+# Candidates below this estimated Jaccard similarity are never scored, and
+# at most VERIFY of the rest are
+CANDIDATE_SIMILARITY = 0.25
+VERIFY = 4
+# Candidates taken from one bucket; templated decks put thousands of cards
+# in the same few buckets
+MAX_FANOUT = 32
+# Ids per IN (...) query, well under SQLite's parameter limit
+QUERY_CHUNK = 500
+# Bucket lookups per compound query, under SQLite's limit of 500 terms
+COMPOUND_CHUNK = 200
+MERGE, FLAG = "merge", "flag"
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+    a an the of in on at to for from by with and or but is are was were be been being
+    do does did what which who whom whose when where why how that this these those it its
+    as into about than then there their they them can could would should will shall may
+    might must has have had not no explain describe define name give state list
+    role play part way context main purpose important example mean meaning
+""".split())
+
+_PRIME = (1 << 32) + 15
+_rng = np.random.default_rng(20240601)
+# Fixed seed: signatures are stored, so the permutations must never change
+_A = _rng.integers(1, 1 << 32, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 1 << 32, NUM_PERM, dtype=np.uint64)
+_BAND_MIX = _rng.integers(1, 1 << 63, ROWS, dtype=np.uint64) | np.uint64(1)
+
+
+def normalize(question):
+    """Content words of `question`, lowercased, with plural s dropped."""
+    words = []
+    for word in TOKEN_RE.findall(question.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+
+def content_words(question):
+    """Set of content words of `question`; questions with none stand for
+    themselves."""
+    return set(normalize(question)) or {question.strip().lower()}
+
+
+def score(words, other):
+    """Similarity of two content-word sets, from 0 to 1 (see the module docstring)."""
+    if {word for word in words if any(c.isdigit() for c in word)} != \
+            {word for word in other if any(c.isdigit() for c in word)}:
+        return 0.0
+    common = len(words & other)
+    if not common:
+        return 0.0
+    swapped, added = sorted((len(words - other), len(other - words)))
+    return common / (common + added + SWAP_PENALTY * swapped)
+
+
+def signatures(questions):
+    """MinHash signatures of `questions` as an (n, NUM_PERM) uint32 array."""
+    hashes, owners = [], []
+    for i, question in enumerate(questions):
+        for word in content_words(question):
+            hashes.append(zlib.crc32(word.encode()))
+            owners.append(i)
+    if not hashes:
+        return np.zeros((0, NUM_PERM), dtype=np.uint32)
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    owners = np.asarray(owners)
+    # a*h + b stays below 2**64 because a, b and h are all below 2**32
+    permuted = (hashes[:, None] * _A + _B) % np.uint64(_PRIME)
+    starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+    return np.minimum.reduceat(permuted, starts, axis=0).astype(np.uint32)
+
+
+def buckets(sigs):
+    """LSH bucket of every band of every signature, as (n, BANDS) int64;
+    the band number is mixed in so equal values in different bands differ."""
+    bands = sigs.reshape(len(sigs), BANDS, ROWS).astype(np.uint64)
+    mixed = (bands * _BAND_MIX).sum(axis=2, dtype=np.uint64)
+    mixed ^= np.arange(BANDS, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    return mixed.view(np.int64)
+
+
+def similarity(sig, others):
+    """Estimated Jaccard similarity of one signature with each row of `others`."""
+    return (others == sig).mean(axis=1)
+
+
+def _candidates(conn, user_id, wanted):
+    """Map bucket -> card ids (at most MAX_FANOUT) for the given buckets of `user_id`."""
+    found = {}
+    wanted = list(wanted)
+    # One capped lookup per bucket, so a huge bucket costs MAX_FANOUT rows
+    for start in range(0, len(wanted), COMPOUND_CHUNK):
+        chunk = wanted[start:start + COMPOUND_CHUNK]
+        lookup = "SELECT * FROM (SELECT bucket, card_id FROM card_lsh WHERE user_id = ? AND bucket = ? LIMIT ?)"
+        rows = conn.execute(" UNION ALL ".join([lookup] * len(chunk)),
+                            [value for bucket in chunk for value in (user_id, bucket, MAX_FANOUT)])
+        for bucket, card_id in rows:
+            found.setdefault(bucket, []).append(card_id)
+    return found
+
+
+def _load_signatures(conn, card_ids):
+    """Questions and signatures of those of `card_ids` that still exist, as
+    `(ids, questions, matrix)`."""
+    ids, questions, blobs = [], [], []
+    card_ids = list(card_ids)
+    for start in range(0, len(card_ids), QUERY_CHUNK):
+        chunk = card_ids[start:start + QUERY_CHUNK]
+        rows = conn.execute(f"""
+            SELECT m.card_id, f.question, m.signature FROM card_minhash m
+            JOIN flashcards f ON f.id = m.card_id AND f.user_id = m.user_id
+            WHERE m.card_id IN ({",".join("?" * len(chunk))})
+        """, chunk)
+        for card_id, question, blob in rows:
+            ids.append(card_id)
+            questions.append(question)
+            blobs.append(blob)
+    return ids, questions, np.frombuffer(b"".join(blobs), dtype=np.uint32).reshape(len(ids), NUM_PERM)
+
+
+def _best(sig, words, rows, words_at, sigs, threshold):
+    """Position in `rows` (indices into `sigs`) of the best match for one
+    question and its score; (None, 0) if none reaches `threshold`. Estimates
+    for all rows come from one vectorised call; only the top VERIFY are
+    scored exactly, with the content words from `words_at(row)`."""
+    if not len(rows):
+        return None, 0.0
+    estimates = similarity(sig, sigs[rows])
+    order = np.argsort(-estimates, kind="stable")[:VERIFY]
+    best, best_score = None, 0.0
+    for k in order[estimates[order] >= CANDIDATE_SIMILARITY]:
+        s = score(words, words_at(rows[k]))
+        if s >= threshold and s > best_score:
+            best, best_score = int(rows[k]), s
+    return best, best_score
+
+
+def match_questions(conn, user_id, questions, threshold=DUPLICATE_THRESHOLD):
+    """Find a near-duplicate for each of `questions` among `user_id`'s indexed
+    cards and the earlier questions of the same batch.
+
+    Returns `(sigs, matches)`: the signatures and per question None, or
+    `("card", card_id)` for an existing card, or `("batch", index)` for an
+    earlier question in `questions`.
+    """
+    sigs = signatures(questions)
+    words = [content_words(question) for question in questions]
+    bands = buckets(sigs).tolist()
+    stored = _candidates(conn, user_id, {bucket for row in bands for bucket in row})
+    stored_ids, stored_questions, stored_sigs = _load_signatures(
+        conn, {card_id for ids in stored.values() for card_id in ids})
+    row_of = {card_id: j for j, card_id in enumerate(stored_ids)}
+    stored_words = {}
+
+    def stored_words_at(j):
+        if j not in stored_words:
+            stored_words[j] = content_words(stored_questions[j])
+        return stored_words[j]
+
+    matches, batch = [], {}
+    for i, row in enumerate(bands):
+        best = None
+        rows = np.array(sorted({row_of[card_id] for bucket in row for card_id in stored.get(bucket, ())
+                                if card_id in row_of}), dtype=np.int64)
+        j, best_score = _best(sigs[i], words[i], rows, stored_words_at, stored_sigs, threshold)
+        if j is not None:
+            best = ("card", stored_ids[j])
+        earlier = np.array(sorted({j for bucket in row for j in batch.get(bucket, ())}), dtype=np.int64)
+        j, s = _best(sigs[i], words[i], earlier, words.__getitem__, sigs, threshold)
+        if j is not None and s > best_score:
+            best = ("batch", j)
+        matches.append(best)
+        for bucket in row:
+            members = batch.setdefault(bucket, [])
+            if len(members) < MAX_FANOUT:
+                members.append(i)
+    return sigs, matches
+
+
+def index_cards(conn, user_id, card_ids, sigs, duplicate_of=None):
+    """Store signatures and buckets for newly inserted cards.
+    `duplicate_of` optionally gives, per card, the id of the card it was
+    flagged against."""
+    if not len(card_ids):
+        return
+    duplicate_of = duplicate_of or [None] * len(card_ids)
+    conn.executemany(
+        "INSERT OR REPLACE INTO card_minhash (card_id, user_id, signature, duplicate_of) VALUES (?, ?, ?, ?)",
+        [(card_id, user_id, sig.tobytes(), dup) for card_id, sig, dup in zip(card_ids, sigs, duplicate_of)])
+    # In key order the inserts append to the index instead of landing all over it
+    conn.executemany(
+        "INSERT OR IGNORE INTO card_lsh (user_id, bucket, card_id) VALUES (?, ?, ?)",
+        sorted((user_id, bucket, card_id)
+               for card_id, row in zip(card_ids, buckets(sigs).tolist()) for bucket in row))
+
+
+def index_missing(conn, batch_size=10000):
+    """Index cards that have no signature yet (saved before the index existed,
+    through save_flashcard, or edited since). Returns how many were indexed."""
+    total = 0
+    while True:
+        rows = conn.execute("""
+            SELECT f.id, f.user_id, f.question FROM flashcards f
+            LEFT JOIN card_minhash m ON m.card_id = f.id
+            WHERE m.card_id IS NULL AND f.question IS NOT NULL
+            ORDER BY f.user_id LIMIT ?
+        """, (batch_size,)).fetchall()
+        if not rows:
+            return total
+        with conn:
+            start = 0
+            while start < len(rows):
+                user_id = rows[start][1]
+                stop = start
+                while stop < len(rows) and rows[stop][1] == user_id:
+                    stop += 1
+                group = rows[start:stop]
+                index_cards(conn, user_id, [row[0] for row in group], signatures([row[2] for row in group]))
+                start = stop
+        total += len(rows)
@@ -0,0 +1,108 @@
+"""PDF export of flashcard decks, built on demand and cached by deck content."""
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from hashlib import sha256
+
+FONT = "Helvetica"
+FONT_SIZE = 11
+LINE_HEIGHT = 15
+MARGIN = 50
+CARD_GAP = 20
+EXPORT_CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+# version -> (path, size in bytes), least recently used first
+_exports = OrderedDict()
+_export_bytes = 0
+_exports_lock = threading.Lock()
+# Created with the first export and removed when the process exits
+_export_dir = None
+
+
+def _export_directory():
+    global _export_dir
+    with _exports_lock:
+        if _export_dir is None:
+            _export_dir = tempfile.mkdtemp(prefix="flashcard-exports-")
+            atexit.register(shutil.rmtree, _export_dir, ignore_errors=True)
+        return _export_dir
+
+
+def deck_version(flashcards):
+    """Hash of everything that appears in the export; changes whenever a card does.
+    Paged decks (database.DeckPager) supply their own cheap version."""
+    version = getattr(flashcards, "version", None)
+    if version is not None:
+        return sha256(version.encode()).hexdigest()
+    digest = sha256()
+    for card in flashcards:
+        digest.update(card["question"].encode())
+        digest.update(b"\0")
+        digest.update(card["answer"].encode())
+        digest.update(b"\1")
+    return digest.hexdigest()
+
+
+def write_flashcards_pdf(flashcards, path):
+    """Render the deck to `path`, wrapping long questions and answers to the page width."""
+    # ReportLab is only needed once someone exports, so keep it off the startup path
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.utils import simpleSplit
+    from reportlab.pdfgen import canvas
+
+    width, height = A4
+    text_width = width - 2 * MARGIN
+    p = canvas.Canvas(path, pagesize=A4)
+    p.setFont(FONT, FONT_SIZE)
+    y = height - MARGIN
+
+    for i, card in enumerate(flashcards, 1):
+        for label, text in ((f"Q{i}: ", card["question"]), (f"A{i}: ", card["answer"])):
+            for paragraph in (label + text).split("\n"):
+                for line in simpleSplit(paragraph, FONT, FONT_SIZE, text_width) or [""]:
+                    if y < MARGIN:
+                        p.showPage()
+                        p.setFont(FONT, FONT_SIZE)
+                        y = height - MARGIN
+                    p.drawString(MARGIN, y, line)
+                    y -= LINE_HEIGHT
+        y -= CARD_GAP
+
+    p.save()
+
+
+def get_flashcards_pdf(flashcards, version=None):
+    """Return the path of the PDF for this deck, building it only if this exact
+    deck has not been exported before. Exports are shared between sessions and
+    the least recently used files are removed once they take up more than
+    EXPORT_CACHE_MAX_BYTES; the newest export is always kept."""
+    global _export_bytes
+    version = version or deck_version(flashcards)
+    with _exports_lock:
+        entry = _exports.get(version)
+        if entry is not None and os.path.exists(entry[0]):
+            _exports.move_to_end(version)
+            return entry[0]
+
+    path = os.path.join(_export_directory(), f"{version}.pdf")
+    # Write under a temporary name so a concurrent reader never sees half a file
+    partial = f"{path}.{threading.get_ident()}.part"
+    write_flashcards_pdf(flashcards, partial)
+    os.replace(partial, path)
+    size = os.path.getsize(path)
+
+    with _exports_lock:
+        old = _exports.pop(version, None)
+        if old is not None:
+            _export_bytes -= old[1]
+        _exports[version] = (path, size)
+        _export_bytes += size
+        while _export_bytes > EXPORT_CACHE_MAX_BYTES and len(_exports) > 1:
+            _, (old_path, old_size) = _exports.popitem(last=False)
+            _export_bytes -= old_size
+            if os.path.exists(old_path):
+                os.remove(old_path)
+    return path
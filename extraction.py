@@ -0,0 +1,159 @@
+"""Text extraction from uploaded PDFs."""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+from io import BytesIO
+
+import cache
+from tracing import span
+
+# Documents shorter than this are parsed serially; process start-up and
+# re-opening the PDF in every worker would cost more than it saves
+PARALLEL_MIN_PAGES = 32
+EXTRACT_WORKERS = os.cpu_count() or 1
+# Each worker gets several smaller ranges so uneven pages balance out
+CHUNKS_PER_WORKER = 4
+# Workers start from a clean process instead of a fork of the app, whose
+# other threads (the web server, review flush timers, the model scheduler)
+# may hold locks at the moment of the fork
+_MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+
+def read_bytes(file):
+    # Streamlit's UploadedFile, any binary file object, raw bytes or a path
+    if isinstance(file, (bytes, bytearray)):
+        return bytes(file)
+    if hasattr(file, "getvalue"):
+        return file.getvalue()
+    if hasattr(file, "read"):
+        file.seek(0)
+        return file.read()
+    with open(file, "rb") as f:
+        return f.read()
+
+
+def document_hash(data):
+    return sha256(data).hexdigest()
+
+
+def _open_pdf(data, pages=None):
+    # pdfplumber (and pdfminer under it) is slow to import; only pay for it
+    # once a document is actually parsed
+    import pdfplumber
+    return pdfplumber.open(BytesIO(data), pages=pages)
+
+
+def _page_text(page):
+    text = page.extract_text() or ""
+    # Drop the page's layout objects; only the text is kept
+    page.flush_cache()
+    return text
+
+
+_worker_data = None
+
+
+def _init_worker(data):
+    # Ship the document to each worker process once rather than once per range
+    global _worker_data
+    _worker_data = data
+
+
+def _parse_page_range(page_range):
+    start, stop = page_range
+    # pdfplumber page numbers are 1-based
+    with _open_pdf(_worker_data, pages=list(range(start + 1, stop + 1))) as pdf:
+        return [_page_text(page) for page in pdf.pages]
+
+
+def _parse_pages(data, workers=None):
+    workers = workers or EXTRACT_WORKERS
+    with _open_pdf(data) as pdf:
+        count = len(pdf.pages)
+        if workers <= 1 or count < PARALLEL_MIN_PAGES:
+            return [_page_text(page) for page in pdf.pages]
+
+    step = max(1, -(-count // (workers * CHUNKS_PER_WORKER)))
+    ranges = [(start, min(start + step, count)) for start in range(0, count, step)]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_MP_CONTEXT,
+                             initializer=_init_worker, initargs=(data,)) as pool:
+        # map() yields results in submission order, so pages stay in order
+        return [text for chunk in pool.map(_parse_page_range, ranges) for text in chunk]
+
+
+def extract_pages(file, workers=None):
+    """Return the text of every page, parsing the PDF only on a cache miss.
+
+    Long documents are split into page ranges parsed on `workers` processes
+    (default EXTRACT_WORKERS).
+    """
+    data = read_bytes(file)
+    with span("extract", bytes=len(data)) as s:
+        doc_hash = document_hash(data)
+        pages = cache.get_pdf_pages(doc_hash)
+        if pages is None:
+            pages = _parse_pages(data, workers)
+            cache.put_pdf_pages(doc_hash, pages)
+        else:
+            s.set(outcome="cached")
+        s.set(pages=len(pages), chars=sum(len(page) for page in pages))
+    return pages
+
+
+def extract_text(file, workers=None):
+    return "\n".join(page for page in extract_pages(file, workers) if page)
+
+
+def iter_pages(file):
+    """Yield the text of each page in order, parsing only as far as the caller reads.
+
+    Cached documents are served from the cache. A document read to the end
+    is stored in the cache; one abandoned part-way keeps the pages read so
+    far, and the next read resumes after them.
+    """
+    data = read_bytes(file)
+    doc_hash = document_hash(data)
+    pages = cache.get_pdf_pages(doc_hash)
+    if pages is not None:
+        yield from pages
+        return
+
+    parsed = cache.get_partial_pdf_pages(doc_hash) or []
+    known = len(parsed)
+    complete = False
+    try:
+        yield from parsed[:known]
+        with _open_pdf(data) as pdf:
+            for page in pdf.pages[known:]:
+                text = _page_text(page)
+                parsed.append(text)
+                yield text
+        complete = True
+    finally:
+        if complete:
+            cache.put_pdf_pages(doc_hash, parsed)
+        elif len(parsed) > known:
+            cache.put_partial_pdf_pages(doc_hash, parsed)
+
+
+def extract_head(file, max_chars):
+    """Return up to `max_chars` of text from the leading pages, without parsing
+    the rest of the document."""
+    parts, size = [], 0
+    pages = iter_pages(file)
+    with span("extract_head") as s:
+        try:
+            for text in pages:
+                if not text:
+                    continue
+                parts.append(text)
+                size += len(text) + 1
+                if size >= max_chars:
+                    break
+        finally:
+            pages.close()
+        head = "\n".join(parts)[:max_chars]
+        s.set(pages=len(parts), chars=len(head))
+    return head
@@ -0,0 +1,145 @@
+"""Offline stand-ins for external services, for benchmarks and local runs."""
+import hashlib
+import json
+import re
+import threading
+import time
+
+
+# Model outputs in the shapes build_prompt asks for, including the markdown
+# and chatter Gemini tends to add around them
+RECORDED_OUTPUTS = [
+    "Here are 6 flashcards:\n\n**Q:** What is photosynthesis?\n**A:** The process by which plants "
+    "convert light energy into chemical energy.\n\n**Q:** Where does it occur?\n**A:** In the chloroplasts.\n",
+    "## Flashcards\nQ: Define osmosis.\nA: Movement of water across a semi-permeable membrane\n"
+    "from low to high solute concentration.\n\nQ: What is diffusion?\nA: Net movement of particles\n"
+    "down a concentration gradient.",
+    "Q: What is the powerhouse of the cell?\nOptions:\na) Nucleus\nb) Mitochondria\nc) Ribosome\n"
+    "d) Golgi body\nAnswer: b\n\nQ: Which gas do plants absorb?\nOptions:\na) Oxygen\nb) Nitrogen\n"
+    "c) Carbon dioxide\nd) Helium\nAnswer: c\n",
+    "**Q: Which sorting algorithm has O(n log n) worst case?**\nOptions:\n  a) Quicksort\n  b) Merge sort\n"
+    "  c) Bubble sort\n  d) Insertion sort\nAnswer: B\nExplanation: merge sort always splits evenly.\n",
+    "Q: The ____ is the basic unit of life.\nAnswer: cell\n\nQ: DNA stands for ____ acid.\n"
+    "Answer: deoxyribonucleic\n\nQ: ____ is the study of heredity.\nAnswer: Genetics",
+    "Question: What does CPU stand for?\nAnswer: Central Processing Unit\nQuestion: What is RAM?\n"
+    "Answer: Random access memory, the\nworking memory of a computer.",
+    "Q: What is inertia? A: Resistance of a body to changes in its motion.\n"
+    "Q: State Newton's second law. A: F = ma.",
+    "I could not find enough content to generate flashcards.",
+]
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Drop-in replacement for genai.GenerativeModel's generate_content.
+
+    Sleeps for `latency` seconds per call and answers with `cards` flashcards
+    in the format requested by the prompt, derived deterministically from the
+    prompt text; a combined prompt gets a JSON array with as many cards as
+    it asks for of each type. `fail_every` makes every n-th call raise, to exercise retries.
+    With stream=True the latency is spread over `chunks` partial responses.
+    """
+
+    def __init__(self, latency=0.5, cards=6, fail_every=0, model_name="fake-model", chunks=24):
+        self.latency = latency
+        self.cards = cards
+        self.chunks = chunks
+        self.fail_every = fail_every
+        self.model_name = model_name
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, stream=False):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        if self.fail_every and call % self.fail_every == 0:
+            time.sleep(self.latency)
+            raise RuntimeError("fake model: simulated failure")
+        if stream:
+            return self._stream(self.render(prompt))
+        time.sleep(self.latency)
+        return FakeResponse(self.render(prompt))
+
+    def _stream(self, text):
+        size = -(-len(text) // self.chunks)
+        for start in range(0, len(text), size):
+            time.sleep(self.latency / self.chunks)
+            yield FakeResponse(text[start:start + size])
+
+    def render(self, prompt):
+        seed = hashlib.sha256(prompt.encode()).hexdigest()
+        if "JSON array" in prompt:
+            return self._render_json(prompt, seed)
+        blocks = []
+        for i in range(self.cards):
+            topic = f"concept {seed[i * 4:i * 4 + 4]}-{i}"
+            if "Options:" in prompt or "MCQ" in prompt:
+                blocks.append(f"Q: Which statement about {topic} is correct?\nOptions:\n"
+                              f"a) It is defined in the text\nb) It is unrelated\n"
+                              f"c) It is a chapter title\nd) None of the above\nAnswer: a")
+            elif "fill-in-the-blank" in prompt:
+                blocks.append(f"Q: The key idea of ____ is {topic}.\nAnswer: {topic}")
+            else:
+                blocks.append(f"Q: What is {topic}?\nA: {topic} is a key idea from the source.")
+        return "\n\n".join(blocks)
+
+    @staticmethod
+    def _render_json(prompt, seed):
+        items = []
+        for count, card_type, difficulty in re.findall(r'- (\d+) .*\(type "(.+?)", difficulty "(.+?)"\)', prompt):
+            for _ in range(int(count)):
+                n = len(items)
+                topic = f"concept {seed[n % 16 * 4:n % 16 * 4 + 4]}-{n}"
+                item = {"type": card_type, "difficulty": difficulty}
+                if card_type == "MCQ":
+                    item.update(question=f"Which statement about {topic} is correct?", answer="a",
+                                options=["It is defined in the text", "It is unrelated",
+                                         "It is a chapter title", "None of the above"])
+                elif card_type == "Fill-in-the-Blank":
+                    item.update(question=f"The key idea of ____ is {topic}.", answer=topic)
+                else:
+                    item.update(question=f"What is {topic}?", answer=f"{topic} is a key idea from the source.")
+                items.append(item)
+        return "```json\n" + json.dumps(items, indent=2) + "\n```"
+
+
+class FakeWikipedia:
+    """Stand-in for the `wikipedia` module (page() plus its two lookup errors).
+
+    Topics in `ambiguous` raise DisambiguationError, topics missing from
+    `articles` raise PageError; anything else returns after `latency` seconds.
+    """
+
+    class DisambiguationError(Exception):
+        pass
+
+    class PageError(Exception):
+        pass
+
+    def __init__(self, articles=None, ambiguous=(), latency=0.3):
+        self.articles = dict(articles or {})
+        self.ambiguous = set(ambiguous)
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def page(self, title, auto_suggest=True):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        if title in self.ambiguous:
+            raise self.DisambiguationError(title)
+        if title not in self.articles:
+            raise self.PageError(title)
+        return _FakePage(title, self.articles[title])
+
+
+class _FakePage:
+    def __init__(self, title, content):
+        self.title = title
+        self.content = content
@@ -0,0 +1,249 @@
+"""Single-pass, line-oriented flashcard parser.
+
+Works on a whole response (parse_flashcards) or on model output as it
+streams in (IncrementalParser). Every line is looked at once with anchored,
+precompiled patterns, so parsing stays linear however large or malformed
+the response is.
+
+Understands the three formats requested by build_prompt:
+
+    Q: <question>            Q: <question>             Q: <sentence with blank>
+    A: <answer>              Options:                  Answer: <answer>
+                             a) ... b) ... c) ... d) ...
+                             Answer: <letter>
+
+An MCQ card is complete as soon as its Answer line arrives. Q&A and
+fill-in-the-blank answers may run over several lines, so those cards are
+complete when the next question starts (or when the stream is closed).
+
+Combined requests for several formats at once (build_combined_prompt) are
+answered with a JSON array instead and read by parse_card_json.
+"""
+import datetime
+import json
+import re
+
+from tracing import span
+
+QUESTION_RE = re.compile(r"\s*Q(?:uestion)?:\s*(.*)")
+INLINE_ANSWER_RE = re.compile(r"\s(?:A(?:nswer)?):\s*")
+OPTIONS_RE = re.compile(r"\s*Options:\s*(.*)")
+OPTION_RE = re.compile(r"\s*([a-dA-D])\)\s*(.*)")
+ANSWER_RE = re.compile(r"\s*A(?:nswer)?:\s*(.*)")
+ANSWER_LETTER_RE = re.compile(r"([a-dA-D])\)?")
+MARKUP_RE = re.compile(r"\*\*+|#+")
+CARD_TYPES = ("Q&A", "MCQ", "Fill-in-the-Blank")
+DIFFICULTIES = ("Easy", "Medium", "Hard")
+OPTION_LETTERS = ("a", "b", "c", "d", "A", "B", "C", "D")
+
+
+def _new_card(question, answer):
+    return {
+        "question": question,
+        "answer": answer,
+        "interval": 1,
+        "ease": 2.5,
+        "next_review": str(datetime.date.today())
+    }
+
+
+class IncrementalParser:
+    """Feed text chunks with feed(); each call returns the cards completed so far.
+
+    Call close() at the end of the stream to flush the last card. Once the
+    first card has been produced the parser sticks to its kind: after an MCQ,
+    stray Q&A-shaped blocks are ignored, matching parse_flashcards.
+
+    Cards already returned are not taken back, so this is the one place the
+    two differ: Q&A cards that come before the first MCQ are kept here, while
+    parse_flashcards, seeing the whole response, returns only the MCQs.
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._chunks = []
+        self._card = None
+        self.mode = None
+
+    @property
+    def text(self):
+        """Everything fed so far, for showing unparseable output."""
+        return "".join(self._chunks)
+
+    def feed(self, chunk):
+        self._chunks.append(chunk)
+        if "\n" not in chunk:
+            # Keep partial lines as a list so a long line fed in tiny chunks
+            # isn't re-concatenated on every call
+            self._pending.append(chunk)
+            return []
+        self._pending.append(chunk)
+        lines = "".join(self._pending).split("\n")
+        self._pending = [lines.pop()]
+        cards = []
+        for line in lines:
+            self._line(line, cards)
+        return cards
+
+    def close(self):
+        cards = []
+        rest = "".join(self._pending)
+        self._pending = []
+        if rest:
+            self._line(rest, cards)
+        self._finish(cards)
+        return cards
+
+    def _line(self, line, cards):
+        if "*" in line or "#" in line:
+            line = MARKUP_RE.sub("", line)
+        card = self._card
+        # Every marker starts with one of a few letters, so most lines are
+        # ruled out without running a pattern at all
+        lead = line.lstrip()[:1]
+
+        match = lead == "Q" and QUESTION_RE.match(line)
+        if match:
+            self._finish(cards)
+            question, answer = match.group(1), None
+            inline = INLINE_ANSWER_RE.search(question)
+            if inline:
+                question, answer = question[:inline.start()], [question[inline.end():]]
+            self._card = {"question": [question], "options": None, "answer": answer}
+            return
+        if card is None:
+            return
+
+        if card["answer"] is None:
+            match = lead == "O" and card["options"] is None and OPTIONS_RE.match(line)
+            if match:
+                card["options"] = []
+                line = match.group(1)
+                if not line.strip():
+                    return
+                lead = line.lstrip()[:1]
+            match = lead in OPTION_LETTERS and card["options"] is not None and OPTION_RE.match(line)
+            if match and len(card["options"]) < 4:
+                card["options"].append([match.group(2)])
+                return
+            match = lead == "A" and ANSWER_RE.match(line)
+            if match:
+                card["answer"] = [match.group(1)]
+                if self._is_mcq(card):
+                    self._emit(self._mcq(card), "mcq", cards)
+                    self._card = None
+                return
+            if card["options"]:
+                card["options"][-1].append(line)
+            else:
+                card["question"].append(line)
+        else:
+            card["answer"].append(line)
+
+    @staticmethod
+    def _is_mcq(card):
+        options = card["options"]
+        return (options is not None and len(options) == 4
+                and card["answer"][0][:1].lower() in ("a", "b", "c", "d"))
+
+    @staticmethod
+    def _mcq(card):
+        options = ["\n".join(option).strip() for option in card["options"]]
+        answer_index = "abcd".index(card["answer"][0][:1].lower())
+        mcq = _new_card("\n".join(card["question"]).strip(), options[answer_index])
+        mcq["options"] = options
+        return mcq
+
+    def _finish(self, cards):
+        card, self._card = self._card, None
+        if card is None or card["answer"] is None:
+            return
+        question = "\n".join(card["question"]).strip()
+        answer = "\n".join(card["answer"]).strip()
+        self._emit(_new_card(question, answer), "qa", cards)
+
+    def _emit(self, card, kind, cards):
+        if self.mode is None:
+            self.mode = kind
+        if kind == self.mode or kind == "mcq":
+            cards.append(card)
+
+
+def parse_flashcards(text):
+    """Parse a complete response. If it contains any MCQ, only MCQs are returned
+    (a stream parsed with IncrementalParser keeps Q&A cards seen before it)."""
+    with span("parse", chars=len(text)) as s:
+        parser = IncrementalParser()
+        cards = parser.feed(text) + parser.close()
+        if any("options" in card for card in cards):
+            cards = [card for card in cards if "options" in card]
+        s.set(outcome="ok" if cards else "empty", cards=len(cards))
+    return cards
+
+
+def _json_card(item):
+    """A typed card from one decoded JSON object, or None if it is unusable."""
+    if not isinstance(item, dict):
+        return None
+    card_type, question, answer = item.get("type"), item.get("question"), item.get("answer")
+    if card_type not in CARD_TYPES or not isinstance(question, str) or not question.strip():
+        return None
+    if not isinstance(answer, (str, int)) or not str(answer).strip():
+        return None
+    answer = str(answer).strip()
+    options = None
+    if card_type == "MCQ":
+        options = item.get("options")
+        if not isinstance(options, list) or len(options) != 4:
+            return None
+        options = [str(option).strip() for option in options]
+        # Like the text format the answer may be a letter; store the option itself
+        letter = ANSWER_LETTER_RE.fullmatch(answer)
+        if letter:
+            answer = options["abcd".index(letter.group(1).lower())]
+        elif answer not in options:
+            return None
+    card = _new_card(question.strip(), answer)
+    if options is not None:
+        card["options"] = options
+    card["card_type"] = card_type
+    difficulty = item.get("difficulty")
+    card["difficulty"] = difficulty if difficulty in DIFFICULTIES else None
+    return card
+
+
+def parse_card_json(text):
+    """Parse a combined response: a JSON array of card objects with type,
+    difficulty, question, answer and (for MCQs) options.
+
+    The array is decoded in one pass. If it is malformed, e.g. cut off
+    mid-way, every complete object before the damage is still recovered.
+    Cards of any type may be mixed; each keeps its card_type and difficulty.
+    """
+    with span("parse", chars=len(text)) as s:
+        cards = [card for card in map(_json_card, _json_items(text)) if card is not None]
+        s.set(outcome="ok" if cards else "empty", cards=len(cards))
+    return cards
+
+
+def _json_items(text):
+    start = text.find("[")
+    end = text.rfind("]")
+    items = None
+    if start != -1 and end > start:
+        try:
+            items = json.loads(text[start:end + 1])
+        except ValueError:
+            items = None
+    if not isinstance(items, list):
+        items = []
+        decoder = json.JSONDecoder()
+        position = text.find("{")
+        while position != -1:
+            try:
+                item, position = decoder.raw_decode(text, position)
+                items.append(item)
+            except ValueError:
+                position += 1
+            position = text.find("{", position)
+    return items
@@ -0,0 +1,226 @@
+"""Prompt construction, model calls and response parsing for flashcard generation."""
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flashcard_parser import MARKUP_RE, IncrementalParser, parse_card_json, parse_flashcards
+from tracing import attach, current_request, span
+
+# Characters of PDF and Wikipedia text sent to the model
+PROMPT_CHARS = 3000
+# Full-document mode: parallel model calls and retry policy per section
+MAX_CONCURRENT_REQUESTS = 4
+MAX_RETRIES = 3
+BACKOFF_SECONDS = 1.0
+# Cards per (type, difficulty) pair in a combined request
+CARDS_PER_CELL = 4
+CELL_STYLES = {"Easy": "simple", "Medium": "concept-testing", "Hard": "reasoning-based"}
+
+_GUIDELINES = """
+ Do NOT include:
+- Chapter numbers
+- Author names
+- Metadata like 'This chapter explains...'
+
+ Only include:
+- Key concepts
+- Definitions
+- Explanations
+- Applications
+- Comparisons
+- Theoretical understanding
+"""
+
+
+def clean_output(text):
+    # Only used to show raw output; parse_flashcards strips markup itself
+    return MARKUP_RE.sub("", text).strip()
+
+
+def build_prompt(pdf_text, wiki_text, card_type, difficulty):
+    task_map = {
+        "Q&A": {
+            "Easy": "Generate 6 simple Q&A flashcards. Format:\nQ: <question>\nA: <answer>",
+            "Medium": "Generate 6 Q&A flashcards. Format:\nQ: <question>\nA: <answer>",
+            "Hard": "Generate 6 challenging Q&A flashcards. Format:\nQ: <question>\nA: <answer>",
+        },
+        "MCQ": {
+            "Easy": "Generate 6 MCQs with 4 options. Format:\nQ: <question>\nOptions:\na) ...\nb) ...\nc) ...\nd) ...\nAnswer: <correct option>",
+            "Medium": "Generate 6 MCQs testing concepts. Same format as above.",
+            "Hard": "Generate 6 reasoning-based MCQs. Same format as above.",
+        },
+        "Fill-in-the-Blank": {
+            "Easy": "Generate 6 easy fill-in-the-blanks. Format:\nQ: <sentence with blank>\nAnswer: <answer>",
+            "Medium": "Generate 6 context-based fill-in-the-blanks. Format:\nQ: <sentence with blank>\nAnswer: <answer>",
+            "Hard": "Generate 6 reasoning-based fill-in-the-blanks. Format:\nQ: <sentence with blank>\nAnswer: <answer>",
+        },
+    }
+    instruction = task_map[card_type][difficulty]
+    return f"""
+You are an AI flashcard generator for students.
+
+{instruction}
+{_GUIDELINES}
+Use only the content below to generate flashcards:
+
+PDF:
+{pdf_text[:PROMPT_CHARS]}
+
+Wikipedia:
+{wiki_text[:PROMPT_CHARS]}
+"""
+
+
+def format_cells(card_types, difficulties):
+    """Every `(card_type, difficulty)` pair for the chosen options; each
+    argument is one value or a list of them."""
+    if isinstance(card_types, str):
+        card_types = [card_types]
+    if isinstance(difficulties, str):
+        difficulties = [difficulties]
+    return [(card_type, difficulty) for card_type in card_types for difficulty in difficulties]
+
+
+def build_combined_prompt(pdf_text, wiki_text, cells, cards_per_cell=CARDS_PER_CELL):
+    """One prompt for several `(card_type, difficulty)` cells. The source
+    text is sent once and the model answers with a single JSON array, which
+    parse_card_json splits back into typed cards."""
+    wanted = "\n".join(f"- {cards_per_cell} {CELL_STYLES[difficulty]} {card_type} flashcards "
+                       f'(type "{card_type}", difficulty "{difficulty}")'
+                       for card_type, difficulty in cells)
+    return f"""
+You are an AI flashcard generator for students.
+
+Generate these flashcards:
+{wanted}
+
+Reply with a JSON array and nothing else. Each element is one flashcard:
+{{"type": ..., "difficulty": ..., "question": "...", "answer": "...", "options": [...]}}
+MCQ cards have exactly 4 options and the answer is the letter (a-d) of the
+correct one. Fill-in-the-Blank questions are sentences with ____ for the
+blank. Other cards have no options.
+{_GUIDELINES}
+Use only the content below to generate flashcards:
+
+PDF:
+{pdf_text[:PROMPT_CHARS]}
+
+Wikipedia:
+{wiki_text[:PROMPT_CHARS]}
+"""
+
+
+def cells_prompt(pdf_text, wiki_text, cells):
+    """The prompt and the matching response parser for `cells`: the plain
+    text format for a single cell, so its prompts and cached responses stay
+    as they were, and the combined JSON format for several."""
+    if len(cells) == 1:
+        return build_prompt(pdf_text, wiki_text, *cells[0]), parse_flashcards
+    return build_combined_prompt(pdf_text, wiki_text, cells), parse_card_json
+
+
+def generate_cards(model, prompt, parse=parse_flashcards):
+    with span("generate", prompt_chars=len(prompt)) as s:
+        response = model.generate_content(prompt)
+        s.set(response_chars=len(response.text))
+    return parse(response.text)
+
+
+def stream_cards(model, prompt, parser=None):
+    """Yield cards one at a time while the model is still writing the response.
+
+    Pass your own IncrementalParser to inspect the raw text afterwards.
+    """
+    parser = parser or IncrementalParser()
+    # Spans the whole stream, including whatever the caller does between cards
+    with span("generate_stream", prompt_chars=len(prompt)) as s:
+        count = 0
+        for chunk in model.generate_content(prompt, stream=True):
+            cards = parser.feed(chunk.text)
+            count += len(cards)
+            yield from cards
+        cards = parser.close()
+        s.set(cards=count + len(cards))
+        yield from cards
+
+
+def _with_retries(fn, retries=MAX_RETRIES, backoff=BACKOFF_SECONDS):
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except Exception:
+            if attempt == retries:
+                raise
+            # Exponential backoff with jitter so parallel sections don't retry in lockstep
+            time.sleep(backoff * 2 ** attempt * (0.5 + random.random()))
+
+
+def split_sections(text, section_chars=PROMPT_CHARS):
+    """Split text into sections of at most `section_chars`, breaking on blank
+    lines or line ends where possible."""
+    sections, current, size = [], [], 0
+    for line in text.split("\n"):
+        while len(line) > section_chars:
+            sections.append(line[:section_chars])
+            line = line[section_chars:]
+        if size + len(line) + 1 > section_chars and current:
+            sections.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if any(part.strip() for part in current):
+        sections.append("\n".join(current))
+    return [section for section in sections if section.strip()]
+
+
+def _question_key(question):
+    return " ".join(re.findall(r"[a-z0-9]+", question.lower()))
+
+
+def dedupe_cards(cards):
+    """Drop cards whose question matches an earlier one after normalisation."""
+    seen, unique = set(), []
+    for card in cards:
+        key = _question_key(card["question"])
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(card)
+    return unique
+
+
+def generate_deck(model, text, wiki_text, card_type, difficulty,
+                  section_chars=PROMPT_CHARS, max_workers=MAX_CONCURRENT_REQUESTS):
+    """Map-reduce generation over a whole document.
+
+    Every section gets its own prompt; the requests run on a thread pool of
+    `max_workers` with retry and backoff, and the parsed cards are merged in
+    section order and de-duplicated. Wikipedia context is only sent with the
+    first section so it isn't turned into the same cards over and over.
+    `card_type` and `difficulty` may be lists; each section then asks for
+    every combination in one combined request.
+
+    Returns `(cards, failures)` where `failures` lists `(section_index, error)`
+    for sections that still failed after retries.
+    """
+    sections = split_sections(text, section_chars)
+    deck_span = span("generate_deck", chars=len(text), sections=len(sections))
+    request = current_request()
+    cells = format_cells(card_type, difficulty)
+
+    def run(i, section):
+        prompt, parse = cells_prompt(section, wiki_text if i == 0 else "", cells)
+        with attach(request):
+            return _with_retries(lambda: generate_cards(model, prompt, parse))
+
+    cards, failures = [], []
+    with deck_span, ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = [pool.submit(run, i, section) for i, section in enumerate(sections)]
+        for i, future in enumerate(futures):
+            try:
+                cards.extend(future.result())
+            except Exception as e:
+                failures.append((i, e))
+        cards = dedupe_cards(cards)
+        deck_span.set(outcome="partial" if failures else "ok", cards=len(cards), failed_sections=len(failures))
+    return cards, failures
@@ -0,0 +1,126 @@
+"""BM25 passage ranking used to pick the most relevant source text for a prompt."""
+import re
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+CHUNK_WORDS = 120
+CHUNK_OVERLAP = 20
+# Rough English average, good enough for budgeting prompt size
+CHARS_PER_TOKEN = 4
+MAX_CACHED_INDEXES = 32
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def chunk_text(text, chunk_words=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    """Split `text` into overlapping windows of about `chunk_words` words."""
+    words = text.split()
+    step = max(1, chunk_words - overlap)
+    return [" ".join(words[start:start + chunk_words])
+            for start in range(0, max(len(words) - overlap, 1), step)]
+
+
+class PassageIndex:
+    """Okapi BM25 over a fixed list of passages.
+
+    Postings are stored term-major in flat NumPy arrays with the BM25 weight
+    of every (term, passage) pair precomputed, so a query is one slice and
+    one vector add per query term.
+    """
+
+    def __init__(self, passages, k1=1.5, b=0.75):
+        self.passages = passages
+        self.vocab = {}
+        docs, terms, tfs = [], [], []
+        for i, passage in enumerate(passages):
+            for term, count in Counter(tokenize(passage)).items():
+                docs.append(i)
+                terms.append(self.vocab.setdefault(term, len(self.vocab)))
+                tfs.append(count)
+
+        n = len(passages)
+        docs = np.asarray(docs, dtype=np.int32)
+        terms = np.asarray(terms, dtype=np.int32)
+        tfs = np.asarray(tfs, dtype=np.float32)
+
+        order = np.argsort(terms, kind="stable")
+        docs, terms, tfs = docs[order], terms[order], tfs[order]
+        self._indptr = np.searchsorted(terms, np.arange(len(self.vocab) + 1))
+        self._docs = docs
+
+        lengths = np.bincount(docs, weights=tfs, minlength=n)
+        avg_length = lengths.mean() if n else 0.0
+        df = np.diff(self._indptr)
+        idf = np.log1p((n - df + 0.5) / (df + 0.5))
+        norm = k1 * (1 - b + b * lengths / (avg_length or 1.0))
+        self._weights = (idf[terms] * tfs * (k1 + 1) / (tfs + norm[docs])).astype(np.float32)
+
+    def scores(self, query):
+        scores = np.zeros(len(self.passages), dtype=np.float32)
+        for term in set(tokenize(query)):
+            j = self.vocab.get(term)
+            if j is None:
+                continue
+            start, stop = self._indptr[j], self._indptr[j + 1]
+            # A term appears at most once per passage, so plain fancy-index add is safe
+            scores[self._docs[start:stop]] += self._weights[start:stop]
+        return scores
+
+    def select(self, query, token_budget):
+        """Return the best-scoring passages that fit in `token_budget`, joined in
+        document order. Falls back to the leading passages if nothing matches."""
+        scores = self.scores(query)
+        ranked = np.argsort(-scores, kind="stable")
+        ranked = ranked[scores[ranked] > 0]
+        if not len(ranked):
+            ranked = range(len(self.passages))
+        picked, used = [], 0
+        for i in ranked:
+            cost = estimate_tokens(self.passages[i])
+            if used + cost > token_budget:
+                if picked:
+                    break
+                continue
+            picked.append(int(i))
+            used += cost
+        if not picked and len(ranked):
+            # Even the best passage is over budget; send as much of it as fits
+            return self.passages[ranked[0]][:token_budget * CHARS_PER_TOKEN]
+        return "\n".join(self.passages[i] for i in sorted(picked))
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_index(doc_hash, text):
+    """Return the PassageIndex for a document, building it on first use.
+
+    Indexes are kept per document hash in a small in-process LRU so repeat
+    generations on the same PDF only pay for the query.
+    """
+    with _indexes_lock:
+        index = _indexes.get(doc_hash)
+        if index is not None:
+            _indexes.move_to_end(doc_hash)
+            return index
+    index = PassageIndex(chunk_text(text))
+    with _indexes_lock:
+        _indexes[doc_hash] = index
+        while len(_indexes) > MAX_CACHED_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def select_passages(text, query, token_budget):
+    """One-off ranking for text that isn't worth caching (e.g. a Wikipedia article)."""
+    return PassageIndex(chunk_text(text)).select(query, token_budget)
@@ -0,0 +1,230 @@
+"""The flashcard generation pipeline, usable without Streamlit.
+
+PDF -> source text and topic -> Wikipedia -> prompt -> model -> cards -> database.
+app.py runs it for one upload at a time. Running this module builds decks for
+a whole course in one go:
+
+    python pipeline.py lectures/ --user alice
+    python pipeline.py course.txt --user alice --source full --workers 8
+    python pipeline.py lectures/ --user alice --password pw --offline
+    python pipeline.py lectures/ --user alice --card-type Q&A MCQ --difficulty Easy Hard
+
+The input is a directory (every *.pdf in it) or a manifest: a text file with
+one PDF path per line, relative to the manifest, optionally followed by a tab
+and the topic to use. Blank lines and lines starting with # are ignored.
+
+Each finished deck is saved with a completion marker in one transaction, so
+rerunning an interrupted batch skips the PDFs that are already done.
+`--offline` swaps in the fake model and fake Wikipedia from fakes.py.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import database
+import tracing
+import wiki
+from cache import CachedModel
+from scheduler import REQUESTS_PER_MINUTE, LLMScheduler
+from flashcard_parser import CARD_TYPES, DIFFICULTIES
+from extraction import document_hash, extract_head, extract_pages, read_bytes
+from generation import PROMPT_CHARS, cells_prompt, clean_output, format_cells, generate_deck
+from passages import CHARS_PER_TOKEN, get_index, select_passages
+
+SOURCE_HEAD, SOURCE_RELEVANT, SOURCE_FULL = "head", "relevant", "full"
+SOURCE_MODES = (SOURCE_HEAD, SOURCE_RELEVANT, SOURCE_FULL)
+# Token budget for ranked passages; sized so they fit in PROMPT_CHARS
+PASSAGE_TOKEN_BUDGET = PROMPT_CHARS // CHARS_PER_TOKEN
+DEFAULT_TOPIC = "Artificial Intelligence"
+GEMINI_MODEL = "gemini-1.5-pro"
+BATCH_WORKERS = 4
+
+
+def gemini_model(api_key, name=GEMINI_MODEL):
+    # google.generativeai pulls in grpc and protobuf; import it only when a deck is generated
+    import google.generativeai as genai
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(name)
+
+
+def extract_topic(text):
+    for line in text.split("\n"):
+        if line.strip() and len(line.split()) > 2:
+            return line.strip()
+    return DEFAULT_TOPIC
+
+
+def prepare_source(file, mode=SOURCE_HEAD, topic=None, extract_workers=None):
+    """Return `(text, topic, wiki_text)` for a PDF: the text to build cards
+    from for `mode`, the topic (read from the text unless given) and the
+    Wikipedia article on it."""
+    # A given topic is known up front, so its lookup overlaps PDF parsing
+    wiki_future = wiki.prefetch_wikipedia(topic) if topic else None
+    if mode == SOURCE_FULL:
+        text = "\n".join(page for page in extract_pages(file, extract_workers) if page)
+        topic = topic or extract_topic(text)
+    elif mode == SOURCE_RELEVANT:
+        data = read_bytes(file)
+        full_text = "\n".join(page for page in extract_pages(data, extract_workers) if page)
+        topic = topic or extract_topic(full_text)
+        wiki_future = wiki_future or wiki.prefetch_wikipedia(topic)
+        text = get_index(document_hash(data), full_text).select(topic, PASSAGE_TOKEN_BUDGET)
+    else:
+        text = extract_head(file, PROMPT_CHARS)
+        topic = topic or extract_topic(text)
+    wiki_text = (wiki_future or wiki.prefetch_wikipedia(topic)).result()
+    if mode == SOURCE_RELEVANT and wiki_text:
+        wiki_text = select_passages(wiki_text, topic, PASSAGE_TOKEN_BUDGET)
+    return text, topic, wiki_text
+
+
+def generate(model, text, wiki_text, card_type, difficulty, mode=SOURCE_HEAD):
+    """Generate a deck with one request, or one request per section for
+    SOURCE_FULL. `card_type` and `difficulty` may be lists, in which case
+    every combination is asked for in that same request. Returns
+    `(cards, raw, failures)`: `raw` is the cleaned model output to show when
+    nothing parsed ("" for SOURCE_FULL) and `failures` the
+    `(section_index, error)` pairs of sections that failed."""
+    if mode == SOURCE_FULL:
+        cards, failures = generate_deck(model, text, wiki_text, card_type, difficulty)
+        return cards, "", failures
+    prompt, parse = cells_prompt(text, wiki_text, format_cells(card_type, difficulty))
+    with tracing.span("generate", prompt_chars=len(prompt)) as s:
+        response = model.generate_content(prompt)
+        s.set(response_chars=len(response.text))
+    # Parse the response itself: cleaning would strip '#' out of JSON strings
+    return parse(response.text), clean_output(response.text), []
+
+
+def deck_key(doc_hash, card_type, difficulty, mode, topic=None):
+    """Identifies one deck built from one document with one set of options."""
+    if not isinstance(card_type, str):
+        card_type = "+".join(card_type)
+    if not isinstance(difficulty, str):
+        difficulty = "+".join(difficulty)
+    return "|".join((doc_hash, card_type, difficulty, mode, topic or ""))
+
+
+def read_inputs(source):
+    """`(path, topic)` pairs from a directory of PDFs or a manifest file."""
+    if os.path.isdir(source):
+        return [(os.path.join(source, name), None)
+                for name in sorted(os.listdir(source)) if name.lower().endswith(".pdf")]
+    base = os.path.dirname(os.path.abspath(source))
+    inputs = []
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            path, _, topic = line.partition("\t")
+            inputs.append((os.path.join(base, path.strip()), topic.strip() or None))
+    return inputs
+
+
+def build_deck(model, user_id, path, topic, card_type, difficulty, mode, done):
+    """Run the whole pipeline for one PDF and save the deck. Returns
+    `(status, card_count)`; status is "done", "skipped" or "empty"."""
+    data = read_bytes(path)
+    key = deck_key(document_hash(data), card_type, difficulty, mode, topic)
+    if key in done:
+        return "skipped", 0
+    with tracing.request("batch"):
+        # Documents are already processed in parallel; don't also fan out
+        # each one over extraction processes
+        text, topic, wiki_text = prepare_source(data, mode, topic, extract_workers=1)
+        cards, _, failures = generate(model, text, wiki_text, card_type, difficulty, mode)
+        # Failures first: a deck whose sections all failed has no cards, but it
+        # isn't empty. Leave it unmarked so a rerun retries the missing sections
+        if failures:
+            raise RuntimeError(f"{len(failures)} section(s) failed: {failures[0][1]}")
+        if not cards:
+            return "empty", 0
+        try:
+            ids, _ = database.save_generated_deck(user_id, key, cards, source=os.path.basename(path))
+        except sqlite3.IntegrityError:
+            # The same document listed twice; the other copy got there first
+            return "skipped", 0
+    return "done", len(ids)
+
+
+def run_batch(model, user_id, inputs, card_type="Q&A", difficulty="Medium", mode=SOURCE_HEAD,
+              workers=BATCH_WORKERS, log=print):
+    """Build a deck for every `(path, topic)` in `inputs` on `workers` threads.
+    Returns a `{status: count}` summary; failed documents count as "failed"."""
+    done = database.get_generated_decks(user_id)
+    summary = {"done": 0, "skipped": 0, "empty": 0, "failed": 0}
+    pool = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        futures = {pool.submit(build_deck, model, user_id, path, topic, card_type, difficulty, mode, done): path
+                   for path, topic in inputs}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                status, count = future.result()
+            except Exception as e:
+                status, count = "failed", 0
+                log(f"failed   {path}: {e}")
+            else:
+                log(f"{status:<8} {path}" + (f": {count} cards" if count else ""))
+            summary[status] += 1
+    finally:
+        # On Ctrl-C drop the queued documents; decks already saved stay saved
+        pool.shutdown(wait=True, cancel_futures=True)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate flashcard decks for a directory of PDFs.")
+    parser.add_argument("source", help="directory of PDFs or manifest file")
+    parser.add_argument("--user", required=True, help="username that will own the decks")
+    parser.add_argument("--password", help="create the user with this password if it doesn't exist")
+    parser.add_argument("--card-type", nargs="+", default=["Q&A"], choices=CARD_TYPES,
+                        help="one or more; several are generated together in one request")
+    parser.add_argument("--difficulty", nargs="+", default=["Medium"], choices=DIFFICULTIES)
+    parser.add_argument("--source", default=SOURCE_HEAD, choices=SOURCE_MODES, dest="mode",
+                        help="which part of each PDF to build cards from")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="documents processed at once")
+    parser.add_argument("--db", default=database.DB_PATH, help="database file")
+    parser.add_argument("--rpm", type=int, default=REQUESTS_PER_MINUTE,
+                        help="model requests per minute; 0 for no limit")
+    parser.add_argument("--fresh", action="store_true", help="skip the model response cache")
+    parser.add_argument("--offline", action="store_true", help="use the fake model and Wikipedia")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake model latency in seconds")
+    args = parser.parse_args()
+
+    database.configure_database(args.db)
+    database.initialize_db()
+    user_id = database.get_user_id(args.user)
+    if user_id is None and args.password:
+        database.register_user(args.user, args.password)
+        user_id = database.get_user_id(args.user)
+    if user_id is None:
+        parser.error(f"no user named {args.user!r}; sign up in the app or pass --password")
+
+    if args.offline:
+        import fakes
+        model = fakes.FakeModel(latency=args.latency)
+        wiki.backend = fakes.FakeWikipedia(latency=args.latency / 2)
+    else:
+        model = gemini_model(os.environ.get("GEMINI_API_KEY", ""))
+
+    inputs = read_inputs(args.source)
+    start = time.perf_counter()
+    # Sections of every document share one rate limit and concurrency cap
+    model = LLMScheduler(model, requests_per_minute=args.rpm).for_user(user_id)
+    try:
+        summary = run_batch(CachedModel(model, bypass=args.fresh), user_id, inputs,
+                            args.card_type, args.difficulty, args.mode, args.workers)
+    except KeyboardInterrupt:
+        sys.exit("interrupted; finished decks are saved, run again to resume")
+    print(", ".join(f"{count} {status}" for status, count in summary.items()),
+          f"in {time.perf_counter() - start:.1f}s")
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""Process-wide scheduling of model requests shared by every session.
+
+All sessions (and batch workers) reach the model through one LLMScheduler:
+
+- identical prompts already in flight are coalesced, so a lecture hall
+  uploading the same slides costs one request rather than one per student;
+  a stream joined late replays the chunks received so far and then follows
+  the live one;
+- a token bucket holds the request rate under the API quota and at most
+  `max_concurrent` requests run at once;
+- requests beyond that wait in per-user FIFO queues served round-robin,
+  so one user generating a large deck can't starve everyone else, and each
+  waiting caller is told its place in line.
+
+Sessions use a per-user handle from `for_user()`, which has the model's
+generate_content interface and can be wrapped in cache.CachedModel.
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+from cache import llm_cache_key
+
+REQUESTS_PER_MINUTE = 60
+BURST = 10
+MAX_CONCURRENT = 8
+
+
+class LLMScheduler:
+    def __init__(self, model, requests_per_minute=REQUESTS_PER_MINUTE, burst=BURST,
+                 max_concurrent=MAX_CONCURRENT):
+        self.model = model
+        self.model_name = getattr(model, "model_name", type(model).__name__)
+        # None disables the rate limit
+        self.rate = requests_per_minute / 60 if requests_per_minute else None
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.stats = {"requests": 0, "coalesced": 0, "queued": 0, "model_calls": 0}
+        self._cond = threading.Condition()
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._running = 0
+        # user -> deque of waiting tickets; the first user is served next
+        self._queues = OrderedDict()
+        self._in_flight = {}
+        self._streams = {}
+
+    def for_user(self, user, on_wait=None):
+        """A model-like handle whose requests are queued as `user`'s. `on_wait`
+        is called with the 1-based queue position whenever it changes."""
+        return ScheduledModel(self, user, on_wait)
+
+    def queue_length(self):
+        with self._cond:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def generate_content(self, prompt, stream=False, user=None, on_wait=None):
+        key = llm_cache_key(prompt, self.model_name)
+        if stream:
+            return self._stream(key, prompt, user, on_wait)
+        with self._cond:
+            self.stats["requests"] += 1
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            self._acquire(user, on_wait)
+        except BaseException as e:
+            self._finish(key, future, error=e, started=False)
+            raise
+        try:
+            response = self.model.generate_content(prompt)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, response=response)
+        return response
+
+    def _stream(self, key, prompt, user, on_wait):
+        # Decided on the first next(), so a stream nobody reads never holds
+        # up followers
+        with self._cond:
+            self.stats["requests"] += 1
+            shared = self._streams.get(key)
+            leader = shared is None
+            if leader:
+                shared = self._streams[key] = _SharedStream()
+            else:
+                self.stats["coalesced"] += 1
+                shared.followers += 1
+        if not leader:
+            yield from shared.replay()
+            return
+
+        try:
+            self._acquire(user, on_wait)
+        except BaseException as e:
+            self._end_stream(key, shared, e)
+            raise
+        error = None
+        try:
+            chunks = iter(self.model.generate_content(prompt, stream=True))
+            for chunk in chunks:
+                shared.append(chunk)
+                yield chunk
+        except GeneratorExit:
+            # Our reader stopped early; finish the response for anyone following
+            with self._cond:
+                followers = shared.followers
+            if followers:
+                try:
+                    for chunk in chunks:
+                        shared.append(chunk)
+                except Exception as e:
+                    error = e
+            else:
+                error = RuntimeError("stream cancelled")
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._release()
+            self._end_stream(key, shared, error)
+
+    def _end_stream(self, key, shared, error=None):
+        with self._cond:
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+        shared.finish(error)
+
+    def _finish(self, key, future, response=None, error=None, started=True):
+        with self._cond:
+            del self._in_flight[key]
+        if started:
+            self._release()
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(response)
+
+    def _release(self):
+        with self._cond:
+            self._running -= 1
+            self._cond.notify_all()
+
+    def _acquire(self, user, on_wait):
+        """Block until this request may call the model: it is first in the
+        round-robin order, a concurrency slot is free and a token is available."""
+        ticket = object()
+        with self._cond:
+            self._queues.setdefault(user, deque()).append(ticket)
+        reported = None
+        try:
+            while True:
+                with self._cond:
+                    if self._try_start(user, ticket):
+                        break
+                    position = self._position(user, ticket)
+                    if position == reported:
+                        self._cond.wait(self._retry_after())
+                        continue
+                    if reported is None:
+                        self.stats["queued"] += 1
+                # Report outside the lock; the callback may be slow (e.g. a UI update)
+                reported = position
+                if on_wait is not None:
+                    on_wait(position)
+        except BaseException:
+            with self._cond:
+                self._drop(user, ticket)
+                self._cond.notify_all()
+            raise
+
+    def _try_start(self, user, ticket):
+        next_user, queue = next(iter(self._queues.items()))
+        if next_user != user or queue[0] is not ticket or self._running >= self.max_concurrent:
+            return False
+        if not self._take_token():
+            return False
+        queue.popleft()
+        if queue:
+            self._queues.move_to_end(user)
+        else:
+            del self._queues[user]
+        self._running += 1
+        self.stats["model_calls"] += 1
+        # The next user in line may be able to start too
+        self._cond.notify_all()
+        return True
+
+    def _drop(self, user, ticket):
+        queue = self._queues.get(user)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[user]
+
+    def _position(self, user, ticket):
+        """1-based place in line under round-robin service: everything ahead
+        in this user's own queue, plus up to as many requests from each other
+        user (one more from users whose turn comes before ours)."""
+        index = self._queues[user].index(ticket)
+        ahead = index
+        before = True
+        for other, queue in self._queues.items():
+            if other == user:
+                before = False
+                continue
+            ahead += min(len(queue), index + before)
+        return ahead + 1
+
+    def _take_token(self):
+        if self.rate is None:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _retry_after(self):
+        # Seconds until the next token; None means wait for a finished request
+        if self.rate is None or self._tokens >= 1:
+            return None
+        return (1 - self._tokens) / self.rate
+
+
+class _SharedStream:
+    """Chunks of one in-flight stream, replayable by any number of followers."""
+
+    def __init__(self):
+        self.chunks = []
+        self.followers = 0
+        self.done = False
+        self.error = None
+        self._cond = threading.Condition()
+
+    def append(self, chunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def replay(self):
+        i = 0
+        while True:
+            with self._cond:
+                while i >= len(self.chunks) and not self.done:
+                    self._cond.wait()
+                if i < len(self.chunks):
+                    chunk = self.chunks[i]
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            i += 1
+            yield chunk
+
+
+class ScheduledModel:
+    """One user's view of an LLMScheduler, with the model's interface."""
+
+    def __init__(self, scheduler, user, on_wait=None):
+        self.scheduler = scheduler
+        self.model_name = scheduler.model_name
+        self.user = user
+        self.on_wait = on_wait
+
+    def generate_content(self, prompt, stream=False):
+        return self.scheduler.generate_content(prompt, stream, user=self.user, on_wait=self.on_wait)
@@ -0,0 +1,141 @@
+"""Spaced-repetition scheduling on NumPy arrays.
+
+One set of rules for the whole app: the Streamlit review buttons, the
+database's SM-2 style `quality` updates and deck-wide questions such as
+"what is due and in which order" all go through `grade` and `DeckSchedule`.
+Days are stored as proleptic Gregorian ordinals (date.toordinal()).
+"""
+from collections import namedtuple
+from datetime import date
+
+import numpy as np
+
+AGAIN, HARD, GOOD, EASY = 0, 1, 2, 3
+# date.toordinal() of 0001-01-01 is 1
+_ORDINAL_EPOCH = np.datetime64("0001-01-01", "D") - 1
+FEEDBACK_GRADES = {"again": AGAIN, "hard": HARD, "good": GOOD, "easy": EASY}
+
+Params = namedtuple("Params", [
+    "min_ease", "max_ease", "again_penalty", "hard_penalty", "hard_factor", "easy_bonus",
+])
+DEFAULT_PARAMS = Params(min_ease=1.3, max_ease=2.5, again_penalty=0.2,
+                        hard_penalty=0.05, hard_factor=1.2, easy_bonus=0.1)
+
+
+def quality_to_grade(quality):
+    """Map SM-2 quality scores (0-5, scalar or array) onto the four grades."""
+    quality = np.asarray(quality)
+    return np.select([quality < 3, quality == 3, quality == 4], [AGAIN, HARD, GOOD], EASY)
+
+
+def grade(interval, ease, grades, params=DEFAULT_PARAMS):
+    """Apply one review to every card at once; returns `(interval, ease)` arrays.
+
+    again: interval back to 1, ease down by again_penalty
+    hard:  interval x hard_factor, ease down by hard_penalty
+    good:  interval x ease
+    easy:  interval x ease, ease up by easy_bonus
+    Ease stays within [min_ease, max_ease] and intervals are at least one day.
+    """
+    interval = np.asarray(interval, dtype=np.float64)
+    ease = np.asarray(ease, dtype=np.float64)
+    grades = np.asarray(grades)
+
+    new_interval = np.select(
+        [grades == AGAIN, grades == HARD],
+        [np.ones_like(interval), np.floor(interval * params.hard_factor)],
+        np.floor(interval * ease),
+    )
+    new_ease = np.select(
+        [grades == AGAIN, grades == HARD, grades == EASY],
+        [ease - params.again_penalty, ease - params.hard_penalty, ease + params.easy_bonus],
+        ease,
+    )
+    new_ease = np.clip(new_ease, params.min_ease, params.max_ease)
+    return np.maximum(new_interval, 1).astype(np.int64), new_ease
+
+
+def elapsed_days(interval, next_review, today=None):
+    """Days since a card was last scheduled: its due day minus its interval.
+    Cards without a due day count as reviewed on schedule."""
+    today = (today or date.today()).toordinal()
+    if not next_review:
+        return int(interval)
+    last = date.fromisoformat(str(next_review)[:10]).toordinal() - int(interval)
+    return max(today - last, 0)
+
+
+def review_card(card, feedback, today=None, params=DEFAULT_PARAMS):
+    """Scalar convenience for a single card dict, as used by the review screen."""
+    today = today or date.today()
+    interval, ease = grade([card["interval"]], [card["ease"]], [FEEDBACK_GRADES[feedback]], params)
+    card["interval"] = int(interval[0])
+    card["ease"] = float(ease[0])
+    card["next_review"] = date.fromordinal(today.toordinal() + card["interval"]).isoformat()
+    return card
+
+
+class DeckSchedule:
+    """Interval, ease and due day of a whole deck as parallel arrays."""
+
+    def __init__(self, ids, interval, ease, due):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.interval = np.asarray(interval, dtype=np.int64)
+        self.ease = np.asarray(ease, dtype=np.float64)
+        self.due = np.asarray(due, dtype=np.int64)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build from `(id, interval, ease, next_review)` rows, next_review as YYYY-MM-DD."""
+        if not rows:
+            return cls([], [], [], [])
+        ids, interval, ease, next_review = zip(*rows)
+        due = [date.fromisoformat(str(day)[:10]).toordinal() if day else 0 for day in next_review]
+        return cls(ids, interval, ease, due)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def grade(self, positions, grades, today=None, params=DEFAULT_PARAMS):
+        """Grade the cards at `positions`; returns `(id, interval, ease, next_review)`
+        update tuples. Use review() for outcomes that are to be stored."""
+        today = (today or date.today()).toordinal()
+        positions = np.asarray(positions, dtype=np.int64)
+        interval, ease = grade(self.interval[positions], self.ease[positions], grades, params)
+        self.interval[positions] = interval
+        self.ease[positions] = ease
+        self.due[positions] = today + interval
+        next_review = np.datetime_as_string(_ORDINAL_EPOCH + self.due[positions], unit="D")
+        return list(zip(self.ids[positions].tolist(), interval.tolist(), ease.tolist(), next_review.tolist()))
+
+    def review(self, user_id, positions, grades, today=None, params=DEFAULT_PARAMS):
+        """Grade like grade() and return `(updates, entries)`, the update tuples
+        plus their review_log entries, ready for database.record_reviews."""
+        day = (today or date.today()).toordinal()
+        positions = np.asarray(positions, dtype=np.int64)
+        grades = np.broadcast_to(np.asarray(grades, dtype=np.int64), positions.shape)
+        interval, ease, due = self.interval[positions], self.ease[positions], self.due[positions]
+        # As elapsed_days: cards without a due day count as reviewed on schedule
+        elapsed = np.where(due > 0, np.maximum(day - (due - interval), 0), interval)
+        entries = [(user_id, card_id, day, *rest) for card_id, *rest in zip(
+            self.ids[positions].tolist(), grades.tolist(), elapsed.tolist(), interval.tolist(), ease.tolist())]
+        return self.grade(positions, grades, today, params), entries
+
+    def due_order(self, today=None):
+        """Positions of the cards due by `today`, most urgent first.
+
+        Urgency is how overdue a card is relative to its interval, so a card
+        three days late on a two-day interval beats one three days late on a
+        month-long interval.
+        """
+        today = (today or date.today()).toordinal()
+        due = np.flatnonzero(self.due <= today)
+        overdue = (today - self.due[due]) / np.maximum(self.interval[due], 1)
+        return due[np.argsort(-overdue, kind="stable")]
+
+    def forecast(self, days=30, today=None):
+        """Number of cards falling due on each of the next `days` days; anything
+        already overdue counts towards today."""
+        today = (today or date.today()).toordinal()
+        offset = np.maximum(self.due - today, 0)
+        return np.bincount(offset[offset < days], minlength=days)
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    """A fresh, migrated database file for one test."""
+    database.configure_database(str(tmp_path / "flashcards.db"))
+    database.initialize_db()
+    yield database
+    database.configure_database()
+
+
+@pytest.fixture
+def user_id(db):
+    db.register_user("alice", "pw")
+    return db.get_user_id("alice")
@@ -0,0 +1,90 @@
+from datetime import date, timedelta
+
+import pytest
+
+import dedup
+
+
+def _cards(questions, answer="a"):
+    return [{"question": question, "answer": answer} for question in questions]
+
+
+def _flagged(db):
+    with db.get_connection() as conn:
+        return dict(conn.execute("SELECT card_id, duplicate_of FROM card_minhash WHERE duplicate_of IS NOT NULL"))
+
+
+def _matches(db, user_id, questions):
+    with db.get_connection() as conn:
+        return dedup.match_questions(conn, user_id, questions)[1]
+
+
+def test_numbered_questions_stay_distinct(db, user_id):
+    cards = [{"question": f"What is concept number {i}?", "answer": f"Concept {i}"} for i in range(2000)]
+    ids, failures = db.save_flashcards(user_id, cards, on_duplicate=dedup.MERGE)
+    assert not failures
+    assert len(set(ids)) == 2000
+    assert _flagged(db) == {}
+
+
+@pytest.mark.parametrize("first, second", [
+    ("What role do mitochondria play in respiration?", "What is the role of mitochondria in respiration?"),
+    ("What function do mitochondria serve?", "What is the function of mitochondria?"),
+    ("When did World War II end?", "In what year did World War II end?"),
+    ("What is the capital of France?", "Name the capital city of France."),
+    ("What are the products of glycolysis?", "Which products does glycolysis produce?"),
+])
+def test_rewordings_match(db, user_id, first, second):
+    assert _matches(db, user_id, [first, second]) == [None, ("batch", 0)]
+
+
+@pytest.mark.parametrize("first, second", [
+    ("Question about topic oranges?", "Question about topic bananas?"),
+    ("What is the time complexity of quicksort in the worst case?",
+     "What is the time complexity of quicksort in the average case?"),
+    ("What is the boiling point of water at sea level?", "What is the freezing point of water at sea level?"),
+    ("What is Newton's first law of motion?", "What is Newton's third law of motion?"),
+    ("What happened in 1914 in Europe?", "What happened in 1918 in Europe?"),
+    ("What is a cell?", "What is the powerhouse of the cell?"),
+])
+def test_different_questions_do_not_match(db, user_id, first, second):
+    assert _matches(db, user_id, [first, second]) == [None, None]
+
+
+def test_rewording_is_flagged_by_default(db, user_id):
+    [original], _ = db.save_flashcards(user_id, _cards(["What role do mitochondria play in respiration?"]))
+    [copy], _ = db.save_flashcards(user_id, _cards(["What is the role of mitochondria in respiration?"]))
+    assert copy != original
+    assert _flagged(db) == {copy: original}
+
+
+def test_merge_hands_back_the_stored_card(db, user_id):
+    [original], _ = db.save_flashcards(user_id, _cards(["What role do mitochondria play in respiration?"],
+                                                       "They make ATP."))
+    next_review = date.today() + timedelta(days=12)
+    db.record_reviews(user_id, [(original, 12, 2.7, next_review)],
+                      [(user_id, original, date.today().toordinal(), 3, 1, 1, 2.5)])
+
+    card = {"question": "What is the role of mitochondria in respiration?", "answer": "ATP production"}
+    [card_id], _ = db.save_flashcards(user_id, [card], on_duplicate=dedup.MERGE)
+    assert card_id == original
+    assert card == {"id": original, "question": "What role do mitochondria play in respiration?",
+                    "answer": "They make ATP.", "interval": 12, "ease": 2.7, "next_review": next_review.isoformat()}
+    assert db.count_flashcards(user_id)[0] == 1
+
+
+def test_deleted_and_moved_cards_are_forgotten(db, user_id):
+    db.register_user("bob", "pw")
+    bob = db.get_user_id("bob")
+    ids, _ = db.save_flashcards(user_id, _cards(["What role do mitochondria play in respiration?",
+                                                 "How does light affect growth during spring?"]))
+    with db.get_connection() as conn, conn:
+        conn.execute("DELETE FROM flashcards WHERE id = ?", (ids[0],))
+        conn.execute("UPDATE flashcards SET user_id = ? WHERE id = ?", (bob, ids[1]))
+        assert conn.execute("SELECT count(*) FROM card_lsh").fetchone()[0] == 0
+    copies = ["What is the role of mitochondria in respiration?",
+              "In what way does light affect the growth during spring?"]
+    assert _matches(db, user_id, copies) == [None, None]
+    new_ids, _ = db.save_flashcards(user_id, _cards(copies), on_duplicate=dedup.MERGE)
+    assert not set(new_ids) & set(ids)
+    assert _flagged(db) == {}
@@ -0,0 +1,56 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+from scheduling import DeckSchedule
+
+TODAY = date.today()
+
+
+def _write_everything(db, user_id):
+    """Insert, review (buffered, direct and in bulk) and delete cards."""
+    ids, _ = db.save_flashcards(user_id, [{"question": f"q{i}", "answer": f"a{i}"} for i in range(30)],
+                                on_duplicate=None)
+    db.save_flashcard(user_id, "single", "card", next_review=TODAY - timedelta(days=2))
+
+    buffer = db.ReviewBuffer(user_id)
+    for card in db.get_flashcards(user_id)[:10]:
+        buffer.review(card, "good", TODAY)
+    buffer.flush()
+
+    db.update_flashcard_review(ids[12], 5)
+    db.update_flashcard_review(ids[13], 1)
+    db.record_reviews(user_id, [(card_id, 4, 2.5, TODAY + timedelta(days=card_id % 5)) for card_id in ids[15:25]],
+                      [(user_id, card_id, TODAY.toordinal(), 2, 1, 1, 2.5) for card_id in ids[15:25]])
+    with db.get_connection() as conn, conn:
+        conn.executemany("DELETE FROM flashcards WHERE id = ?", [(card_id,) for card_id in ids[25:]])
+
+
+def test_due_counts_follow_every_write(db, user_id):
+    db.register_user("bob", "pw")
+    bob = db.get_user_id("bob")
+    _write_everything(db, user_id)
+    db.save_flashcards(bob, [{"question": "q0", "answer": "a0"}], on_duplicate=None)
+
+    assert db.check_due_counts() == []
+    with db.get_connection() as conn:
+        rows = conn.execute("SELECT id, interval, ease, next_review FROM flashcards WHERE user_id = ?",
+                            (user_id,)).fetchall()
+    expected = DeckSchedule.from_rows(rows).forecast(14, TODAY)
+    assert np.array_equal(db.get_due_forecast(user_id, 14, TODAY), expected)
+    assert db.get_due_count(user_id, TODAY) == expected[0]
+
+
+def test_repair_after_triggers_are_dropped(db, user_id):
+    db.save_flashcards(user_id, [{"question": "before", "answer": "a"}], on_duplicate=None)
+    with db.get_connection() as conn, conn:
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                                    "AND name LIKE 'due\\_counts\\_%' ESCAPE '\\'").fetchall():
+            conn.execute(f"DROP TRIGGER {name}")
+    _write_everything(db, user_id)
+
+    mismatches = db.check_due_counts()
+    assert mismatches
+    assert all(stored != actual for _, _, stored, actual in mismatches)
+    assert db.check_due_counts(repair=True) == mismatches
+    assert db.check_due_counts() == []
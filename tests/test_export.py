@@ -0,0 +1,36 @@
+import os
+from collections import OrderedDict
+
+import pytest
+
+import export
+
+
+@pytest.fixture
+def exports(tmp_path, monkeypatch):
+    monkeypatch.setattr(export.tempfile, "tempdir", str(tmp_path))
+    monkeypatch.setattr(export, "_exports", OrderedDict())
+    monkeypatch.setattr(export, "_export_bytes", 0)
+    monkeypatch.setattr(export, "_export_dir", None)
+    return tmp_path
+
+
+def _deck(n):
+    return [{"question": f"Question {n}.{i}", "answer": "answer " * 40} for i in range(20)]
+
+
+def test_export_directory_is_created_on_first_export(exports):
+    assert os.listdir(exports) == []
+    path = export.get_flashcards_pdf(_deck(0))
+    assert os.path.dirname(path) == export._export_dir
+    assert os.path.dirname(export._export_dir) == str(exports)
+    assert export.get_flashcards_pdf(_deck(0)) == path
+
+
+def test_cache_is_capped_by_bytes(exports, monkeypatch):
+    size = os.path.getsize(export.get_flashcards_pdf(_deck(0)))
+    monkeypatch.setattr(export, "EXPORT_CACHE_MAX_BYTES", int(size * 2.5))
+    paths = [export.get_flashcards_pdf(_deck(n)) for n in range(1, 5)]
+    assert [os.path.exists(path) for path in paths] == [False, False, True, True]
+    assert export._export_bytes == sum(os.path.getsize(path) for path in paths[2:])
+    assert sorted(os.listdir(export._export_dir)) == sorted(os.path.basename(path) for path in paths[2:])
@@ -0,0 +1,40 @@
+import extraction
+
+
+def _pdf_bytes(pages):
+    from io import BytesIO
+
+    from reportlab.pdfgen import canvas
+    out = BytesIO()
+    pdf = canvas.Canvas(out)
+    for page in range(pages):
+        pdf.drawString(50, 800, f"Page {page}: spaced repetition schedules reviews at growing intervals.")
+        pdf.showPage()
+    pdf.save()
+    return out.getvalue()
+
+
+def test_head_reads_resume_from_cached_pages(db, monkeypatch):
+    parsed = []
+    page_text = extraction._page_text
+
+    def counting_page_text(page):
+        parsed.append(page.page_number)
+        return page_text(page)
+
+    monkeypatch.setattr(extraction, "_page_text", counting_page_text)
+    data = _pdf_bytes(5)
+
+    head = extraction.extract_head(data, 50)
+    assert head.startswith("Page 0:") and parsed == [1]
+    assert extraction.extract_head(data, 50) == head
+    assert parsed == [1]
+
+    extraction.extract_head(data, 150)
+    assert parsed == [1, 2, 3]
+
+    pages = list(extraction.iter_pages(data))
+    assert [page.split(":")[0] for page in pages] == [f"Page {n}" for n in range(5)]
+    assert parsed == [1, 2, 3, 4, 5]
+    assert extraction.extract_pages(data) == pages
+    assert parsed == [1, 2, 3, 4, 5]
@@ -0,0 +1,41 @@
+import pytest
+
+import fakes
+import generation
+from flashcard_parser import IncrementalParser, parse_flashcards
+
+CHUNK_SIZES = (1, 7, 64, None)
+QA_THEN_MCQ = ("Q: a?\nA: b\n\nQ: c?\nOptions:\na) one\nb) two\nc) three\nd) four\nAnswer: c\n")
+
+
+def _corpus():
+    model = fakes.FakeModel(latency=0)
+    rendered = [model.render(generation.build_prompt("text", "", card_type, "Medium"))
+                for card_type in ("Q&A", "MCQ", "Fill-in-the-Blank")]
+    return fakes.RECORDED_OUTPUTS + rendered
+
+
+def _stream(text, chunk_size):
+    parser = IncrementalParser()
+    chunk_size = chunk_size or len(text) or 1
+    cards = []
+    for start in range(0, len(text), chunk_size):
+        cards.extend(parser.feed(text[start:start + chunk_size]))
+    return cards + parser.close()
+
+
+def _card_text(cards):
+    return [(card["question"], card["answer"], card.get("options")) for card in cards]
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+@pytest.mark.parametrize("text", _corpus())
+def test_streamed_parse_matches_whole_response(text, chunk_size):
+    assert _card_text(_stream(text, chunk_size)) == _card_text(parse_flashcards(text))
+
+
+@pytest.mark.parametrize("chunk_size", CHUNK_SIZES)
+def test_streamed_qa_before_first_mcq_is_kept(chunk_size):
+    # Documented difference: the stream has already handed out "a?"
+    assert [card["question"] for card in _stream(QA_THEN_MCQ, chunk_size)] == ["a?", "c?"]
+    assert [card["question"] for card in parse_flashcards(QA_THEN_MCQ)] == ["c?"]
@@ -0,0 +1,26 @@
+import fakes
+import generation
+import pipeline
+import wiki
+
+
+def _write_pdf(path):
+    from reportlab.pdfgen import canvas
+    pdf = canvas.Canvas(str(path))
+    for page in range(3):
+        pdf.drawString(50, 800, f"Page {page}: spaced repetition schedules reviews at growing intervals.")
+        pdf.showPage()
+    pdf.save()
+
+
+def test_deck_with_every_section_failed_counts_as_failed(db, user_id, tmp_path, monkeypatch):
+    monkeypatch.setattr(wiki, "backend", fakes.FakeWikipedia(latency=0))
+    # No retries, so every section fails once and for all
+    monkeypatch.setattr(generation, "_with_retries", lambda fn: fn())
+    _write_pdf(tmp_path / "lecture.pdf")
+    model = fakes.FakeModel(latency=0, fail_every=1)
+    summary = pipeline.run_batch(model, user_id, pipeline.read_inputs(str(tmp_path)),
+                                 mode=pipeline.SOURCE_FULL, workers=1, log=lambda line: None)
+    assert summary["failed"] == 1
+    assert summary["empty"] == 0
+    assert db.get_generated_decks(user_id) == set()
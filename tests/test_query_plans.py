@@ -0,0 +1,61 @@
+"""The hot queries must be served from an index. The SQL checked is captured
+from database.py as it runs, so editing a query there is what gets tested."""
+from datetime import date, timedelta
+
+import pytest
+
+import database
+
+
+@pytest.fixture
+def cards(tmp_path):
+    # One pooled connection, so the trace sees every statement
+    database.configure_database(str(tmp_path / "plans.db"), pool_size=1)
+    database.initialize_db()
+    database.register_user("alice", "pw")
+    user_id = database.get_user_id("alice")
+    ids, _ = database.save_flashcards(user_id, [{"question": f"q{i}", "answer": "a"} for i in range(200)],
+                                      on_duplicate=None)
+    with database.get_connection() as conn:
+        conn.execute("ANALYZE")
+    yield user_id, ids
+    database.configure_database()
+
+
+def _captured(fn):
+    """Run `fn` and return the flashcards queries it sent, parameters inlined."""
+    statements = []
+    with database.get_connection() as conn:
+        conn.set_trace_callback(statements.append)
+    try:
+        fn()
+    finally:
+        with database.get_connection() as conn:
+            conn.set_trace_callback(None)
+    # Trigger steps are traced as their top-level statement again
+    return [sql for sql in dict.fromkeys(statements)
+            if sql.lstrip().split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE")
+            and "flashcards" in sql and "EXPLAIN" not in sql]
+
+
+def _plans(statements):
+    with database.get_connection() as conn:
+        return [[row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)] for sql in statements]
+
+
+@pytest.mark.parametrize("name, run, search", [
+    ("due cards", lambda user_id, ids: database.get_due_flashcards(user_id),
+     "idx_flashcards_user_due (user_id=? AND next_review<?)"),
+    ("review by quality", lambda user_id, ids: database.update_flashcard_review(ids[7], 4),
+     "USING INTEGER PRIMARY KEY (rowid=?)"),
+    ("record reviews", lambda user_id, ids: database.record_reviews(
+        user_id, [(ids[7], 3, 2.6, date.today() + timedelta(days=3))],
+        [(user_id, ids[7], date.today().toordinal(), 2, 1, 1, 2.5)]),
+     "USING INTEGER PRIMARY KEY (rowid=?)"),
+])
+def test_query_uses_index(cards, name, run, search):
+    statements = _captured(lambda: run(*cards))
+    assert statements, f"{name}: no flashcards query captured"
+    for sql, plan in zip(statements, _plans(statements)):
+        assert not [step for step in plan if step.startswith("SCAN flashcards")], (sql, plan)
+        assert any(step.startswith("SEARCH flashcards") and search in step for step in plan), (sql, plan)
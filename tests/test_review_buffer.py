@@ -0,0 +1,61 @@
+import threading
+from datetime import date, timedelta
+
+import pytest
+
+from scheduling import GOOD, DeckSchedule
+
+TODAY = date.today()
+
+
+def test_flushes_commit_in_order(db, user_id, monkeypatch):
+    (card_id,), _ = db.save_flashcards(user_id, [{"question": "q", "answer": "a"}], on_duplicate=None)
+    buffer = db.ReviewBuffer(user_id, max_pending=100, max_age=60)
+
+    record_reviews = db.record_reviews
+    writing, release = threading.Event(), threading.Event()
+
+    def slow_record_reviews(*args):
+        # Hold the first (older) batch mid-write
+        if not writing.is_set():
+            writing.set()
+            release.wait(5)
+        return record_reviews(*args)
+
+    monkeypatch.setattr(db, "record_reviews", slow_record_reviews)
+    buffer.add(card_id, 1, 2.5, TODAY + timedelta(days=1), (user_id, card_id, TODAY.toordinal(), 0, 1, 1, 2.5))
+    older = threading.Thread(target=buffer.flush)
+    older.start()
+    assert writing.wait(5)
+
+    buffer.add(card_id, 6, 2.5, TODAY + timedelta(days=6), (user_id, card_id, TODAY.toordinal(), 2, 1, 1, 2.5))
+    newer = threading.Thread(target=buffer.flush)
+    newer.start()
+    newer.join(0.2)
+    assert newer.is_alive()
+
+    release.set()
+    older.join(5)
+    newer.join(5)
+    card, = db.get_flashcards(user_id)
+    assert card["interval"] == 6
+    assert str(card["next_review"]) == str(TODAY + timedelta(days=6))
+
+
+def test_schedule_changes_need_review_log_entries(db, user_id):
+    (card_id,), _ = db.save_flashcards(user_id, [{"question": "q", "answer": "a"}], on_duplicate=None)
+    with pytest.raises(ValueError):
+        db.record_reviews(user_id, [(card_id, 6, 2.5, TODAY + timedelta(days=6))], [])
+    assert db.get_flashcards(user_id)[0]["interval"] == 1
+
+
+def test_deck_reviews_are_logged(db, user_id):
+    db.save_flashcards(user_id, [{"question": f"q{i}", "answer": "a"} for i in range(3)], on_duplicate=None)
+    with db.get_connection() as conn:
+        rows = conn.execute("SELECT id, interval, ease, next_review FROM flashcards WHERE user_id = ?",
+                            (user_id,)).fetchall()
+    updates, entries = DeckSchedule.from_rows(rows).review(user_id, [0, 2], GOOD, TODAY)
+    assert db.record_reviews(user_id, updates, entries) == 2
+    with db.get_connection() as conn:
+        logged = conn.execute("SELECT card_id, grade, interval FROM review_log ORDER BY card_id").fetchall()
+    assert logged == [(rows[0][0], GOOD, 1), (rows[2][0], GOOD, 1)]
@@ -0,0 +1,126 @@
+import threading
+import time
+
+import fakes
+import scheduler
+
+
+def _read_all(llm, prompt, results, index, start):
+    start.wait()
+    results[index] = "".join(chunk.text for chunk in llm.for_user(f"student{index}").generate_content(prompt, stream=True))
+
+
+def test_identical_streams_share_one_model_call():
+    model = fakes.FakeModel(latency=0.2, chunks=10)
+    llm = scheduler.LLMScheduler(model, requests_per_minute=None)
+    results, start = [None] * 8, threading.Barrier(8)
+    threads = [threading.Thread(target=_read_all, args=(llm, "slides", results, i, start)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert model.calls == 1
+    assert llm.stats["coalesced"] == 7
+    assert results == [model.render("slides")] * 8
+
+
+def test_follower_gets_whole_response_when_leader_stops_early():
+    model = fakes.FakeModel(latency=0.05, chunks=5)
+    llm = scheduler.LLMScheduler(model, requests_per_minute=None)
+    leader = llm.generate_content("slides", stream=True, user="a")
+    first = next(leader)
+    follower = llm.generate_content("slides", stream=True, user="b")
+    assert next(follower).text == first.text
+    leader.close()
+    assert first.text + "".join(chunk.text for chunk in follower) == model.render("slides")
+    assert model.calls == 1
+
+
+def test_later_streams_start_a_new_request():
+    model = fakes.FakeModel(latency=0, chunks=3)
+    llm = scheduler.LLMScheduler(model, requests_per_minute=None)
+    for _ in range(2):
+        assert "".join(chunk.text for chunk in llm.generate_content("slides", stream=True)) == model.render("slides")
+    assert model.calls == 2
+
+
+class _GatedModel(fakes.FakeModel):
+    """Records the order and overlap of calls; a "hold" prompt blocks until
+    `gate` is set."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.order = []
+        self.running = self.peak = 0
+        self.holding = threading.Event()
+        self.gate = threading.Event()
+        self._tracking = threading.Lock()
+
+    def generate_content(self, prompt, stream=False):
+        with self._tracking:
+            self.order.append(prompt)
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            if prompt == "hold":
+                self.holding.set()
+                self.gate.wait(5)
+            return super().generate_content(prompt, stream)
+        finally:
+            with self._tracking:
+                self.running -= 1
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_token_bucket_holds_the_request_rate():
+    llm = scheduler.LLMScheduler(fakes.FakeModel(latency=0), requests_per_minute=600, burst=2)
+    start = time.monotonic()
+    for i in range(6):
+        llm.generate_content(f"section {i}")
+    # Two from the burst, then one every 0.1 s
+    assert 0.35 <= time.monotonic() - start < 1.0
+
+
+def test_at_most_max_concurrent_requests_run():
+    model = _GatedModel(latency=0.05)
+    llm = scheduler.LLMScheduler(model, requests_per_minute=None, max_concurrent=3)
+    threads = [threading.Thread(target=llm.generate_content, args=(f"section {i}",)) for i in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert model.calls == 10
+    assert model.peak == 3
+
+
+def test_users_are_served_round_robin_and_told_their_place():
+    model = _GatedModel(latency=0.05)
+    llm = scheduler.LLMScheduler(model, requests_per_minute=None, max_concurrent=1)
+    holder = threading.Thread(target=llm.generate_content, args=("hold",), kwargs={"user": "z"})
+    holder.start()
+    assert model.holding.wait(5)
+
+    positions = {}
+    threads = []
+    for user, prompt in (("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1"), ("b", "b2")):
+        reports = positions[prompt] = []
+        thread = threading.Thread(target=llm.for_user(user, on_wait=reports.append).generate_content,
+                                  args=(prompt,))
+        thread.start()
+        threads.append(thread)
+        _wait_for(lambda: llm.queue_length() == len(threads))
+    model.gate.set()
+    for thread in [holder] + threads:
+        thread.join()
+
+    assert model.order == ["hold", "a1", "b1", "a2", "b2", "a3"]
+    # b2 queued last, behind a1, b1 and a2
+    assert positions["b2"] == [4, 3, 2, 1]
+    assert positions["a1"] == [1]
+    assert all(reports[-1] == 1 for reports in positions.values())
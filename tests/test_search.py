@@ -0,0 +1,80 @@
+import sqlite3
+
+import database
+
+
+def _questions(user_id, text):
+    cards, _ = database.search_flashcards(user_id, text)
+    return sorted(card["question"] for card in cards)
+
+
+def test_search_only_reads_the_users_cards(db, user_id):
+    db.register_user("bob", "pw")
+    bob = db.get_user_id("bob")
+    db.save_flashcards(user_id, [{"question": "What do mitochondria make?", "answer": "ATP"},
+                                 {"question": "Where is chlorophyll?", "answer": "In chloroplasts"}],
+                       on_duplicate=None)
+    db.save_flashcards(bob, [{"question": "What do mitochondria contain?", "answer": "Their own DNA"}],
+                       on_duplicate=None)
+
+    assert _questions(user_id, "mitochondria") == ["What do mitochondria make?"]
+    assert _questions(bob, "mitochondria") == ["What do mitochondria contain?"]
+    # The last word matches as a prefix, stemmed like the index
+    assert _questions(user_id, "chloro") == ["Where is chlorophyll?"]
+    assert _questions(user_id, "makes mito") == ["What do mitochondria make?"]
+    assert _questions(bob, "chlorophyll") == []
+    assert _questions(user_id, "  ") == []
+
+
+def test_index_follows_edits_moves_and_deletes(db, user_id):
+    db.register_user("bob", "pw")
+    bob = db.get_user_id("bob")
+    ids, _ = db.save_flashcards(user_id, [{"question": "Krebs cycle input?", "answer": "Acetyl-CoA"},
+                                          {"question": "Glycolysis output?", "answer": "Pyruvate"}],
+                                on_duplicate=None)
+    with db.get_connection() as conn, conn:
+        conn.execute("UPDATE flashcards SET question = 'Citric acid cycle input?' WHERE id = ?", (ids[0],))
+        conn.execute("UPDATE flashcards SET user_id = ? WHERE id = ?", (bob, ids[1]))
+    assert _questions(user_id, "krebs") == []
+    assert _questions(user_id, "citric") == ["Citric acid cycle input?"]
+    assert _questions(user_id, "pyruvate") == []
+    assert _questions(bob, "pyruvate") == ["Glycolysis output?"]
+
+    with db.get_connection() as conn, conn:
+        conn.execute("DELETE FROM flashcards WHERE id = ?", (ids[0],))
+        conn.execute("INSERT INTO flashcards_fts (flashcards_fts) VALUES ('integrity-check')")
+    assert _questions(user_id, "citric") == []
+
+
+def test_migration_indexes_existing_cards(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    database._add_functions(conn)
+    database.MIGRATIONS, migrations = database.MIGRATIONS[:12], database.MIGRATIONS
+    try:
+        database.migrate(conn)
+    finally:
+        database.MIGRATIONS = migrations
+    conn.execute("INSERT INTO flashcards (user_id, question, answer) VALUES (1, 'Osmosis moves what?', 'Water')")
+    conn.commit()
+    assert database.migrate(conn) == len(migrations)
+    conn.close()
+
+    database.configure_database(path)
+    try:
+        assert _questions(1, "osmosis") == ["Osmosis moves what?"]
+        assert _questions(2, "osmosis") == []
+    finally:
+        database.configure_database()
+
+
+def test_plain_connections_can_write_cards(db, user_id, tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "flashcards.db"))
+    with conn:
+        conn.execute("INSERT INTO flashcards (user_id, question, answer, next_review) "
+                     "VALUES (?, 'What is diffusion?', 'Spreading out', '2030-01-01')", (user_id,))
+    assert _questions(user_id, "diffusion") == ["What is diffusion?"]
+    with conn:
+        conn.execute("DELETE FROM flashcards")
+    conn.close()
+    assert _questions(user_id, "diffusion") == []
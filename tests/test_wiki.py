@@ -0,0 +1,79 @@
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+import fakes
+import wiki
+
+
+@pytest.fixture
+def backend(db, monkeypatch):
+    fake = fakes.FakeWikipedia({"Photosynthesis": "Plants turn light into sugar.",
+                                "Mitochondria": "The powerhouse of the cell."},
+                               ambiguous={"Mercury"}, latency=0)
+    monkeypatch.setattr(wiki, "backend", fake)
+    monkeypatch.setattr(wiki, "_memory", OrderedDict())
+    return fake
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(wiki, "time", SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def test_hits_are_cached(backend):
+    assert wiki.fetch_wikipedia("Photosynthesis") == "Plants turn light into sugar."
+    assert wiki.fetch_wikipedia(" Photosynthesis ") == "Plants turn light into sugar."
+    assert backend.calls == 1
+
+
+@pytest.mark.parametrize("topic", ["Mercury", "No such article"])
+def test_misses_are_cached(backend, topic):
+    assert wiki.fetch_wikipedia(topic) == ""
+    assert wiki.fetch_wikipedia(topic) == ""
+    assert backend.calls == 1
+
+
+def test_misses_expire_before_hits(backend, clock):
+    wiki.fetch_wikipedia("Photosynthesis")
+    wiki.fetch_wikipedia("Mercury")
+    clock[0] += wiki.WIKI_NEGATIVE_TTL + 1
+    wiki.fetch_wikipedia("Photosynthesis")
+    wiki.fetch_wikipedia("Mercury")
+    assert backend.calls == 3
+    clock[0] += wiki.WIKI_CACHE_TTL
+    wiki.fetch_wikipedia("Photosynthesis")
+    assert backend.calls == 4
+
+
+def test_memory_eviction_falls_back_to_sqlite(backend, monkeypatch):
+    monkeypatch.setattr(wiki, "MEMORY_CACHE_SIZE", 1)
+    wiki.fetch_wikipedia("Photosynthesis")
+    wiki.fetch_wikipedia("Mitochondria")
+    assert list(wiki._memory) == ["Mitochondria"]
+    assert wiki.fetch_wikipedia("Photosynthesis") == "Plants turn light into sugar."
+    assert backend.calls == 2
+
+
+def test_evicted_from_both_levels_is_fetched_again(backend, monkeypatch, db):
+    monkeypatch.setattr(wiki, "MEMORY_CACHE_SIZE", 1)
+    wiki.fetch_wikipedia("Photosynthesis")
+    with db.get_connection() as conn:
+        size = conn.execute("SELECT size FROM wiki_cache").fetchone()[0]
+    # Room for one stored article
+    monkeypatch.setattr(wiki, "WIKI_CACHE_MAX_BYTES", size * 3 // 2)
+    wiki.fetch_wikipedia("Mitochondria")
+    wiki.fetch_wikipedia("Photosynthesis")
+    assert backend.calls == 3
+
+
+def test_concurrent_prefetches_share_one_lookup(backend):
+    backend.latency = 0.2
+    futures = [wiki.prefetch_wikipedia("Mitochondria") for _ in range(5)]
+    assert all(future is futures[0] for future in futures)
+    assert futures[0].result(timeout=5) == "The powerhouse of the cell."
+    assert wiki.fetch_wikipedia("Mitochondria") == "The powerhouse of the cell."
+    assert backend.calls == 1
@@ -0,0 +1,260 @@
+"""Spans and latency histograms for the generation pipeline and database calls.
+
+Tracing is off unless FLASHCARD_TRACING is set (or enable() is called);
+while off, span() hands back one shared no-op object and traced functions
+go straight to the wrapped call, so instrumented code costs a flag check.
+
+While on, every span adds its duration to a per-(stage, outcome) histogram
+and its input sizes (pages, chars, cards, ...) to per-stage counters, and
+the most recent spans are kept in `recent`. render_metrics() produces the
+Prometheus text format; metrics are written to FLASHCARD_METRICS_FILE after
+every request and served on 127.0.0.1:FLASHCARD_METRICS_PORT if set.
+
+Setting FLASHCARD_PROFILE_DIR additionally runs each request() under
+cProfile and dumps the stats there, one file per request.
+"""
+import cProfile
+import functools
+import inspect
+import itertools
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds; from in-memory lookups up to whole-document generations
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RECENT_SPANS = 500
+METRICS_FILE = os.environ.get("FLASHCARD_METRICS_FILE") or None
+METRICS_PORT = int(os.environ.get("FLASHCARD_METRICS_PORT") or 0) or None
+PROFILE_DIR = os.environ.get("FLASHCARD_PROFILE_DIR") or None
+
+_enabled = os.environ.get("FLASHCARD_TRACING", "") not in ("", "0")
+_lock = threading.Lock()
+# (stage, outcome) -> [count per bucket..., count above last bucket, total seconds]
+_histograms = {}
+# (stage, unit) -> total
+_sizes = {}
+_local = threading.local()
+_request_ids = itertools.count(1)
+_server = None
+recent = deque(maxlen=RECENT_SPANS)
+
+
+def enable(on=True):
+    global _enabled
+    _enabled = on
+
+
+def enabled():
+    return _enabled
+
+
+class Span:
+    """One timed stage. Use as a context manager; call set() inside it to
+    record sizes known only at the end, or to override the outcome."""
+
+    __slots__ = ("stage", "sizes", "outcome", "request", "start", "duration")
+
+    def __init__(self, stage, sizes):
+        self.stage = stage
+        self.sizes = sizes
+        self.outcome = "ok"
+        self.request = current_request()
+        self.start = None
+        self.duration = None
+
+    def set(self, outcome=None, **sizes):
+        if outcome is not None:
+            self.outcome = outcome
+        self.sizes.update(sizes)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        if exc_type is GeneratorExit:
+            # A streaming consumer stopped early
+            self.outcome = "cancelled"
+        elif exc_type is not None:
+            self.outcome = "error"
+        _record(self)
+        return False
+
+    def __repr__(self):
+        return (f"Span({self.stage!r}, {self.outcome}, {self.duration or 0:.4f}s, "
+                f"request={self.request}, {self.sizes})")
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, outcome=None, **sizes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(stage, **sizes):
+    """Time a block as `stage`, e.g. `with span("parse", chars=len(text)) as s:`."""
+    if not _enabled:
+        return _NOOP
+    return Span(stage, sizes)
+
+
+def traced(stage, count=None):
+    """Decorator form of span() for whole functions. `count` names an argument
+    whose len() is recorded as an input size, e.g. the cards being saved."""
+    def decorate(fn):
+        position = list(inspect.signature(fn).parameters).index(count) if count else None
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            sizes = {}
+            if count is not None:
+                value = kwargs[count] if count in kwargs else args[position] if position < len(args) else None
+                if value is not None:
+                    sizes[count] = len(value)
+            with Span(stage, sizes):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _record(span):
+    with _lock:
+        histogram = _histograms.get((span.stage, span.outcome))
+        if histogram is None:
+            histogram = _histograms[span.stage, span.outcome] = [0] * (len(BUCKETS) + 2)
+        histogram[bisect_left(BUCKETS, span.duration)] += 1
+        histogram[-1] += span.duration
+        for unit, size in span.sizes.items():
+            _sizes[span.stage, unit] = _sizes.get((span.stage, unit), 0) + size
+    recent.append(span)
+
+
+@contextmanager
+def request(name):
+    """Group the spans of one user action (e.g. a Generate click) under a
+    request id, time the whole action, write the metrics file afterwards and,
+    if PROFILE_DIR is set, profile it."""
+    if not _enabled and PROFILE_DIR is None:
+        yield _NOOP
+        return
+    request_id = next(_request_ids)
+    _local.request = request_id
+    profiler = cProfile.Profile() if PROFILE_DIR else None
+    try:
+        if profiler is not None:
+            profiler.enable()
+        with span(f"request.{name}") as whole:
+            yield whole
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}-{int(time.time())}-{request_id}.prof"))
+        _local.request = None
+        if _enabled and METRICS_FILE:
+            write_metrics(METRICS_FILE)
+
+
+def current_request():
+    return getattr(_local, "request", None)
+
+
+@contextmanager
+def attach(request_id):
+    """Count spans on this thread towards `request_id`; for worker threads
+    doing part of a request."""
+    previous = current_request()
+    _local.request = request_id
+    try:
+        yield
+    finally:
+        _local.request = previous
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _sizes.clear()
+    recent.clear()
+
+
+def _labels(**labels):
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+def render_metrics():
+    """All histograms and size counters in the Prometheus text exposition format."""
+    with _lock:
+        histograms = {key: list(value) for key, value in _histograms.items()}
+        sizes = dict(_sizes)
+
+    lines = ["# HELP flashcards_stage_seconds Time spent in each pipeline stage or database call.",
+             "# TYPE flashcards_stage_seconds histogram"]
+    for (stage, outcome), histogram in sorted(histograms.items()):
+        labels = _labels(stage=stage, outcome=outcome)
+        cumulative = 0
+        for bound, count in zip(BUCKETS, histogram):
+            cumulative += count
+            lines.append(f'flashcards_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        total = cumulative + histogram[len(BUCKETS)]
+        lines.append(f'flashcards_stage_seconds_bucket{{{labels},le="+Inf"}} {total}')
+        lines.append(f"flashcards_stage_seconds_sum{{{labels}}} {histogram[-1]:.6f}")
+        lines.append(f"flashcards_stage_seconds_count{{{labels}}} {total}")
+
+    lines += ["# HELP flashcards_stage_input_total Input handled by each stage, by unit.",
+              "# TYPE flashcards_stage_input_total counter"]
+    for (stage, unit), total in sorted(sizes.items()):
+        lines.append(f"flashcards_stage_input_total{{{_labels(stage=stage, unit=unit)}}} {total}")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path):
+    # Replace the file whole so a scraper never reads half of it
+    partial = f"{path}.{threading.get_ident()}.part"
+    with open(partial, "w") as f:
+        f.write(render_metrics())
+    os.replace(partial, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port=METRICS_PORT, host="127.0.0.1"):
+    """Serve render_metrics() over HTTP from a daemon thread. Returns the
+    server, or None if no port is configured. Safe to call more than once."""
+    global _server
+    if port is None:
+        return None
+    with _lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
@@ -0,0 +1,186 @@
+"""Offline fitting of per-user scheduling parameters from the review log.
+
+The model: a card reviewed `elapsed` days after it was last scheduled is
+recalled with probability TARGET_RETENTION ** (elapsed / interval), where
+`interval` is what the parameters being fitted would have scheduled. Good
+parameters give intervals after which the user really does remember about
+TARGET_RETENTION of their cards. Each user's parameters minimise the
+negative log-likelihood of their logged outcomes (anything but "again"
+counts as recalled), plus a pull towards DEFAULT_PARAMS that keeps users
+with few reviews close to the defaults.
+
+Everything is vectorised. A card's intervals depend on its earlier grades,
+so histories are replayed one step at a time. Each step runs scheduling.grade
+on every card of every user that has a review at that step, for a batch of
+candidate parameter sets per user at once. The search is random and local:
+each round samples CANDIDATES sets around every user's best so far, with a
+shrinking step.
+
+    python tuning.py
+    python tuning.py --db flashcards.db --min-reviews 200
+"""
+import argparse
+
+import numpy as np
+
+import database
+from scheduling import AGAIN, DEFAULT_PARAMS, Params, grade
+
+TARGET_RETENTION = 0.9
+MIN_REVIEWS = 100
+CANDIDATES = 6
+ITERATIONS = 10
+STEP = 0.2
+STEP_DECAY = 0.75
+# Weight of the pull towards DEFAULT_PARAMS, in reviews' worth of evidence
+PRIOR_WEIGHT = 20.0
+LOWER = Params(min_ease=1.1, max_ease=2.0, again_penalty=0.0, hard_penalty=0.0, hard_factor=1.0, easy_bonus=0.0)
+UPPER = Params(min_ease=2.0, max_ease=4.0, again_penalty=0.6, hard_penalty=0.3, hard_factor=2.0, easy_bonus=0.5)
+
+_EPSILON = 1e-6
+_LOG_EPSILON = np.log(_EPSILON)
+
+
+class ReviewHistory:
+    """Review log rows regrouped for replay.
+
+    Cards are ordered by number of reviews, longest first, so the cards that
+    still have a review at step k are always a prefix. `steps[k]` holds that
+    prefix length, the grade and elapsed days of each card's k-th review and
+    the positions of the cards forgotten at that review.
+    """
+
+    def __init__(self, user_id, card_id, grades, elapsed, interval, ease):
+        card_id = np.asarray(card_id, dtype=np.int64)
+        # Stable, so each card's reviews stay in log order
+        order = np.argsort(card_id, kind="stable")
+        card_id = card_id[order]
+        user_id = np.asarray(user_id, dtype=np.int64)[order]
+        grades = np.asarray(grades, dtype=np.int64)[order]
+        elapsed = np.asarray(elapsed, dtype=np.float64)[order]
+
+        starts = np.flatnonzero(np.r_[True, card_id[1:] != card_id[:-1]]) if len(card_id) else np.zeros(0, np.int64)
+        lengths = np.diff(np.r_[starts, len(card_id)])
+        by_length = np.argsort(-lengths, kind="stable")
+        starts, lengths = starts[by_length], lengths[by_length]
+
+        self.users, card_user = np.unique(user_id[starts], return_inverse=True)
+        self.card_user = card_user.reshape(-1)
+        self.reviews = np.bincount(self.card_user, weights=lengths, minlength=len(self.users)).astype(np.int64)
+        # Replays start from the state logged before each card's first review
+        self.interval = np.asarray(interval, dtype=np.float64)[order][starts]
+        self.ease = np.asarray(ease, dtype=np.float64)[order][starts]
+        self.steps = []
+        for k in range(int(lengths[0]) if len(lengths) else 0):
+            active = int(np.searchsorted(-lengths, -k, side="left"))
+            rows = starts[:active] + k
+            self.steps.append((active, grades[rows], elapsed[rows], np.flatnonzero(grades[rows] == AGAIN)))
+        # Cards grouped by user, for summing card losses per user
+        self._by_user = np.argsort(self.card_user, kind="stable")
+        self._user_starts = np.searchsorted(self.card_user[self._by_user], np.arange(len(self.users)))
+
+    def __len__(self):
+        return int(self.reviews.sum())
+
+    def loss(self, candidates):
+        """Negative log-likelihood of every user's reviews under each of their
+        candidate parameter sets; `candidates` is (users, n, len(Params)),
+        the result (users, n)."""
+        per_card = candidates[self.card_user]
+        params = Params(*np.moveaxis(per_card, -1, 0))
+        n = candidates.shape[1]
+        interval = np.repeat(self.interval[:, None], n, axis=1)
+        ease = np.repeat(self.ease[:, None], n, axis=1)
+        card_loss = np.zeros_like(interval)
+        for active, grades, elapsed, forgotten in self.steps:
+            # log P(recall); a recalled card costs -log_recall, a forgotten one
+            # -log(1 - recall), computed for the few forgotten rows only
+            log_recall = np.log(TARGET_RETENTION) * elapsed[:, None] / interval[:active]
+            card_loss[:active] -= np.maximum(log_recall, _LOG_EPSILON)
+            if len(forgotten):
+                missed = log_recall[forgotten]
+                card_loss[forgotten] += np.maximum(missed, _LOG_EPSILON) - np.log(np.maximum(-np.expm1(missed), _EPSILON))
+            step_params = Params(*(field[:active] for field in params))
+            interval[:active], ease[:active] = grade(interval[:active], ease[:active], grades[:, None], step_params)
+        return np.add.reduceat(card_loss[self._by_user], self._user_starts, axis=0)
+
+
+def _prior(candidates):
+    scale = np.subtract(UPPER, LOWER)
+    return PRIOR_WEIGHT * (((candidates - np.asarray(DEFAULT_PARAMS)) / scale) ** 2).sum(axis=-1)
+
+
+def _clip(candidates):
+    candidates = np.clip(candidates, LOWER, UPPER)
+    # Keep min_ease <= max_ease
+    candidates[..., 0] = np.minimum(candidates[..., 0], candidates[..., 1])
+    return candidates
+
+
+def fit(history, candidates=CANDIDATES, iterations=ITERATIONS, step=STEP, seed=0):
+    """Fit one Params per user of `history`. Returns `(params, loss)`: a
+    (users, len(Params)) array in the order of `history.users` and each
+    user's final negative log-likelihood per review."""
+    rng = np.random.default_rng(seed)
+    users = len(history.users)
+    if not users:
+        return np.zeros((0, len(Params._fields))), np.zeros(0)
+    scale = np.subtract(UPPER, LOWER) * step
+    best = np.tile(np.asarray(DEFAULT_PARAMS, dtype=np.float64), (users, 1))
+    best_loss = history.loss(best[:, None, :])[:, 0]
+    for _ in range(iterations):
+        trial = best[:, None, :] + rng.normal(size=(users, candidates, len(Params._fields))) * scale
+        # The current best stays in the running, so a round never makes things worse
+        trial[:, 0] = best
+        trial = _clip(trial)
+        loss = history.loss(trial) + _prior(trial)
+        pick = loss.argmin(axis=1)
+        best = trial[np.arange(users), pick]
+        best_loss = loss[np.arange(users), pick]
+        scale = scale * STEP_DECAY
+    return best, best_loss / np.maximum(history.reviews, 1)
+
+
+def load_history(conn, min_reviews=MIN_REVIEWS):
+    """The review log of every user with at least `min_reviews` reviews."""
+    rows = conn.execute("""
+        SELECT user_id, card_id, grade, elapsed, interval, ease FROM review_log
+        WHERE user_id IN (SELECT user_id FROM review_log GROUP BY user_id HAVING count(*) >= ?)
+        ORDER BY id
+    """, (min_reviews,)).fetchall()
+    # One conversion of the whole result, then a column per field
+    table = np.array(rows, dtype=np.float64).reshape(len(rows), 6)
+    return ReviewHistory(*table.T)
+
+
+def fit_all(min_reviews=MIN_REVIEWS, **options):
+    """Fit every user with enough reviews and save the results. Returns
+    `{user_id: (params, reviews)}`."""
+    with database.get_connection() as conn:
+        history = load_history(conn, min_reviews)
+    params, _ = fit(history, **options)
+    fits = {int(user_id): (Params(*row), int(reviews))
+            for user_id, row, reviews in zip(history.users, params.tolist(), history.reviews)}
+    if fits:
+        database.save_user_params(fits)
+    return fits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit per-user scheduling parameters from the review log.")
+    parser.add_argument("--db", default=database.DB_PATH, help="database file")
+    parser.add_argument("--min-reviews", type=int, default=MIN_REVIEWS,
+                        help="users with fewer reviews keep the default parameters")
+    parser.add_argument("--iterations", type=int, default=ITERATIONS)
+    args = parser.parse_args()
+
+    database.configure_database(args.db)
+    database.initialize_db()
+    fits = fit_all(args.min_reviews, iterations=args.iterations)
+    for user_id, (params, reviews) in sorted(fits.items()):
+        print(user_id, reviews, " ".join(f"{name}={value:.3f}" for name, value in params._asdict().items()))
+    print(f"fitted {len(fits)} user(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Wikipedia lookups with a two-level (memory + SQLite) cache and background prefetch."""
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import cache_get, cache_put
+from tracing import span
+
+WIKI_CACHE_TTL = 7 * 24 * 3600
+# Misses are re-checked sooner in case the article gets created
+WIKI_NEGATIVE_TTL = 24 * 3600
+WIKI_CACHE_MAX_BYTES = 64 * 1024 * 1024
+MEMORY_CACHE_SIZE = 256
+PREFETCH_WORKERS = 4
+BLOCKED_TITLE_WORDS = ["porn", "sex", "xxx", "fucking"]
+
+# The wikipedia module, imported on first use; replace with a stub offline
+backend = None
+
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+_in_flight = {}
+_prefetch_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="wiki-prefetch")
+
+
+def _backend():
+    global backend
+    if backend is None:
+        import wikipedia
+        backend = wikipedia
+    return backend
+
+
+def _fetch(topic):
+    """Return `(content, found)` straight from Wikipedia."""
+    wikipedia = _backend()
+    try:
+        page = wikipedia.page(topic, auto_suggest=False)
+        if any(bad in page.title.lower() for bad in BLOCKED_TITLE_WORDS):
+            raise ValueError("Inappropriate topic")
+        return page.content, True
+    except (wikipedia.DisambiguationError, wikipedia.PageError, ValueError):
+        return "", False
+
+
+def _remember(topic, entry):
+    with _memory_lock:
+        _memory[topic] = entry
+        _memory.move_to_end(topic)
+        while len(_memory) > MEMORY_CACHE_SIZE:
+            _memory.popitem(last=False)
+
+
+def _lookup(topic):
+    now = time.time()
+    with _memory_lock:
+        entry = _memory.get(topic)
+        if entry is not None and entry["expires"] > now:
+            _memory.move_to_end(topic)
+            return entry["content"]
+    stored = cache_get("wiki_cache", topic)
+    if stored is not None:
+        entry = json.loads(stored)
+        if entry["expires"] > now:
+            _remember(topic, entry)
+            return entry["content"]
+    return None
+
+
+def fetch_wikipedia(topic):
+    """Article text for `topic`, or "" when there is no usable article."""
+    topic = topic.strip()
+    with span("wikipedia") as s:
+        content = _lookup(topic)
+        if content is not None:
+            s.set(outcome="cached", chars=len(content))
+            return content
+
+        content, found = _fetch(topic)
+        entry = {"content": content,
+                 "expires": time.time() + (WIKI_CACHE_TTL if found else WIKI_NEGATIVE_TTL)}
+        _remember(topic, entry)
+        cache_put("wiki_cache", topic, json.dumps(entry).encode(), WIKI_CACHE_MAX_BYTES)
+        s.set(outcome="ok" if found else "not_found", chars=len(content))
+    return content
+
+
+def prefetch_wikipedia(topic):
+    """Start fetch_wikipedia(topic) in the background and return its Future.
+
+    Concurrent prefetches of the same topic share one lookup.
+    """
+    topic = topic.strip()
+    with _memory_lock:
+        future = _in_flight.get(topic)
+        if future is None:
+            future = _prefetch_pool.submit(fetch_wikipedia, topic)
+            _in_flight[topic] = future
+            future.add_done_callback(lambda _, topic=topic: _forget_in_flight(topic))
+    return future
+
+
+def _forget_in_flight(topic):
+    with _memory_lock:
+        _in_flight.pop(topic, None)